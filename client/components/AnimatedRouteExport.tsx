@@ -342,7 +342,7 @@ export default function AnimatedRouteExport({ isOpen, onClose, startYear, endYea
 
         Promise.all([
             API.get('/flights', params),
-            API.get('/geography/world'),
+            API.get('/geography/world', { resolution: 'medium' }),
         ]).then(([flightData, geoData]: [Flight[], any]) => {
             setFlights(prepareFlights(flightData));
             setWorldGeo(geoData);
@@ -26,7 +26,7 @@ export function ShortStats() {
     const metricUnits = ConfigStorage.getSetting("metricUnits");
 
     useEffect(() => {
-        API.get(`/statistics?metric=${metricUnits}`)
+        API.get(`/statistics?metric=${metricUnits}&sections=totals`)
         .then((data: Statistics) => {
             setStatistics(data);
         });
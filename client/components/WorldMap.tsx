@@ -8,11 +8,23 @@ import type { PickingInfo } from '@deck.gl/core';
 
 import API from '../api';
 import ConfigStorage from '../storage/configStorage';
-import { Coord, Trajectory } from '../models';
+import { ClusteredDecorations, Coord, Trajectory } from '../models';
 import MapLegend from './MapLegend';
 
 const DARK_STYLE = 'https://basemaps.cartocdn.com/gl/dark-matter-gl-style/style.json';
 
+// simplified country geometries served below each zoom level, as in
+// RESOLUTIONS of server/internal/world_geometry.py
+const WORLD_RESOLUTIONS: [number, string][] = [[2.5, 'low'], [4.5, 'medium'], [7, 'high']];
+
+function worldResolution(zoom: number): string {
+    return WORLD_RESOLUTIONS.find(([maxZoom]) => zoom < maxZoom)?.[1] ?? 'full';
+}
+
+function clusterLabel(marker: Coord): string {
+    return marker.airports && marker.airports > 1 ? `${marker.airports} airports` : '';
+}
+
 // deck.gl overlay hook for react-map-gl
 function DeckGLOverlay(props: any) {
     const overlay = useControl(() => new MapboxOverlay(props));
@@ -29,7 +41,8 @@ interface TooltipState {
 export default function WorldMap() {
     const [lines, setLines] = useState<Trajectory[]>([]);
     const [markers, setMarkers] = useState<Coord[]>([]);
-    const [worldGeoJSON, setWorldGeoJSON] = useState<any>(null);
+    const [world, setWorld] = useState<any>(null);
+    const [visitedCountries, setVisitedCountries] = useState<string[]>([]);
     const [tooltip, setTooltip] = useState<TooltipState | null>(null);
     const [viewState, setViewState] = useState({
         longitude: 0,
@@ -46,20 +59,41 @@ export default function WorldMap() {
     const showVisitedCountries = ConfigStorage.getSetting('showVisitedCountries');
     const restrictWorldMap = ConfigStorage.getSetting('restrictWorldMap') === 'true';
 
-    useEffect(() => {
-        API.get('/geography/decorations')
-            .then((data: [Trajectory[], Coord[]]) => {
-                setLines(data[0]);
-                setMarkers(data[1]);
+    // markers and routes are clustered on the server for the zoom level
+    // and the visible area, so the map stays light for any history
+    const decorationsRequest = useRef(0);
+    const loadDecorations = useCallback((zoom: number, bounds?: ReturnType<MapRef['getBounds']>) => {
+        const params: any = { zoom: Math.floor(zoom) };
+        if (bounds) {
+            params.west = bounds.getWest();
+            params.south = bounds.getSouth();
+            params.east = bounds.getEast();
+            params.north = bounds.getNorth();
+        }
 
-                if (data[1] && data[1].length > 1 && restrictWorldMap) {
-                    const latitudes = data[1].map(c => c.latitude);
-                    const longitudes = data[1].map(c => c.longitude);
+        const request = ++decorationsRequest.current;
+        return API.get('/geography/decorations/clustered', params)
+            .then((data: ClusteredDecorations) => {
+                // a later request for another view is already on its way
+                if (request !== decorationsRequest.current) return null;
 
-                    const south = Math.min(...latitudes);
-                    const north = Math.max(...latitudes);
-                    const west = Math.min(...longitudes);
-                    const east = Math.max(...longitudes);
+                setLines(data.lines);
+                setMarkers(data.markers);
+                return data;
+            });
+    }, []);
+
+    const onMoveEnd = useCallback(() => {
+        const map = mapRef.current;
+        if (!map) return;
+        loadDecorations(map.getZoom(), map.getBounds());
+    }, [loadDecorations]);
+
+    useEffect(() => {
+        loadDecorations(viewState.zoom)
+            .then((data: ClusteredDecorations | null) => {
+                if (data?.bounds && restrictWorldMap) {
+                    const [west, south, east, north] = data.bounds;
 
                     const lonSpan = east - west;
                     const latSpan = north - south;
@@ -80,16 +114,41 @@ export default function WorldMap() {
                             latitude: centerLat,
                             zoom: computedZoom,
                         }));
+                        loadDecorations(computedZoom);
                     }
                 }
 
                 setDataLoaded(true);
             });
 
-        API.get(`/geography/world?visited=${showVisitedCountries}`)
-            .then((data: any) => setWorldGeoJSON(data));
+        if (showVisitedCountries === 'true') {
+            API.get('/geography/world/visited')
+                .then((data: { countries: string[] }) => setVisitedCountries(data.countries));
+        }
     }, []);
 
+    // the geometry is the same for everyone (and cached by the browser),
+    // each zoom range has its own level of detail
+    const resolution = worldResolution(viewState.zoom);
+    useEffect(() => {
+        API.get('/geography/world', { resolution })
+            .then((data: any) => setWorld(data));
+    }, [resolution]);
+
+    // visited countries are overlaid on it
+    const worldGeoJSON = useMemo(() => {
+        if (!world) return null;
+
+        const countries = new Set(visitedCountries);
+        return {
+            ...world,
+            features: world.features.map((feature: any) => ({
+                ...feature,
+                properties: { ...feature.properties, visited: countries.has(feature.properties?.subunit) },
+            })),
+        };
+    }, [world, visitedCountries]);
+
     const maxFrequency = useMemo(
         () => (lines.length > 0 ? Math.max(...lines.map(l => l.frequency)) : 1),
         [lines]
@@ -139,8 +198,8 @@ export default function WorldMap() {
 
         if (layer?.id === 'flight-arcs') {
             const arc = info.object as Trajectory;
-            const originLabel = arc.first.iata || arc.originIcao || '';
-            const destLabel = arc.second.iata || arc.destIcao || '';
+            const originLabel = arc.first.iata || arc.originIcao || clusterLabel(arc.first);
+            const destLabel = arc.second.iata || arc.destIcao || clusterLabel(arc.second);
             setTooltip({
                 x,
                 y,
@@ -149,13 +208,14 @@ export default function WorldMap() {
                         <div className="font-bold">{originLabel} {'\u2192'} {destLabel}</div>
                         <div className="text-xs mt-1 text-gray-300">
                             {arc.frequency} flight{arc.frequency !== 1 ? 's' : ''}
+                            {arc.routes && arc.routes > 1 ? ` on ${arc.routes} routes` : ''}
                         </div>
                     </div>
                 ),
             });
         } else if (layer?.id === 'airport-markers') {
             const marker = info.object as Coord;
-            const label = marker.iata || marker.icao || '';
+            const label = marker.iata || marker.icao || clusterLabel(marker);
             setTooltip({
                 x,
                 y,
@@ -287,6 +347,7 @@ export default function WorldMap() {
                 ref={mapRef}
                 {...viewState}
                 onMove={evt => setViewState(evt.viewState)}
+                onMoveEnd={onMoveEnd}
                 mapStyle={DARK_STYLE}
                 mapLib={maplibregl}
                 projection={{ type: 'globe' }}
@@ -170,6 +170,7 @@ export class Coord {
     icao?: string;
     iata?: string;
     name?: string;
+    airports?: number; // clustered markers only
 }
 
 export class Trajectory {
@@ -178,4 +179,12 @@ export class Trajectory {
     frequency: number;
     originIcao?: string;
     destIcao?: string;
+    routes?: number; // bundled routes only
+}
+
+export class ClusteredDecorations {
+    lines: Trajectory[];
+    markers: Coord[];
+    omittedLines: number;
+    bounds: [number, number, number, number] | null;
 }
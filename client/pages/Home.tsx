@@ -14,7 +14,7 @@ function MapOverlayStats() {
     const metricUnits = ConfigStorage.getSetting("metricUnits");
 
     useEffect(() => {
-        API.get(`/statistics?metric=${metricUnits}`)
+        API.get(`/statistics?metric=${metricUnits}&sections=totals`)
         .then((data: Statistics) => {
             setStatistics(data);
         });
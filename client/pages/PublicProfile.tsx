@@ -30,7 +30,7 @@ function ProfileMap({ lines, markers }: { lines: Trajectory[]; markers: Coord[]
     const mapRef = useRef<MapRef>(null);
 
     useEffect(() => {
-        API.get('/geography/world?visited=false')
+        API.get('/geography/world', { resolution: 'low' })
         .then((data) => setWorld(data))
         .catch(() => {});
     }, []);
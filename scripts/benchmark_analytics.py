@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Count the SQL queries and time each GET /api/analytics endpoint as the data grows.
+
+Builds a throwaway database and grows one user's flight history to each
+size, with the number of distinct routes, airports and aircraft types
+growing along with it. Every endpoint has to be answered with the same
+number of queries at every size; the script exits with an error if a
+count changes, which is what an N+1 query pattern looks like.
+
+Usage: python3 scripts/benchmark_analytics.py [sizes...]
+"""
+
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="jetlog-bench-"))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("TOKEN_DURATION", "7")
+os.environ.setdefault("ENABLE_EXTERNAL_APIS", "false")
+
+from sqlalchemy import event, text
+
+from server.auth.utils import get_user
+from server.db.session import SessionLocal, engine, init_db
+from server.internal import reference_data
+from server.routers import analytics
+
+SIZES = [int(size) for size in sys.argv[1:]] or [100, 1000, 10000]
+ENDPOINTS = {
+    "routes": analytics.get_route_analytics,
+    "airports": analytics.get_airport_analytics,
+    "aircraft": analytics.get_aircraft_analytics,
+    "tail-numbers": analytics.get_tail_number_analytics,
+    "heatmap": analytics.get_heatmap,
+    # answered from the in-memory cube once it has been built
+    "query": lambda user, db: analytics.query_analytics(
+        analytics.AnalyticsQuery(dimensions=["airline", "month"], measures=["count", "sum:distance"]),
+        user=user, db=db),
+}
+
+queries = 0
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    global queries
+    queries += 1
+
+
+def add_flights(count: int, airports: list[str], airlines: list[str]):
+    rows = []
+    for _ in range(count):
+        origin, destination = random.sample(airports, 2)
+        date = datetime.date(random.randint(2000, 2025), random.randint(1, 12), random.randint(1, 28))
+        rows.append({
+            "date": date.isoformat(),
+            "date_day": date.toordinal(),
+            "origin": origin,
+            "destination": destination,
+            "duration": random.randint(45, 900),
+            "distance": random.randint(300, 15000),
+            "airplane": f"T{random.randint(1, count // 10 + 1)}",
+            "airline": random.choice(airlines),
+            "tail_number": random.choice([None, f"N{random.randint(1, count)}"]),
+        })
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO flights (username, date, date_day, origin, destination, duration, distance,
+                                 airplane, airline, tail_number)
+            VALUES ('admin', :date, :date_day, :origin, :destination, :duration, :distance,
+                    :airplane, :airline, :tail_number)
+        """), rows)
+
+
+def measure(endpoint, user) -> tuple[int, float]:
+    global queries
+    with SessionLocal() as db:
+        queries = 0
+        begin = time.perf_counter()
+        asyncio.run(endpoint(user=user, db=db))
+        return queries, (time.perf_counter() - begin) * 1000
+
+
+def main():
+    init_db()
+    random.seed(42)
+    user = get_user("admin")
+    airports = list(reference_data.airport_rows())
+    airlines = list(reference_data.airline_rows())
+
+    print(f"{'flights':>8} " + " ".join(f"{name:>22}" for name in ENDPOINTS))
+
+    counts: dict[str, set[int]] = {name: set() for name in ENDPOINTS}
+    total = 0
+    for size in sorted(SIZES):
+        add_flights(size - total, airports[:size // 2 + 2], airlines[:size // 20 + 1])
+        total = size
+
+        cells = []
+        for name, endpoint in ENDPOINTS.items():
+            measure(endpoint, user)  # rebuilds the rollups and the cube once
+            count, ms = measure(endpoint, user)
+            counts[name].add(count)
+            cells.append(f"{count:>4} queries {ms:7.1f} ms")
+        print(f"{size:>8} " + " ".join(f"{cell:>22}" for cell in cells))
+
+    growing = [name for name, seen in counts.items() if len(seen) > 1]
+    if growing:
+        sys.exit(f"Query count grows with the data for: {', '.join(growing)}")
+
+
+if __name__ == "__main__":
+    main()
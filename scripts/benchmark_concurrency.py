@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Latency percentiles of the API under mixed concurrent load.
+
+Builds a throwaway database with one user's flight history and serves the
+app in-process on a single event loop, like uvicorn does with one worker.
+Clients then keep requests going against a mix of endpoints (statistics
+over varying ranges so the cache doesn't answer them, flight lists, the
+analytics, the map decorations and the search), while another polls
+/api/health. Prints p50/p99/max per endpoint, once with the endpoints on
+the asyncio sessions (get_async_db) and once with them overridden to the
+blocking sessions they used before (get_db), which is how one slow request
+holds up all the others.
+
+Usage: python3 scripts/benchmark_concurrency.py [flights] [seconds] [clients]
+"""
+
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="jetlog-bench-"))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("TOKEN_DURATION", "7")
+os.environ.setdefault("ENABLE_EXTERNAL_APIS", "false")
+
+import httpx
+from sqlalchemy import text
+
+from server.db.session import engine, get_async_db, get_db, init_db
+from server.internal import reference_data
+from server.main import app
+
+FLIGHTS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+SECONDS = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+CLIENTS = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+HEALTH_INTERVAL = 0.05  # seconds
+
+
+def statistics_path() -> str:
+    # a different range every time, so every request is computed
+    start = datetime.date(2000, 1, 1) + datetime.timedelta(days=random.randint(0, 3000))
+    end = start + datetime.timedelta(days=random.randint(400, 6000))
+    return f"/api/statistics?start={start}&end={end}"
+
+
+ENDPOINTS = {
+    "statistics": statistics_path,
+    "flights": lambda: f"/api/flights?limit=50&offset={random.randint(0, 500)}",
+    "analytics": lambda: random.choice(["/api/analytics/routes", "/api/analytics/airports",
+                                        "/api/analytics/aircraft", "/api/analytics/tail-numbers"]),
+    "decorations": lambda: "/api/geography/decorations",
+    "search": lambda: f"/api/search?q={random.choice(['k', 'e', 'lon', 'air', 'new'])}",
+}
+
+
+def add_flights(count: int):
+    airports = list(reference_data.airport_rows())[:400]
+    airlines = list(reference_data.airline_rows())[:60]
+    rows = []
+    for _ in range(count):
+        origin, destination = random.sample(airports, 2)
+        date = datetime.date(random.randint(2000, 2025), random.randint(1, 12), random.randint(1, 28))
+        rows.append({
+            "date": date.isoformat(),
+            "date_day": date.toordinal(),
+            "origin": origin,
+            "destination": destination,
+            "duration": random.randint(45, 900),
+            "distance": random.randint(300, 15000),
+            "airplane": f"T{random.randint(1, 200)}",
+            "airline": random.choice(airlines),
+            "tail_number": random.choice([None, f"N{random.randint(1, 5000)}"]),
+        })
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO flights (username, date, date_day, origin, destination, duration, distance,
+                                 airplane, airline, tail_number)
+            VALUES ('admin', :date, :date_day, :origin, :destination, :duration, :distance,
+                    :airplane, :airline, :tail_number)
+        """), rows)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+async def run(label: str) -> None:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        token = (await client.post("/api/auth/token", data={"username": "admin", "password": "admin"})).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+
+        # the rollups, the caches and the indexes are built by the first requests
+        for path in ENDPOINTS.values():
+            (await client.get(path(), headers=headers)).raise_for_status()
+
+        latencies: dict[str, list[float]] = {name: [] for name in [*ENDPOINTS, "health"]}
+        deadline = time.perf_counter() + SECONDS
+
+        async def request(name: str, path: str, intended: float | None = None) -> None:
+            # health checks are timed from when they were due, so the time
+            # spent waiting for the event loop counts
+            begin = intended if intended is not None else time.perf_counter()
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+            latencies[name].append((time.perf_counter() - begin) * 1000)
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                name = random.choice(list(ENDPOINTS))
+                await request(name, ENDPOINTS[name]())
+
+        async def health() -> None:
+            due = time.perf_counter()
+            while due < deadline:
+                await asyncio.sleep(max(due - time.perf_counter(), 0))
+                await request("health", "/api/health", due)
+                due = max(due + HEALTH_INTERVAL, time.perf_counter())
+
+        await asyncio.gather(*(worker() for _ in range(CLIENTS)), health())
+
+    print(f"\n{label}")
+    print(f"{'endpoint':>12} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, values in latencies.items():
+        print(f"{name:>12} {len(values):>9} {percentile(values, 0.5):>9.1f} "
+              f"{percentile(values, 0.99):>9.1f} {max(values, default=0):>9.1f}")
+
+
+def main():
+    init_db()
+    reference_data.refresh()
+    random.seed(42)
+    add_flights(FLIGHTS)
+    print(f"{FLIGHTS} flights, {CLIENTS} clients, {SECONDS:.0f} s per run")
+
+    asyncio.run(run("asyncio sessions (get_async_db)"))
+
+    app.dependency_overrides[get_async_db] = get_db
+    asyncio.run(run("blocking sessions (get_db)"))
+
+
+if __name__ == "__main__":
+    main()
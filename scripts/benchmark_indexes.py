@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Show how the managed flights indexes change the query plans of the hot queries.
+
+Builds a throwaway database with synthetic flights for a few users, prints the
+EXPLAIN QUERY PLAN and timing of some representative per-user queries without
+the secondary indexes, then lets init_db's index migration create them and
+prints the same queries again (SCAN flights -> SEARCH flights USING INDEX).
+
+Usage: python3 scripts/benchmark_indexes.py [flights_per_user]
+"""
+
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="jetlog-bench-"))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("TOKEN_DURATION", "7")
+os.environ.setdefault("ENABLE_EXTERNAL_APIS", "false")
+
+from sqlalchemy import text
+
+from server.db.session import engine, init_db, _update_indexes
+
+FLIGHTS_PER_USER = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+PARAMS = {
+    "username": "alice",
+    "start": datetime.date(2020, 1, 1).toordinal(),
+    "end": datetime.date(2021, 1, 1).toordinal(),
+}
+USERS = ["admin", "alice", "bob", "carol"]
+AIRPORTS = ["KJFK", "EGLL", "LFPG", "KLAX", "RJTT", "YSSY", "EDDF", "KSFO", "OMDB", "WSSS"]
+AIRLINES = ["BAW", "DAL", "AFR", "UAL", "JAL", None]
+
+QUERIES = {
+    "flights list": """
+        SELECT f.id FROM flights f
+        WHERE f.username = :username
+        ORDER BY f.date_day DESC LIMIT 50""",
+    "date window": """
+        SELECT COUNT(*) FROM flights f
+        WHERE f.username = :username
+        AND f.date_day >= :start AND f.date_day < :end""",
+    "flights from airport": """
+        SELECT COUNT(*) FROM flights f
+        WHERE f.username = :username AND f.origin = 'EGLL'""",
+    "connections": """
+        SELECT COUNT(*) FROM flights f
+        WHERE NOT EXISTS (SELECT 1 FROM flights prev WHERE prev.connection = f.id)
+        AND f.username = :username""",
+    "callsign lookup": """
+        SELECT COUNT(*) FROM flights f
+        WHERE f.username = :username AND f.flight_number = 'BA117'""",
+}
+
+
+def populate():
+    random.seed(42)
+    rows = []
+    for username in USERS:
+        for _ in range(FLIGHTS_PER_USER):
+            origin, destination = random.sample(AIRPORTS, 2)
+            date = datetime.date(random.randint(2010, 2025), random.randint(1, 12), random.randint(1, 28))
+            rows.append({
+                "username": username,
+                "date": date.isoformat(),
+                "date_day": date.toordinal(),
+                "origin": origin,
+                "destination": destination,
+                "airline": random.choice(AIRLINES),
+                "flight_number": f"BA{random.randint(1, 999)}",
+                "distance": random.randint(300, 12000),
+            })
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO flights (username, date, date_day, origin, destination, airline, flight_number, distance)
+            VALUES (:username, :date, :date_day, :origin, :destination, :airline, :flight_number, :distance)
+        """), rows)
+
+
+def drop_indexes():
+    with engine.begin() as conn:
+        names = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'"
+        )).fetchall()
+        for (name,) in names:
+            conn.execute(text(f"DROP INDEX {name}"))
+        conn.execute(text("DROP TABLE IF EXISTS sqlite_stat1"))
+
+
+def report(title: str):
+    print(f"\n=== {title} ===")
+    with engine.connect() as conn:
+        for name, query in QUERIES.items():
+            plan = conn.execute(text("EXPLAIN QUERY PLAN " + query), PARAMS).fetchall()
+            details = "; ".join(row[3] for row in plan)
+
+            begin = time.perf_counter()
+            for _ in range(20):
+                conn.execute(text(query), PARAMS).fetchall()
+            elapsed_ms = (time.perf_counter() - begin) / 20 * 1000
+
+            print(f"{name:<22} {elapsed_ms:8.2f} ms   {details}")
+
+
+def main():
+    init_db()
+    print(f"Populating {FLIGHTS_PER_USER * len(USERS)} flights...")
+    populate()
+
+    drop_indexes()
+    report("without secondary indexes")
+
+    _update_indexes()
+    report("with managed indexes")
+
+
+if __name__ == "__main__":
+    main()
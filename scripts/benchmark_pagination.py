@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Compare OFFSET and cursor (keyset) pagination of the flights list at increasing depths.
+
+Builds a throwaway database with synthetic flights for one user and times
+fetching a page of GET /api/flights at several depths, once by offset and
+once by following the cursors. Offset pages get slower the deeper they are,
+cursor pages stay flat because each one is an index seek.
+
+Usage: python3 scripts/benchmark_pagination.py [flights]
+"""
+
+import asyncio
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="jetlog-bench-"))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("TOKEN_DURATION", "7")
+os.environ.setdefault("ENABLE_EXTERNAL_APIS", "false")
+
+from sqlalchemy import text
+
+from server.db.session import SessionLocal, engine, init_db
+from server.routers.flights import Order, Sort, get_flights
+
+FLIGHTS = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+PAGE_SIZE = 50
+DEPTHS = [0, 100, 500, 1000, 1900]
+AIRPORTS = ["KJFK", "EGLL", "LFPG", "KLAX", "RJTT", "YSSY", "EDDF", "KSFO", "OMDB", "WSSS"]
+
+
+def populate():
+    random.seed(42)
+    rows = []
+    for _ in range(FLIGHTS):
+        origin, destination = random.sample(AIRPORTS, 2)
+        date = datetime.date(random.randint(1990, 2025), random.randint(1, 12), random.randint(1, 28))
+        rows.append({
+            "date": date.isoformat(),
+            "date_day": date.toordinal(),
+            "departure_time": f"{random.randint(0, 23):02}:{random.randint(0, 59):02}",
+            "origin": origin,
+            "destination": destination,
+            "distance": random.choice([None, random.randint(300, 12000)]),
+        })
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO flights (username, date, date_day, departure_time, origin, destination, distance)
+            VALUES ('admin', :date, :date_day, :departure_time, :origin, :destination, :distance)
+        """), rows)
+        conn.execute(text("ANALYZE"))
+
+
+def timed(coroutine) -> tuple[object, float]:
+    begin = time.perf_counter()
+    result = asyncio.run(coroutine)
+    return result, (time.perf_counter() - begin) * 1000
+
+
+def main():
+    init_db()
+    print(f"Populating {FLIGHTS} flights...")
+    populate()
+
+    for sort in [Sort.DATE, Sort.DISTANCE]:
+        print(f"\n=== sort by {sort.value}, {PAGE_SIZE} flights per page ===")
+        print(f"{'page':>6} {'offset':>10} {'cursor':>10}")
+
+        with SessionLocal() as db:
+            # walk the cursors once and remember the one for each depth
+            cursors = {}
+            cursor = ""
+            for page in range(max(DEPTHS) + 1):
+                if page in DEPTHS:
+                    cursors[page] = cursor
+                result = asyncio.run(get_flights(limit=PAGE_SIZE, sort=sort, order=Order.DESCENDING,
+                                                 username="admin", cursor=cursor, db=db))
+                cursor = result.next_cursor
+                if cursor is None:
+                    break
+
+            for page, cursor in cursors.items():
+                by_offset, offset_ms = timed(get_flights(limit=PAGE_SIZE, offset=page * PAGE_SIZE, sort=sort,
+                                                         order=Order.DESCENDING, username="admin", db=db))
+                by_cursor, cursor_ms = timed(get_flights(limit=PAGE_SIZE, sort=sort, order=Order.DESCENDING,
+                                                         username="admin", cursor=cursor, db=db))
+
+                assert [f.id for f in by_offset] == [f.id for f in by_cursor.flights]
+                print(f"{page:>6} {offset_ms:8.2f} ms {cursor_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
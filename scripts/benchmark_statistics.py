@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Time GET /api/statistics for a user with 1k, 10k and 100k flights.
+
+Builds a throwaway database, grows one user's flight history to each size
+and reports the median latency of get_statistics over a few runs, for the
+whole history and for a one year window. The result cache is cleared
+before every run; the first request after the flights were added, which
+rebuilds the monthly rollups, is reported separately.
+
+Usage: python3 scripts/benchmark_statistics.py [sizes...]
+"""
+
+import asyncio
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="jetlog-bench-"))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("TOKEN_DURATION", "7")
+os.environ.setdefault("ENABLE_EXTERNAL_APIS", "false")
+
+from fastapi import Response
+from sqlalchemy import text
+
+from server.auth.utils import get_user
+from server.db.session import SessionLocal, engine, init_db
+from server.internal.stats_cache import statistics_cache
+from server.routers.statistics import get_statistics
+
+SIZES = [int(size) for size in sys.argv[1:]] or [1000, 10000, 100000]
+RUNS = 5
+AIRPORTS = ["KJFK", "EGLL", "LFPG", "KLAX", "RJTT", "YSSY", "EDDF", "KSFO", "OMDB", "WSSS",
+            "SBGR", "FAOR", "NZAA", "CYYZ", "LEMD", "VHHH", "ZBAA", "VIDP", "EHAM", "LIRF"]
+AIRLINES = ["BAW", "DAL", "AFR", "UAL", "JAL", "QFA", "KLM", "UAE", None]
+
+
+def add_flights(count: int):
+    rows = []
+    for _ in range(count):
+        origin, destination = random.sample(AIRPORTS, 2)
+        date = datetime.date(random.randint(1990, 2025), random.randint(1, 12), random.randint(1, 28))
+        rows.append({
+            "date": date.isoformat(),
+            "date_day": date.toordinal(),
+            "origin": origin,
+            "destination": destination,
+            "departure_time": f"{random.randint(0, 23):02}:{random.randint(0, 59):02}",
+            "arrival_time": f"{random.randint(0, 23):02}:{random.randint(0, 59):02}",
+            "seat": random.choice(["window", "aisle", "middle", None]),
+            "ticket_class": random.choice(["economy", "business", "first", None]),
+            "duration": random.randint(45, 900),
+            "distance": random.randint(300, 15000),
+            "airplane": random.choice(["A320", "B738", "B77W", "A388", None]),
+            "airline": random.choice(AIRLINES),
+            "cost": random.choice([None, round(random.uniform(50, 3000), 2)]),
+            "currency": random.choice(["USD", "EUR", "GBP"]),
+            "rating": random.choice([None, 1, 2, 3, 4, 5]),
+        })
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO flights (username, date, date_day, origin, destination, departure_time, arrival_time,
+                                 seat, ticket_class, duration, distance, airplane, airline, cost, currency, rating)
+            VALUES ('admin', :date, :date_day, :origin, :destination, :departure_time, :arrival_time,
+                    :seat, :ticket_class, :duration, :distance, :airplane, :airline, :cost, :currency, :rating)
+        """), rows)
+        # chain some flights into connections
+        conn.execute(text("""
+            UPDATE flights SET connection = id + 1
+            WHERE id % 10 = 0 AND connection IS NULL AND id < (SELECT MAX(id) FROM flights)
+        """))
+        conn.execute(text("ANALYZE"))
+
+
+def timed_ms(user, **filters) -> float:
+    statistics_cache.invalidate_all()
+    with SessionLocal() as db:
+        begin = time.perf_counter()
+        asyncio.run(get_statistics(Response(), user=user, db=db, metric=True, **filters))
+        return (time.perf_counter() - begin) * 1000
+
+
+def median_ms(user, **filters) -> float:
+    timings = []
+    with SessionLocal() as db:
+        for _ in range(RUNS):
+            statistics_cache.invalidate_all()
+            begin = time.perf_counter()
+            asyncio.run(get_statistics(Response(), user=user, db=db, metric=True, **filters))
+            timings.append((time.perf_counter() - begin) * 1000)
+
+    return statistics.median(timings)
+
+
+def main():
+    init_db()
+    random.seed(42)
+    user = get_user("admin")
+
+    print(f"{'flights':>8} {'rebuild':>12} {'all time':>12} {'one year':>12}")
+
+    total = 0
+    for size in sorted(SIZES):
+        add_flights(size - total)
+        total = size
+
+        rebuild = timed_ms(user)
+        all_time = median_ms(user)
+        one_year = median_ms(user, start=datetime.date(2019, 12, 31), end=datetime.date(2021, 1, 1))
+        print(f"{size:>8} {rebuild:9.1f} ms {all_time:9.1f} ms {one_year:9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Write throughput of concurrent row by row jobs.
+
+Builds a throwaway database with one user's flights, then has a number of
+threads each update flights one row at a time, like the enrichment jobs do,
+while the others do the same. Runs once with every thread on a sqlite3
+connection of its own committing after every row, as the jobs used to, and
+once with the statements submitted to the database writer, which group
+commits them. Prints rows per second and how many writes failed on a
+locked database.
+
+Usage: python3 scripts/benchmark_writes.py [threads] [rows per thread]
+"""
+
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+os.environ.setdefault("DATA_PATH", tempfile.mkdtemp(prefix="jetlog-bench-"))
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("TOKEN_DURATION", "7")
+os.environ.setdefault("ENABLE_EXTERNAL_APIS", "false")
+
+from sqlalchemy import text
+
+from server.db import workers
+from server.db.session import DB_PATH, engine, init_db
+from server.internal import reference_data
+
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+ROWS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+UPDATE = "UPDATE flights SET notes = :notes WHERE id = :id;"
+
+
+def add_flights(count: int) -> list[int]:
+    airports = list(reference_data.airport_rows())[:400]
+    rows = []
+    for _ in range(count):
+        origin, destination = random.sample(airports, 2)
+        date = datetime.date(random.randint(2000, 2025), random.randint(1, 12), random.randint(1, 28))
+        rows.append({"date": date.isoformat(), "date_day": date.toordinal(),
+                     "origin": origin, "destination": destination})
+
+    with engine.begin() as conn:
+        conn.execute(text("""
+            INSERT INTO flights (username, date, date_day, origin, destination)
+            VALUES ('admin', :date, :date_day, :origin, :destination)
+        """), rows)
+        return [row[0] for row in conn.execute(text("SELECT id FROM flights;"))]
+
+
+def per_row_commits(ids: list[int], failures: list) -> None:
+    conn = sqlite3.connect(DB_PATH)
+    for i, flight_id in enumerate(ids):
+        try:
+            conn.execute("UPDATE flights SET notes = ? WHERE id = ?;", [f"row {i}", flight_id])
+            conn.commit()
+        except sqlite3.OperationalError:
+            conn.rollback()
+            failures.append(flight_id)
+    conn.close()
+
+
+def through_writer(ids: list[int], failures: list) -> None:
+    for i, flight_id in enumerate(ids):
+        try:
+            workers.writer.execute(UPDATE, {"notes": f"row {i}", "id": flight_id})
+        except Exception:
+            failures.append(flight_id)
+
+
+def run(label: str, job, ids: list[int]) -> None:
+    failures: list[int] = []
+    threads = [threading.Thread(target=job, args=(ids[i::THREADS][:ROWS], failures)) for i in range(THREADS)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    rows = sum(len(ids[i::THREADS][:ROWS]) for i in range(THREADS))
+    print(f"{label:>22} {rows / elapsed:>10.0f} rows/s {len(failures):>8} locked")
+
+
+def main():
+    init_db()
+    reference_data.refresh()
+    random.seed(42)
+    ids = add_flights(THREADS * ROWS)
+    print(f"{THREADS} threads, {ROWS} rows each")
+
+    run("commit per row", per_row_commits, ids)
+    batches = workers.writer.batches
+    run("group commit (writer)", through_writer, ids)
+    print(f"{workers.writer.batches - batches} group commits, "
+          f"{workers.writer.lock_wait_seconds * 1000:.1f} ms waiting for the lock")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""Generate the simplified world geometries served at lower zoom levels.
+
+Writes data/world.<resolution>.geo.json for every resolution in
+server.internal.world_geometry.RESOLUTIONS from data/world.geo.json.
+
+Rings are cut into arcs at the points where countries stop or start
+sharing a border, and every arc is simplified (Douglas-Peucker) and
+rounded once, so neighbouring countries keep meeting exactly. Rings that
+collapse are dropped, but every country keeps at least its largest ring.
+Run it again whenever world.geo.json or the resolutions change.
+
+Usage: python3 scripts/simplify_world.py
+"""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from server.internal.world_geometry import (
+    RESOLUTIONS, SIMPLIFIED_PROPERTIES, WORLD_GEOJSON_PATH, geojson_path
+)
+
+Point = tuple[float, float]
+
+
+def polygons(geometry: dict) -> list[list[list[Point]]]:
+    coordinates = geometry["coordinates"]
+    if geometry["type"] == "Polygon":
+        coordinates = [coordinates]
+    # open rings, without the closing point
+    return [[[tuple(point) for point in ring[:-1]] for ring in polygon] for polygon in coordinates]
+
+
+def find_junctions(rings: list[list[Point]]) -> set[Point]:
+    """Points where the set of rings along a border changes: a point is a
+    junction when its neighbours differ between the rings it is part of."""
+    neighbours: dict[Point, set] = {}
+    for ring in rings:
+        for i, point in enumerate(ring):
+            pair = frozenset((ring[i - 1], ring[(i + 1) % len(ring)]))
+            neighbours.setdefault(point, set()).add(pair)
+
+    return {point for point, pairs in neighbours.items() if len(pairs) > 1}
+
+
+def split_arcs(ring: list[Point], junctions: set[Point]) -> list[list[Point]]:
+    cuts = [i for i, point in enumerate(ring) if point in junctions]
+    if not cuts:
+        return [ring + ring[:1]]
+
+    # start at the first junction, every arc ends where the next one starts
+    ring = ring[cuts[0]:] + ring[:cuts[0]] + [ring[cuts[0]]]
+    cuts = [i - cuts[0] for i in cuts] + [len(ring) - 1]
+    return [ring[start:end + 1] for start, end in zip(cuts, cuts[1:])]
+
+
+def canonical(arc: list[Point]) -> tuple[tuple[Point, ...], bool]:
+    """The arc in a direction (and, when closed, from a starting point) that
+    both rings sharing it agree on, and whether it was reversed."""
+    if arc[0] == arc[-1]:
+        points = arc[:-1]
+        start = points.index(min(points))
+        forward = points[start:] + points[:start]
+        backward = forward[:1] + forward[1:][::-1]
+        if backward < forward:
+            return tuple(backward + backward[:1]), True
+        return tuple(forward + forward[:1]), False
+
+    backward = arc[::-1]
+    if backward < arc:
+        return tuple(backward), True
+    return tuple(arc), False
+
+
+def distance(point: Point, start: Point, end: Point) -> float:
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+    if length == 0:
+        return ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+    t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+    return ((x - x1 - t * dx) ** 2 + (y - y1 - t * dy) ** 2) ** 0.5
+
+
+def douglas_peucker(points: tuple[Point, ...], tolerance: float) -> list[Point]:
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        farthest, index = 0.0, None
+        for i in range(first + 1, last):
+            d = distance(points[i], points[first], points[last])
+            if d > farthest:
+                farthest, index = d, i
+        if index is not None and farthest > tolerance:
+            keep[index] = True
+            stack += [(first, index), (index, last)]
+
+    return [point for point, kept in zip(points, keep) if kept]
+
+
+def round_points(points: list[Point], digits: int) -> list[Point]:
+    rounded = []
+    for x, y in points:
+        point = (round(x, digits), round(y, digits))
+        if not rounded or rounded[-1] != point:
+            rounded.append(point)
+    return rounded
+
+
+def simplify(world: dict, tolerance: float, digits: int) -> dict:
+    shapes = [polygons(feature["geometry"]) for feature in world["features"]]
+    junctions = find_junctions([ring for shape in shapes for polygon in shape for ring in polygon])
+    arcs: dict[tuple, list[Point]] = {}
+
+    def simplify_ring(ring: list[Point]) -> list[Point] | None:
+        points = []
+        for arc in split_arcs(ring, junctions):
+            key, reversed_ = canonical(arc)
+            if key not in arcs:
+                arcs[key] = round_points(douglas_peucker(key, tolerance), digits)
+            # a closed arc may start elsewhere than the ring, which is the same ring
+            simplified = arcs[key][::-1] if reversed_ else arcs[key]
+            points += simplified[1:] if points else simplified
+
+        points = round_points(points, digits)
+        if points[0] != points[-1]:
+            points.append(points[0])
+        # a ring needs at least three distinct points
+        return points if len(points) >= 4 else None
+
+    features = []
+    for feature, shape in zip(world["features"], shapes):
+        simplified = []
+        for polygon in shape:
+            rings = [simplify_ring(ring) for ring in polygon]
+            if rings[0] is not None:
+                simplified.append([rings[0], *(ring for ring in rings[1:] if ring is not None)])
+
+        if not simplified:
+            # too small to survive, keep its largest ring as it is
+            largest = max((polygon[0] for polygon in shape), key=len)
+            ring = round_points(largest, digits + 1)
+            simplified = [[ring + ring[:1]]]
+
+        geometry = ({"type": "Polygon", "coordinates": simplified[0]} if len(simplified) == 1
+                    else {"type": "MultiPolygon", "coordinates": simplified})
+        properties = {name: feature["properties"].get(name) for name in SIMPLIFIED_PROPERTIES}
+        features.append({"type": "Feature", "properties": properties, "geometry": geometry})
+
+    return {"type": "FeatureCollection", "features": features}
+
+
+def count_points(world: dict) -> int:
+    return sum(len(ring) for feature in world["features"]
+               for polygon in polygons(feature["geometry"]) for ring in polygon)
+
+
+def main():
+    world = json.loads(WORLD_GEOJSON_PATH.read_text(encoding="utf-8"))
+    print(f"{'full':>8} {count_points(world):>7} points {WORLD_GEOJSON_PATH.stat().st_size // 1024:>5} KB")
+
+    for name, (_, tolerance, digits) in RESOLUTIONS.items():
+        path = geojson_path(name)
+        simplified = simplify(world, tolerance, digits)
+        path.write_text(json.dumps(simplified, separators=(",", ":"), ensure_ascii=False), encoding="utf-8")
+        print(f"{name:>8} {count_points(simplified):>7} points {path.stat().st_size // 1024:>5} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 from server.models import CustomModel, User
-from server.db.session import get_db
+from server.db.session import get_async_db, get_db
 from server.db.models import User as UserModel, Flight
 from server.auth.utils import hash_password, get_user, get_user_from_api_key, oauth2_scheme
 from server.environment import SECRET_KEY, AUTH_HEADER
+from server.internal.stats_cache import statistics_cache
 
 
 import jwt
-from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 router = APIRouter(
@@ -61,7 +63,7 @@ async def get_user_from_token(token: str = Depends(oauth2_scheme)) -> User:
     return user
 
 @router.get("/public/{username}")
-async def get_public_profile(username: str):
+async def get_public_profile(username: str, db: AsyncSession = Depends(get_async_db)):
     """Public profile - returns basic stats if user has public_profile enabled."""
     user = get_user(username)
     if not user or not user.public_profile:
@@ -69,11 +71,11 @@ async def get_public_profile(username: str):
 
     # Return basic stats
     from server.routers.statistics import get_statistics
-    stats = await get_statistics(metric=True, username=username, user=user)
+    stats = await get_statistics(Response(), metric=True, username=username, user=user, db=db)
 
     # Return decorations for map
     from server.routers.geography import get_decorations
-    deco = await get_decorations(username=username, user=user)
+    deco = await get_decorations(username=username, user=user, db=db)
 
     return {
         "username": user.username,
@@ -180,6 +182,7 @@ async def update_user(username: str, new_user: UserPatch, user: User = Depends(g
             {Flight.username: new_user.username}
         )
         db.commit()
+        statistics_cache.invalidate(username, new_user.username)
 
 @router.delete("/{username}", status_code=200)
 async def delete_user(username: str, user: User = Depends(get_current_user),
@@ -192,3 +195,4 @@ async def delete_user(username: str, user: User = Depends(get_current_user),
     db.query(Flight).filter(Flight.username == username).delete()
     db.query(UserModel).filter(UserModel.username == username).delete()
     db.commit()
+    statistics_cache.invalidate(username)
@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, Text, Float, DateTime, ForeignKey,
-    CheckConstraint, UniqueConstraint, func
+    CheckConstraint, UniqueConstraint, Index, func
 )
 from sqlalchemy.orm import declarative_base, relationship
 
@@ -31,6 +31,14 @@ class Flight(Base):
         CheckConstraint("purpose IN ('leisure', 'business', 'crew', 'other')", name="ck_flights_purpose"),
         CheckConstraint("rating IS NULL OR (rating >= 1 AND rating <= 5)", name="ck_flights_rating"),
         CheckConstraint("connection IS NULL OR connection <> id", name="ck_flights_connection_not_self"),
+        Index("ix_flights_username_date_day", "username", "date_day", "departure_time"),
+        Index("ix_flights_username_distance", "username", "distance"),
+        Index("ix_flights_username_duration", "username", "duration"),
+        Index("ix_flights_username_origin", "username", "origin"),
+        Index("ix_flights_username_destination", "username", "destination"),
+        Index("ix_flights_username_airline", "username", "airline"),
+        Index("ix_flights_username_flight_number", "username", "flight_number"),
+        Index("ix_flights_connection", "connection"),
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -59,6 +67,9 @@ class Flight(Base):
     connection = Column(Integer, ForeignKey("flights.id", ondelete="SET NULL"), nullable=True)
     points = Column(Integer, nullable=True)
     points_program = Column(Text, nullable=True)
+    # day number of `date` (datetime.date.toordinal()), kept in sync on every
+    # write so that date ranges can be filtered through an index
+    date_day = Column(Integer, nullable=True)
 
     connected_flight = relationship("Flight", remote_side=[id], foreign_keys=[connection])
     fr24_sync = relationship("FR24SyncedFlight", back_populates="flight", uselist=False,
@@ -98,6 +109,18 @@ class Airline(Base):
         return f"<Airline(icao='{self.icao}', name='{self.name}')>"
 
 
+class Metadata(Base):
+    """Key/value store for internal bookkeeping, such as the hash of the
+    reference data that is currently loaded."""
+    __tablename__ = "metadata"
+
+    key = Column(Text, primary_key=True)
+    value = Column(Text, nullable=True)
+
+    def __repr__(self):
+        return f"<Metadata(key='{self.key}', value='{self.value}')>"
+
+
 class FR24SyncedFlight(Base):
     __tablename__ = "fr24_synced_flights"
 
@@ -112,6 +135,9 @@ class FR24SyncedFlight(Base):
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("ix_audit_logs_username_timestamp", "username", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     timestamp = Column(DateTime, nullable=False, server_default=func.current_timestamp())
@@ -126,6 +152,9 @@ class AuditLog(Base):
 
 class ApiKey(Base):
     __tablename__ = "api_keys"
+    __table_args__ = (
+        Index("ix_api_keys_key_hash", "key_hash"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(Text, ForeignKey("users.username"), nullable=False)
@@ -141,6 +170,9 @@ class ApiKey(Base):
 
 class FrequentFlyerEntry(Base):
     __tablename__ = "frequent_flyer_entries"
+    __table_args__ = (
+        Index("ix_frequent_flyer_entries_flight_id", "flight_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     flight_id = Column(Integer, ForeignKey("flights.id", ondelete="CASCADE"), nullable=False)
@@ -170,6 +202,9 @@ class CustomFieldDef(Base):
 
 class CustomFieldValue(Base):
     __tablename__ = "custom_field_values"
+    __table_args__ = (
+        Index("ix_custom_field_values_flight_id", "flight_id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     flight_id = Column(Integer, ForeignKey("flights.id", ondelete="CASCADE"), nullable=False)
@@ -202,9 +237,38 @@ class Companion(Base):
 class FlightCompanion(Base):
     """Join table linking a flight to the companions who were on it."""
     __tablename__ = "flight_companions"
+    __table_args__ = (
+        Index("ix_flight_companions_companion_id", "companion_id"),
+    )
 
     flight_id = Column(Integer, ForeignKey("flights.id", ondelete="CASCADE"), primary_key=True)
     companion_id = Column(Integer, ForeignKey("companions.id", ondelete="CASCADE"), primary_key=True)
 
     def __repr__(self):
         return f"<FlightCompanion(flight_id={self.flight_id}, companion_id={self.companion_id})>"
+
+
+class MonthlyRollup(Base):
+    """Statistics summary of one block for one user's flights in one month,
+    see server/internal/rollups.py."""
+    __tablename__ = "monthly_rollups"
+
+    username = Column(Text, primary_key=True)
+    month = Column(Text, primary_key=True)
+    block = Column(Text, primary_key=True)
+    data = Column(Text, nullable=False)
+
+    def __repr__(self):
+        return f"<MonthlyRollup(username='{self.username}', month='{self.month}', block='{self.block}')>"
+
+
+class StaleRollup(Base):
+    """A month whose rollups no longer match the user's flights. Rows are
+    added by triggers on the flights table (see session.ROLLUP_TRIGGERS)."""
+    __tablename__ = "stale_rollups"
+
+    username = Column(Text, primary_key=True)
+    month = Column(Text, primary_key=True)
+
+    def __repr__(self):
+        return f"<StaleRollup(username='{self.username}', month='{self.month}')>"
@@ -1,16 +1,21 @@
 import os
+import time
+import hashlib
 import sqlite3
 from pathlib import Path
 from contextlib import contextmanager
 
 from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session
 
-from server.environment import DATA_PATH
+from server.environment import DATA_PATH, DB_BUSY_TIMEOUT
 from server.db.models import Base, Airport, Airline
+from server.db import workers
 
 DB_PATH = os.path.join(DATA_PATH, "jetlog.db")
 DATABASE_URL = f"sqlite:///{DB_PATH}"
+ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DB_PATH}"
 
 engine = create_engine(
     DATABASE_URL,
@@ -19,15 +24,23 @@ engine = create_engine(
 )
 
 
+# same database through aiosqlite, which runs every connection in a thread
+# of its own, so queries are awaited instead of blocking the event loop
+async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+
+
 @event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
 def _set_sqlite_pragmas(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA journal_mode=WAL")
     cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT}")
     cursor.close()
 
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 
 def get_db():
@@ -39,6 +52,32 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """FastAPI dependency that yields an asyncio SQLAlchemy session and
+    auto-closes it. For the read-heavy endpoints, so that a slow query
+    doesn't hold up every other request."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def fetch_all(db: Session | AsyncSession, statement, params: dict | None = None) -> list:
+    """Rows of a statement, run on either kind of session (endpoints taking
+    an AsyncSession are also called with a Session by other endpoints)."""
+    if isinstance(db, AsyncSession):
+        return (await db.execute(statement, params)).fetchall()
+    return db.execute(statement, params).fetchall()
+
+
+async def run_sync(db: Session | AsyncSession, function, *args, **kwargs):
+    """Call function(session, *args, **kwargs), a helper written against a
+    Session, with either kind of session. Under an AsyncSession it runs on
+    the database read pool with a session of its own, so neither its
+    queries nor the Python crunching their rows hold up the event loop."""
+    if isinstance(db, AsyncSession):
+        return await workers.run_read(function, *args, **kwargs)
+    return function(db, *args, **kwargs)
+
+
 @contextmanager
 def get_db_session():
     """Context manager for non-FastAPI code that needs a session."""
@@ -49,11 +88,40 @@ def get_db_session():
         db.close()
 
 
-def _update_tables():
-    """Reimport airports and airlines from the bundled .db files."""
-    print("Updating airports and airlines tables...")
+REFERENCE_DATA_HASH_KEY = "reference_data_hash"
+
+# columns of the bundled tables, with ICAO codes stored uppercase everywhere
+# so that flights can be joined on plain equality (and the primary key)
+REFERENCE_TABLES = {
+    "airports": ("ap", "UPPER(icao), iata, type, name, municipality, region, "
+                       "country, continent, latitude, longitude, timezone"),
+    "airlines": ("ar", "UPPER(icao), iata, name"),
+}
+
+
+def _hash_files(*paths: Path) -> str:
+    digest = hashlib.sha256()
+
+    for path in paths:
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 16), b""):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _update_tables() -> bool:
+    """Sync airports and airlines with the bundled .db files.
+
+    The bundled files are hashed and the hash is recorded in the metadata
+    table, so the reload is skipped entirely when they haven't changed.
+    Otherwise the tables are diffed against the bundled data in a single
+    transaction: new and changed rows are upserted, removed rows deleted.
+    Returns whether the reference data changed.
+    """
     airports_db_path = Path(__file__).parent.parent.parent / 'data' / 'airports.db'
     airlines_db_path = Path(__file__).parent.parent.parent / 'data' / 'airlines.db'
+    data_hash = _hash_files(airports_db_path, airlines_db_path)
 
     # Use a direct sqlite3 connection to avoid SQLAlchemy transaction conflicts
     # with ATTACH/DETACH commands. isolation_level=None for autocommit mode
@@ -61,17 +129,44 @@ def _update_tables():
     conn = sqlite3.connect(DB_PATH, isolation_level=None)
     try:
         conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("DELETE FROM airports")
-        conn.execute("DELETE FROM airlines")
+
+        row = conn.execute("SELECT value FROM metadata WHERE key = ?;", [REFERENCE_DATA_HASH_KEY]).fetchone()
+        if row and row[0] == data_hash:
+            print("Airports and airlines tables are up to date")
+            return False
+
+        print("Updating airports and airlines tables...")
 
         conn.execute(f"ATTACH DATABASE '{airports_db_path}' AS ap")
         conn.execute(f"ATTACH DATABASE '{airlines_db_path}' AS ar")
 
-        conn.execute("INSERT INTO main.airports SELECT * FROM ap.airports")
-        conn.execute("INSERT INTO main.airlines SELECT * FROM ar.airlines")
-
-        conn.execute("DETACH DATABASE ap")
-        conn.execute("DETACH DATABASE ar")
+        try:
+            conn.execute("BEGIN")
+            changes_before = conn.total_changes
+
+            for table, (schema, columns) in REFERENCE_TABLES.items():
+                conn.execute(f"""
+                    DELETE FROM main.{table}
+                    WHERE icao NOT IN (SELECT UPPER(icao) FROM {schema}.{table});""")
+                conn.execute(f"""
+                    INSERT OR REPLACE INTO main.{table}
+                    SELECT {columns} FROM {schema}.{table}
+                    EXCEPT
+                    SELECT * FROM main.{table};""")
+
+            conn.execute("INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?);",
+                         [REFERENCE_DATA_HASH_KEY, data_hash])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("DETACH DATABASE ap")
+            conn.execute("DETACH DATABASE ar")
+
+        # minus the metadata row
+        print(f"Updated {conn.total_changes - changes_before - 1} airport and airline rows")
+        return True
     finally:
         conn.close()
 
@@ -125,6 +220,144 @@ def _patch_table_if_needed():
             session.commit()
 
 
+def _backfill_date_days():
+    """Fill in flights.date_day for rows written before the column existed
+    (or by anything that changed the date without keeping it in sync)."""
+    with engine.begin() as conn:
+        # julianday('0001-01-01') is 1721425.5, which is day 1 for date.toordinal()
+        res = conn.execute(text("""
+            UPDATE flights
+            SET date_day = CAST(JULIANDAY(date) - 1721424.5 AS INTEGER)
+            WHERE date_day IS NOT CAST(JULIANDAY(date) - 1721424.5 AS INTEGER);
+        """))
+
+        if res.rowcount:
+            print(f"Backfilled the day number of {res.rowcount} flights")
+
+
+def _canonicalize_codes():
+    """Uppercase the airport and airline codes of flights written before
+    codes were canonicalized on write."""
+    with engine.begin() as conn:
+        res = conn.execute(text("""
+            UPDATE flights
+            SET origin = UPPER(origin),
+                destination = UPPER(destination),
+                airline = UPPER(airline)
+            WHERE origin <> UPPER(origin)
+            OR destination <> UPPER(destination)
+            OR airline <> UPPER(airline);
+        """))
+
+        if res.rowcount:
+            print(f"Uppercased the airport/airline codes of {res.rowcount} flights")
+
+
+def _update_indexes():
+    """Bring the secondary indexes in line with the ones declared on the ORM models.
+
+    create_all only creates indexes together with new tables, so databases
+    created by older versions never get them. Indexes named with the 'ix_'
+    prefix are managed here: missing ones are created, ones whose columns no
+    longer match the model are rebuilt and ones the models stopped declaring
+    are dropped.
+    """
+    changed = False
+
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {}
+            for row in conn.execute(text(f"PRAGMA index_list({table.name})")).fetchall():
+                index_name = row[1]
+                if not index_name.startswith("ix_"):
+                    continue
+                info = conn.execute(text(f"PRAGMA index_info({index_name})")).fetchall()
+                existing[index_name] = [col[2] for col in info]
+
+            declared = {index.name: index for index in table.indexes}
+
+            for index_name, columns in existing.items():
+                index = declared.get(index_name)
+                if index is not None and columns == [col.name for col in index.columns]:
+                    continue
+
+                print(f"Dropping outdated index '{index_name}' on table '{table.name}'...")
+                conn.execute(text(f"DROP INDEX {index_name}"))
+                existing[index_name] = None
+                changed = True
+
+            for index_name, index in declared.items():
+                if existing.get(index_name) is not None:
+                    continue
+
+                print(f"Creating index '{index_name}' on table '{table.name}'...")
+                index.create(bind=conn)
+                changed = True
+
+        if changed:
+            # refresh planner statistics so the new indexes are actually picked up
+            conn.execute(text("ANALYZE"))
+
+
+# Mark the months whose statistics rollups a write to flights affects: the
+# flight's own month (before and after), the months of the flights it
+# connects to (whether they have a previous flight) and of the flights
+# connecting to it (their layover ends with this flight). Flights connecting
+# to a deleted flight get their connection nulled, which fires the update.
+# Upserts rather than INSERT OR IGNORE, whose OR clause would be overridden
+# by the conflict policy of the statement firing the trigger.
+ROLLUP_TRIGGERS = {
+    "tr_flights_rollups_insert": """
+        AFTER INSERT ON flights
+        BEGIN
+            INSERT INTO stale_rollups (username, month)
+            VALUES (NEW.username, SUBSTR(NEW.date, 1, 7))
+            ON CONFLICT DO NOTHING;
+            INSERT INTO stale_rollups (username, month)
+            SELECT username, SUBSTR(date, 1, 7) FROM flights
+            WHERE id = NEW.connection OR connection = NEW.id
+            ON CONFLICT DO NOTHING;
+        END""",
+    "tr_flights_rollups_update": """
+        AFTER UPDATE OF username, date, date_day, origin, destination, departure_time, arrival_time,
+                        seat, aircraft_side, ticket_class, duration, distance, airplane, airline,
+                        cost, currency, rating, connection
+        ON flights
+        BEGIN
+            INSERT INTO stale_rollups (username, month)
+            VALUES (OLD.username, SUBSTR(OLD.date, 1, 7)), (NEW.username, SUBSTR(NEW.date, 1, 7))
+            ON CONFLICT DO NOTHING;
+            INSERT INTO stale_rollups (username, month)
+            SELECT username, SUBSTR(date, 1, 7) FROM flights
+            WHERE id = OLD.connection OR id = NEW.connection OR connection = NEW.id
+            ON CONFLICT DO NOTHING;
+        END""",
+    "tr_flights_rollups_delete": """
+        AFTER DELETE ON flights
+        BEGIN
+            INSERT INTO stale_rollups (username, month)
+            VALUES (OLD.username, SUBSTR(OLD.date, 1, 7))
+            ON CONFLICT DO NOTHING;
+            INSERT INTO stale_rollups (username, month)
+            SELECT username, SUBSTR(date, 1, 7) FROM flights
+            WHERE id = OLD.connection
+            ON CONFLICT DO NOTHING;
+        END""",
+}
+
+
+def _update_triggers():
+    """(Re)create the triggers that keep track of stale statistics rollups.
+
+    They are dropped and created again on every start, so that databases
+    always run the definitions of the current version.
+    """
+    with engine.begin() as conn:
+        for name, definition in ROLLUP_TRIGGERS.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(f"CREATE TRIGGER {name} {definition}"))
+
+
 def _create_first_user():
     """Create the default admin:admin user."""
     from server.auth.utils import hash_password
@@ -150,6 +383,7 @@ def _create_first_user():
 def init_db():
     """Initialize the database: create tables, run migrations, import reference data."""
     print("Initializing database connection")
+    start_time = time.perf_counter()
 
     db_exists = os.path.isfile(DB_PATH)
 
@@ -159,12 +393,30 @@ def init_db():
     if db_exists:
         # Patch existing tables for backward compatibility
         _patch_table_if_needed()
+        _backfill_date_days()
+        _canonicalize_codes()
     else:
         print("Database file not found, creating it...")
         _create_first_user()
 
-    # Always update airports and airlines from bundled data
-    _update_tables()
+    _update_indexes()
+    _update_triggers()
+
+    # Full-text search over flights, built now if missing or outdated
+    from server.internal import flight_search
+    flight_search.update_index()
+
+    # Rollups missing for some months (or built by an older version) are
+    # marked stale, they are rebuilt on the next statistics request
+    from server.internal import rollups
+    rollups.mark_missing_stale()
+
+    # Sync airports and airlines with the bundled data (skipped when unchanged)
+    if _update_tables():
+        from server.internal import reference_data
+        reference_data.refresh()
+        # flights are also found by the names of their airports and airline
+        flight_search.rebuild()
 
     # Ensure first user exists (handles migration from pre-user databases)
     if db_exists:
@@ -175,4 +427,4 @@ def init_db():
                 session.close()
                 _create_first_user()
 
-    print("Database initialization complete")
+    print(f"Database initialization complete in {time.perf_counter() - start_time:.2f}s")
@@ -0,0 +1,196 @@
+"""Bounded thread pools for blocking database work.
+
+SQLite serves any number of readers alongside a single writer, so reads run
+on a pool of DB_READ_WORKERS threads and writes on a pool of one thread,
+instead of on the event loop or on Starlette's threadpool shared with
+everything else. Each pool accepts at most DB_QUEUE_LIMIT tasks waiting for
+a thread: past that a task is rejected with 503 and Retry-After right away,
+so a burst of imports queues up to a bound and then fails fast rather than
+making every page wait behind it.
+
+Besides tasks, the writer takes single statements from code that writes
+row by row (the SSE jobs), and commits all those pending when it gets to
+them in one transaction, so such a job costs one commit, and one WAL sync,
+per batch rather than per row. Pending statements count as waiting tasks
+of the writer, so they share its DB_QUEUE_LIMIT and are rejected with 503
+past it like any other task. As every write goes through the one thread,
+writes no longer wait for each other's lock; what's left of lock contention
+(writes from elsewhere, waiting up to DB_BUSY_TIMEOUT) is measured.
+
+Queue depth, waiting and execution times, batches and lock waits and errors
+are kept per pool for /metrics.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from server.environment import DB_QUEUE_LIMIT, DB_READ_WORKERS
+
+RETRY_AFTER = 1  # seconds
+WRITE_BATCH = 256  # statements per group commit
+
+
+def _is_lock_error(error: Exception) -> bool:
+    return isinstance(error, OperationalError) and "database is locked" in str(error.orig)
+
+
+def _busy() -> HTTPException:
+    return HTTPException(status_code=503, headers={"Retry-After": str(RETRY_AFTER)},
+                         detail="The server is busy, try again shortly")
+
+
+class WorkerPool:
+    def __init__(self, name: str, workers: int, queue_limit: int):
+        self.name = name
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"db-{name}")
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self.execution_seconds = 0.0
+        self.lock_errors = 0
+
+    async def run(self, function, *args, **kwargs):
+        """Run function(session, *args, **kwargs) on a thread of the pool,
+        with a session of its own, raising 503 if too many tasks wait."""
+        from server.db.session import SessionLocal
+
+        with self._lock:
+            if self.queued >= self.queue_limit:
+                self.rejected += 1
+                raise _busy()
+            self.queued += 1
+        submitted = time.perf_counter()
+
+        def call():
+            started = time.perf_counter()
+            with self._lock:
+                self.queued -= 1
+                self.running += 1
+                self.wait_seconds += started - submitted
+
+            try:
+                with SessionLocal() as session:
+                    return function(session, *args, **kwargs)
+            except OperationalError as e:
+                # still locked by a write from elsewhere after the busy timeout
+                if not _is_lock_error(e):
+                    raise
+                with self._lock:
+                    self.lock_errors += 1
+                raise _busy()
+            finally:
+                with self._lock:
+                    self.running -= 1
+                    self.completed += 1
+                    self.execution_seconds += time.perf_counter() - started
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+
+class Writer(WorkerPool):
+    def __init__(self, queue_limit: int):
+        # a second writer would only wait for the first one's lock
+        super().__init__("write", 1, queue_limit)
+        # (statement, parameters, future, time submitted)
+        self._pending: list[tuple[str, dict, Future, float]] = []
+
+        self.batches = 0
+        self.batched_statements = 0
+        self.lock_wait_seconds = 0.0
+
+    def submit(self, statement: str, params: dict | None = None) -> Future:
+        """Queue a statement for the next group commit, raising 503 if too
+        many tasks wait. The future resolves to its rows (or row count, if
+        it returns none) once committed."""
+        future = Future()
+        with self._lock:
+            if self.queued >= self.queue_limit:
+                self.rejected += 1
+                raise _busy()
+            self.queued += 1
+            self._pending.append((statement, params or {}, future, time.perf_counter()))
+            first = len(self._pending) == 1
+        if first:
+            self._executor.submit(self._commit_pending)
+        return future
+
+    def execute(self, statement: str, params: dict | None = None):
+        """Run a statement in the next group commit and wait for it; for
+        code running in a thread other than the writer's."""
+        return self.submit(statement, params).result()
+
+    def _commit_pending(self) -> None:
+        from server.db.session import engine
+
+        started = time.perf_counter()
+        with self._lock:
+            batch, self._pending = self._pending[:WRITE_BATCH], self._pending[WRITE_BATCH:]
+            if self._pending:
+                self._executor.submit(self._commit_pending)
+            self.queued -= len(batch)
+            self.running += len(batch)
+            self.wait_seconds += sum(started - submitted for *_, submitted in batch)
+
+        results = []
+        try:
+            with engine.connect() as conn:
+                # take the lock up front, so that the wait for it is measured
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                with self._lock:
+                    self.lock_wait_seconds += time.perf_counter() - started
+
+                for statement, params, future, _ in batch:
+                    try:
+                        result = conn.execute(text(statement), params)
+                        results.append((future, result.fetchall() if result.returns_rows else result.rowcount))
+                    except Exception as e:
+                        # SQLite only undoes the failed statement, the others still commit
+                        future.set_exception(e)
+
+                conn.commit()
+        except Exception as e:
+            with self._lock:
+                self.lock_errors += _is_lock_error(e)
+            for future, _ in results:
+                future.set_exception(e)
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            with self._lock:
+                self.running -= len(batch)
+                self.completed += len(batch)
+                self.execution_seconds += time.perf_counter() - started
+
+        with self._lock:
+            self.batches += 1
+            self.batched_statements += len(batch)
+        for future, value in results:
+            future.set_result(value)
+
+
+readers = WorkerPool("read", DB_READ_WORKERS, DB_QUEUE_LIMIT)
+writer = Writer(DB_QUEUE_LIMIT)
+
+pools = [readers, writer]
+
+
+async def run_read(function, *args, **kwargs):
+    return await readers.run(function, *args, **kwargs)
+
+
+async def run_write(function, *args, **kwargs):
+    return await writer.run(function, *args, **kwargs)
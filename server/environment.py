@@ -27,3 +27,10 @@ ENABLE_EXTERNAL_APIS = str(_get_environment_variable("ENABLE_EXTERNAL_APIS")).lo
 FR24_EMAIL = _get_environment_variable("FR24_EMAIL", required=False)
 FR24_PASSWORD = _get_environment_variable("FR24_PASSWORD", required=False)
 FLIGHTERA_API_KEY = _get_environment_variable("FLIGHTERA_API_KEY", required=False)
+
+# threads reading the database, and how many tasks may wait for one (or for
+# the writer) before requests are turned away with 503
+DB_READ_WORKERS = _get_environment_variable("DB_READ_WORKERS", cast_int=True, required=False) or 4
+DB_QUEUE_LIMIT = _get_environment_variable("DB_QUEUE_LIMIT", cast_int=True, required=False) or 64
+# milliseconds a connection waits for another one's write lock before failing
+DB_BUSY_TIMEOUT = _get_environment_variable("DB_BUSY_TIMEOUT", cast_int=True, required=False) or 5000
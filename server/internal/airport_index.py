@@ -0,0 +1,146 @@
+"""KD-tree over the airports reference table for lookups by location.
+
+Airports are placed on the unit sphere as (x, y, z) points, so the straight
+line (chord) distance between two of them grows with their great circle
+distance and a plain 3-d KD-tree answers nearest and within-radius queries
+without special cases at the poles or the antimeridian. The tree is built
+from the reference data registry at startup and again after the registry
+has reloaded, and stored as flat lists so a query only walks a few nodes.
+"""
+
+import heapq
+import math
+import threading
+
+from server.internal import reference_data
+from server.internal.reference_data import AIRPORT_COLUMNS
+
+EARTH_RADIUS_KM = 6371
+
+_LATITUDE = AIRPORT_COLUMNS.index("latitude")
+_LONGITUDE = AIRPORT_COLUMNS.index("longitude")
+_TYPE = AIRPORT_COLUMNS.index("type")
+
+
+def _point(latitude: float, longitude: float) -> tuple[float, float, float]:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat)
+
+
+def _chord(distance_km: float) -> float:
+    """Chord length on the unit sphere of a great circle distance."""
+    return 2 * math.sin(min(distance_km / EARTH_RADIUS_KM, math.pi) / 2)
+
+
+def _distance_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+class AirportIndex:
+    def __init__(self, airports: dict[str, tuple]):
+        self.source = airports
+        rows = [row for row in airports.values()
+                if row[_LATITUDE] is not None and row[_LONGITUDE] is not None]
+
+        # node i of the tree holds rows[order[i]] and splits on axes[i]; its
+        # children are the middles of the ranges left and right of it
+        self.rows = rows
+        self.points = [_point(row[_LATITUDE], row[_LONGITUDE]) for row in rows]
+        self.order: list[int] = list(range(len(rows)))
+        self.axes: list[int] = [0] * len(rows)
+        self._build()
+
+    def _build(self) -> None:
+        stack = [(0, len(self.order), 0)]
+        while stack:
+            start, end, depth = stack.pop()
+            if end - start <= 0:
+                continue
+            axis = depth % 3
+            self.order[start:end] = sorted(self.order[start:end], key=lambda i: self.points[i][axis])
+            middle = (start + end) // 2
+            self.axes[middle] = axis
+            stack += [(start, middle, depth + 1), (middle + 1, end, depth + 1)]
+
+    def _search(self, target: tuple, accept, visit) -> None:
+        """Walk the tree nearest side first; visit(row index, squared chord)
+        is called for accepted rows and returns the squared chord within
+        which the search still has to look."""
+        bound = visit(None, None)
+        # ranges of the tree, with a lower bound of their squared chord
+        stack = [(0, len(self.order), 0.0)]
+        while stack:
+            start, end, closest = stack.pop()
+            if end - start <= 0 or closest > bound:
+                continue
+            middle = (start + end) // 2
+            i = self.order[middle]
+            point = self.points[i]
+
+            if accept(i):
+                squared = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+                if squared <= bound:
+                    bound = visit(i, squared)
+
+            axis = self.axes[middle]
+            delta = target[axis] - point[axis]
+            near, far = ((middle + 1, end), (start, middle)) if delta > 0 else ((start, middle), (middle + 1, end))
+            # the far side is only reachable across the splitting plane
+            stack.append((*far, max(closest, delta * delta)))
+            stack.append((*near, closest))
+
+    def _accept(self, types: set[str] | None):
+        if not types:
+            return lambda i: True
+        return lambda i: self.rows[i][_TYPE] in types
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5, types: set[str] | None = None,
+                max_distance_km: float | None = None) -> list[tuple[tuple, float]]:
+        """The k airports closest to a location (optionally only of some
+        types and within a distance), as (row, distance in km), closest first."""
+        limit = _chord(max_distance_km) ** 2 if max_distance_km is not None else math.inf
+        heap: list[tuple[float, int]] = []  # (-squared chord, row index)
+
+        def visit(i, squared):
+            if i is not None:
+                if len(heap) < k:
+                    heapq.heappush(heap, (-squared, i))
+                else:
+                    heapq.heapreplace(heap, (-squared, i))
+            return -heap[0][0] if len(heap) == k else limit
+
+        if k > 0:
+            self._search(_point(latitude, longitude), self._accept(types), visit)
+
+        return [(self.rows[i], _distance_km(math.sqrt(-squared))) for squared, i in sorted(heap, reverse=True)]
+
+    def within(self, latitude: float, longitude: float, radius_km: float,
+               types: set[str] | None = None) -> list[tuple[tuple, float]]:
+        """All airports within a distance of a location (optionally only of
+        some types), as (row, distance in km), closest first."""
+        limit = _chord(radius_km) ** 2
+        found: list[tuple[float, int]] = []
+
+        def visit(i, squared):
+            if i is not None:
+                found.append((squared, i))
+            return limit
+
+        self._search(_point(latitude, longitude), self._accept(types), visit)
+
+        return [(self.rows[i], _distance_km(math.sqrt(squared))) for squared, i in sorted(found)]
+
+
+_lock = threading.Lock()
+_index: AirportIndex | None = None
+
+
+def get_index() -> AirportIndex:
+    """The index over the current reference data, rebuilt after it reloaded."""
+    global _index
+
+    airports = reference_data.airport_rows()
+    with _lock:
+        if _index is None or _index.source is not airports:
+            _index = AirportIndex(airports)
+        return _index
@@ -0,0 +1,363 @@
+"""Per-user columnar snapshot of flights for ad hoc group-by queries.
+
+A cube holds one user's flights column by column, sorted by day: the day
+numbers, a dictionary-encoded column of codes for every dimension and a
+plain column for every measure. It is built with a single query the first
+time it is needed and rebuilt after the user's flights change, so pivoting
+in the analytics view costs no SQL at all. Queries slice the date range by
+bisection, filter and group on the integer codes and only decode the
+values of the resulting groups.
+"""
+
+import bisect
+import datetime
+from array import array
+from collections import Counter
+
+from sqlalchemy.orm import Session
+
+from server.internal.statistics_engine import CO2_CLASS_FACTOR, CO2_G_PER_KM
+from server.internal.stats_cache import VersionedCache, statistics_cache
+
+MAX_CUBES = 8
+
+# dimensions read from a column, and derived from others
+COLUMN_DIMENSIONS = ("origin", "destination", "airline", "airplane", "ticket_class", "seat",
+                     "aircraft_side", "purpose", "tail_number", "currency")
+DERIVED_DIMENSIONS = ("route", "date", "month", "year", "weekday")
+DIMENSIONS = COLUMN_DIMENSIONS + DERIVED_DIMENSIONS
+
+MEASURES = ("distance", "duration", "cost", "rating")
+AGGREGATES = ("sum", "avg", "min", "max", "count")
+
+
+class Cube:
+    def __init__(self, username: str, rows: list):
+        self.username = username
+        self.size = len(rows)
+        self.days = array("l", (row[1] or 0 for row in rows))
+        self.codes: dict[str, array] = {}
+        self.values: dict[str, list] = {}
+        self.measures: dict[str, list] = {}
+
+        for i, name in enumerate(COLUMN_DIMENSIONS):
+            self._encode(name, [row[2 + i] for row in rows])
+
+        offset = 2 + len(COLUMN_DIMENSIONS)
+        for i, name in enumerate(MEASURES):
+            self.measures[name] = [row[offset + i] for row in rows]
+
+        dates = [row[0] for row in rows]
+        self._encode("route", [f"{row[2]}-{row[3]}" for row in rows])
+        self._encode("date", dates)
+        self._encode("month", [date[:7] for date in dates])
+        self._encode("year", [int(date[:4]) for date in dates])
+        # ISO weekday, 1 is Monday
+        self._encode("weekday", [datetime.date.fromordinal(day).isoweekday() if day > 0 else None
+                                 for day in self.days])
+
+    def _encode(self, name: str, column: list) -> None:
+        index: dict = {}
+        self.codes[name] = array("i", (index.setdefault(value, len(index)) for value in column))
+        self.values[name] = list(index)
+
+    def rows_between(self, first_day: int | None, last_day: int | None) -> range:
+        lo = bisect.bisect_left(self.days, first_day) if first_day is not None else 0
+        hi = bisect.bisect_right(self.days, last_day) if last_day is not None else self.size
+        return range(lo, hi)
+
+
+def _build(db: Session, username: str) -> Cube:
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT f.date, f.date_day, {", ".join(f"f.{name}" for name in COLUMN_DIMENSIONS)},
+                   {", ".join(f"f.{name}" for name in MEASURES)}
+            FROM flights f
+            WHERE f.username = ?
+            ORDER BY f.date_day, f.id;
+        """, [username])
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    return Cube(username, rows)
+
+
+_cubes = VersionedCache(MAX_CUBES)
+
+
+def get_cube(db: Session, username: str) -> Cube:
+    """The user's cube, built if missing or outdated."""
+    cube = _cubes.get(username)
+    if cube is None:
+        version = statistics_cache.version(username)
+        cube = _build(db, username)
+        _cubes.store(username, version, cube)
+    return cube
+
+
+class Measure:
+    """'count' (flights), '<aggregate>:<measure>' or 'distinct:<dimension>'."""
+
+    def __init__(self, aggregate: str, field: str | None = None):
+        self.aggregate = aggregate
+        self.field = field
+        self.name = aggregate if field is None else f"{aggregate}_{field}"
+
+    @classmethod
+    def parse(cls, spec: str) -> "Measure":
+        aggregate, _, name = spec.strip().partition(":")
+        if aggregate == "count" and not name:
+            return cls("count")
+        if aggregate == "distinct" and name in DIMENSIONS:
+            return cls("distinct", name)
+        if aggregate in AGGREGATES and name in MEASURES:
+            return cls(aggregate, name)
+        raise ValueError(f"Unknown measure '{spec}'")
+
+
+def _take(column, rows: range | list[int]):
+    if isinstance(rows, range):
+        return column[rows.start:rows.stop]
+    return [column[i] for i in rows]
+
+
+def _aggregate(measure: Measure, cube: Cube, rows: list[int], groups: list[int], count: int) -> list:
+    if measure.aggregate == "count" and measure.field is None:
+        counts = [0] * count
+        for group, n in Counter(groups).items():
+            counts[group] = n
+        return counts
+
+    if measure.aggregate == "distinct":
+        seen = [set() for _ in range(count)]
+        for group, code in zip(groups, _take(cube.codes[measure.field], rows)):
+            seen[group].add(code)
+        return [len(codes) for codes in seen]
+
+    totals = [None] * count
+    counts = [0] * count
+    aggregate = measure.aggregate
+    for group, value in zip(groups, _take(cube.measures[measure.field], rows)):
+        if value is None:
+            continue
+        counts[group] += 1
+        total = totals[group]
+        if total is None:
+            totals[group] = value
+        elif aggregate == "sum" or aggregate == "avg":
+            totals[group] = total + value
+        elif aggregate == "min":
+            totals[group] = value if value < total else total
+        elif aggregate == "max":
+            totals[group] = value if value > total else total
+
+    if aggregate == "count":
+        return counts
+    if aggregate == "avg":
+        return [round(total / n, 2) if n else None for total, n in zip(totals, counts)]
+    return totals
+
+
+def _decode(key: int, radices: list[int]) -> list[int]:
+    codes = []
+    for radix in reversed(radices):
+        key, code = divmod(key, radix)
+        codes.append(code)
+    return codes[::-1]
+
+
+def _select(values: list, descending: bool, limit: int | None) -> list[int]:
+    """Indices of the limit (None for all) first values in order, None last
+    in either direction, ties in order of first appearance."""
+    present = [group for group, value in enumerate(values) if value is not None]
+    order = sorted(present, key=values.__getitem__, reverse=descending)
+    if limit is None or len(order) < limit:
+        order += [group for group, value in enumerate(values) if value is None]
+    return order if limit is None else order[:limit]
+
+
+def query(cube: Cube,
+          dimensions: list[str],
+          measures: list[Measure],
+          filters: dict[str, list] | None = None,
+          first_day: int | None = None,
+          last_day: int | None = None,
+          order_by: str | None = None,
+          descending: bool = True,
+          limit: int | None = None) -> tuple[int, list[dict]]:
+    """Group the flights between two day numbers (inclusive) that match the
+    filters (dimension: accepted values) by the dimensions and compute the
+    measures of every group. Returns the number of groups and the first
+    limit (None for all) of them ordered by order_by, a dimension or measure
+    name, or in order of first appearance without one. Rows are dicts keyed
+    by dimension and measure name, and only those returned are decoded."""
+    for name in [*dimensions, *(filters or {})]:
+        if name not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension '{name}'")
+    if order_by is not None and order_by not in dimensions and order_by not in [m.name for m in measures]:
+        raise ValueError(f"Cannot order by '{order_by}'")
+
+    rows = cube.rows_between(first_day, last_day)
+    for name, accepted in (filters or {}).items():
+        index = {value: code for code, value in enumerate(cube.values[name])}
+        codes = {index[value] for value in accepted if value in index}
+        column = cube.codes[name]
+        rows = [i for i in rows if column[i] in codes]
+
+    # one integer per group, the dimension codes as digits of a mixed radix
+    # number, so grouping hashes ints rather than tuples
+    radices = [len(cube.values[name]) for name in dimensions]
+    if not dimensions:
+        keys, groups = [0], [0] * len(rows)
+    else:
+        row_keys = _take(cube.codes[dimensions[0]], rows)
+        for name, radix in zip(dimensions[1:], radices[1:]):
+            row_keys = [key * radix + code for key, code in zip(row_keys, _take(cube.codes[name], rows))]
+
+        # numbered in order of first appearance
+        group_of = dict.fromkeys(row_keys)
+        keys = list(group_of)
+        group_of.update(zip(keys, range(len(keys))))
+        groups = list(map(group_of.__getitem__, row_keys))
+
+    if dimensions and not groups:
+        return 0, []
+
+    results = [_aggregate(measure, cube, rows, groups, len(keys)) for measure in measures]
+
+    if order_by in dimensions:
+        position = dimensions.index(order_by)
+        stride = 1
+        for radix in radices[position + 1:]:
+            stride *= radix
+        values = cube.values[order_by]
+        selected = _select([values[key // stride % radices[position]] for key in keys], descending, limit)
+    elif order_by is not None:
+        selected = _select(results[[m.name for m in measures].index(order_by)], descending, limit)
+    else:
+        selected = list(range(len(keys) if limit is None else min(limit, len(keys))))
+
+    output = []
+    for group in selected:
+        row = {name: cube.values[name][code] for name, code in zip(dimensions, _decode(keys[group], radices))}
+        for measure, values in zip(measures, results):
+            row[measure.name] = values[group]
+        output.append(row)
+
+    return len(keys), output
+
+
+BUCKETS = ("day", "week", "month", "quarter", "year")
+SERIES_MEASURES = ("count", "distance", "duration", "cost", "co2")
+
+
+def _bucket_start(date: datetime.date, bucket: str) -> datetime.date:
+    if bucket == "week":
+        return date - datetime.timedelta(days=date.weekday())
+    if bucket == "month":
+        return date.replace(day=1)
+    if bucket == "quarter":
+        return date.replace(month=(date.month - 1) // 3 * 3 + 1, day=1)
+    if bucket == "year":
+        return date.replace(month=1, day=1)
+    return date
+
+
+def _next_bucket(start: datetime.date, bucket: str) -> datetime.date:
+    if bucket == "day":
+        return start + datetime.timedelta(days=1)
+    if bucket == "week":
+        return start + datetime.timedelta(days=7)
+    months = {"month": 1, "quarter": 3, "year": 12}[bucket]
+    month = start.month - 1 + months
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1)
+
+
+def _bucket_label(start: datetime.date, bucket: str) -> str:
+    if bucket == "week":
+        year, week, _ = start.isocalendar()
+        return f"{year}-W{week:02d}"
+    if bucket == "month":
+        return start.isoformat()[:7]
+    if bucket == "quarter":
+        return f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+    if bucket == "year":
+        return str(start.year)
+    return start.isoformat()
+
+
+def _series_values(cube: Cube, measure: str, rows: range) -> list:
+    """Value of every row for a time series measure, None to skip it."""
+    if measure == "count":
+        return [1] * len(rows)
+    if measure != "co2":
+        column = cube.measures[measure]
+        return [column[i] for i in rows]
+
+    # in grams, as in the emissions statistics
+    distances = cube.measures["distance"]
+    classes, names = cube.codes["ticket_class"], cube.values["ticket_class"]
+    factors = [CO2_CLASS_FACTOR.get(name, 1.0) for name in names]
+    return [round(distances[i] * CO2_G_PER_KM * factors[classes[i]])
+            if distances[i] is not None and distances[i] > 0 else None
+            for i in rows]
+
+
+def timeseries(cube: Cube,
+               measure: str,
+               bucket: str,
+               window: int | None = None,
+               cumulative: bool = False,
+               first_day: int | None = None,
+               last_day: int | None = None) -> list[dict]:
+    """Totals of a measure per bucket between two day numbers (inclusive),
+    one entry per bucket from the first to the last flight's, empty buckets
+    included. A window adds the trailing total over that many buckets, and
+    cumulative the running total since the first bucket."""
+    if measure not in SERIES_MEASURES:
+        raise ValueError(f"Unknown measure '{measure}'")
+    if bucket not in BUCKETS:
+        raise ValueError(f"Unknown bucket '{bucket}'")
+    if window is not None and window < 1:
+        raise ValueError("Window must be at least one bucket")
+
+    # undated flights have no place in a series
+    rows = cube.rows_between(max(first_day or 1, 1), last_day)
+    if not rows:
+        return []
+
+    days = cube.days
+    values = _series_values(cube, measure, rows)
+
+    # the rows are sorted by day, so the buckets come in order and a row
+    # only ever falls into the current bucket or a later one
+    starts = [_bucket_start(datetime.date.fromordinal(days[rows[0]]), bucket)]
+    ends = [_next_bucket(starts[0], bucket).toordinal()]
+    totals = [0]
+    for i, value in zip(rows, values):
+        while days[i] >= ends[-1]:
+            starts.append(_next_bucket(starts[-1], bucket))
+            ends.append(_next_bucket(starts[-1], bucket).toordinal())
+            totals.append(0)
+        if value is not None:
+            totals[-1] += value
+
+    # running totals, of which every trailing window is a difference
+    running = [0]
+    for total in totals:
+        running.append(running[-1] + total)
+
+    # CO2 is summed in grams and reported in kg
+    unit = (lambda grams: round(grams / 1000, 1)) if measure == "co2" else (lambda value: value)
+    series = []
+    for i, start in enumerate(starts):
+        point = {"bucket": _bucket_label(start, bucket), "start": start.isoformat(), "value": unit(totals[i])}
+        if window is not None:
+            point["rolling"] = unit(running[i + 1] - running[max(i + 1 - window, 0)])
+        if cumulative:
+            point["cumulative"] = unit(running[i + 1])
+        series.append(point)
+
+    return series
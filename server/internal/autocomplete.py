@@ -0,0 +1,181 @@
+"""In-memory autocomplete over the airports and airlines reference tables.
+
+The endpoints used to filter with LIKE '%q%' over several columns and sort
+by expressions of the query, a full scan of the table on every keystroke.
+An AutocompleteIndex answers the same question, with the same ranking,
+from memory: rows are sorted by the query independent part of the ranking
+and their lowercase searched values joined into one text, with a sorted
+array of where each row starts, and rows equal to the query in a ranked
+column are found by dict lookup. A search finds the query in the text
+with str.find from row to row, in ranking order, and stops as soon as no
+later row can make it into the top k.
+"""
+
+import bisect
+import threading
+from array import array
+
+from server.internal import reference_data
+from server.internal.reference_data import AIRLINE_COLUMNS, AIRPORT_COLUMNS
+
+# terms of a ranking, in the ORDER BY they replace: column equal to the
+# query first, shortest column first, column containing the query first
+EQUALS, LENGTH, CONTAINS = "equals", "length", "contains"
+
+# between values and rows in the text, never part of a query
+FIELD_SEPARATOR = "\x1f"
+ROW_SEPARATOR = "\x1e"
+
+
+def _lower(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+def _flag(value: str | None, matches: bool) -> int:
+    # as sorted by SQL: a match first, then a mismatch, then NULL
+    if value is None:
+        return 2
+    return 0 if matches else 1
+
+
+class AutocompleteIndex:
+    def __init__(self, columns: tuple[str, ...], rows: list[tuple],
+                 fields: tuple[str, ...], ranking: tuple[tuple[str, str], ...]):
+        self.columns = columns
+        self.fields = [columns.index(name) for name in fields]
+        self.ranking = [(term, columns.index(name)) for term, name in ranking]
+
+        # the terms before the first LENGTH only depend on the query through
+        # equality, which is looked up separately; what's left orders rows
+        prefix = 0
+        while prefix < len(self.ranking) and self.ranking[prefix][0] == EQUALS:
+            prefix += 1
+        self._static = self.ranking[:prefix + 1] if prefix < len(self.ranking) else self.ranking[:prefix]
+
+        # (row, its lowercase values, rowid), in order of the static ranking
+        entries = [(row, tuple(_lower(value) for value in row), rowid) for rowid, row in enumerate(rows)]
+        entries.sort(key=lambda entry: (self._static_key(entry[1]), entry[2]))
+        self.rows = [entry[0] for entry in entries]
+        self.values = [entry[1] for entry in entries]
+        self.rowids = [entry[2] for entry in entries]
+
+        # positions sharing a static key are one group, the search can only
+        # stop at the end of one
+        self.groups = array("i")
+        previous, group = None, -1
+        for values in self.values:
+            key = self._static_key(values)
+            if key != previous:
+                previous, group = key, group + 1
+            self.groups.append(group)
+
+        self.equal: dict[int, dict[str, list[int]]] = {column: {} for term, column in self.ranking if term == EQUALS}
+        for position, values in enumerate(self.values):
+            for column, lookup in self.equal.items():
+                if values[column] is not None:
+                    lookup.setdefault(values[column], []).append(position)
+
+        parts = []
+        self.starts = array("l")
+        offset = 0
+        for values in self.values:
+            text = FIELD_SEPARATOR.join(values[column] or "" for column in self.fields) + ROW_SEPARATOR
+            self.starts.append(offset)
+            parts.append(text)
+            offset += len(text)
+        self.text = "".join(parts)
+
+    def _static_key(self, values: tuple) -> tuple:
+        key = []
+        for term, column in self._static:
+            value = values[column]
+            if term == EQUALS:
+                key.append(value is None)
+            else:
+                # SQL sorts NULL lengths first
+                key.append((value is not None, len(value) if value is not None else 0))
+        return tuple(key)
+
+    def _key(self, position: int, q: str) -> tuple:
+        values = self.values[position]
+        key = []
+        for term, column in self.ranking:
+            value = values[column]
+            if term == EQUALS:
+                key.append(_flag(value, value == q))
+            elif term == CONTAINS:
+                key.append(_flag(value, value is not None and q in value))
+            else:
+                key.append((value is not None, len(value) if value is not None else 0))
+        key.append(self.rowids[position])
+        return tuple(key)
+
+    def _matches(self, q: str):
+        """Positions of the rows containing q in a field, in order."""
+        text, starts = self.text, self.starts
+        offset = text.find(q)
+        while offset >= 0:
+            position = bisect.bisect_right(starts, offset) - 1
+            yield position
+            if position + 1 >= len(starts):
+                return
+            offset = text.find(q, starts[position + 1])
+
+    def search(self, q: str, k: int = 5) -> list[tuple]:
+        """The top k rows containing the lowercase query in one of the
+        fields, ranked like the SQL they replace."""
+        if not q or FIELD_SEPARATOR in q or ROW_SEPARATOR in q:
+            return []
+
+        pool = {position for column, lookup in self.equal.items() for position in lookup.get(q, [])}
+
+        found = 0
+        last_group = None
+        for position in self._matches(q):
+            if found >= k and self.groups[position] != last_group:
+                break
+            if position in pool:
+                continue
+            pool.add(position)
+            found += 1
+            last_group = self.groups[position]
+
+        best = sorted(pool, key=lambda position: self._key(position, q))[:k]
+        return [self.rows[position] for position in best]
+
+
+# the rankings of the endpoints
+AIRPORTS = ("airports",
+            ("iata", "name", "municipality", "region", "icao"),
+            ((EQUALS, "iata"), (EQUALS, "name"), (LENGTH, "name"), (EQUALS, "municipality"),
+             (CONTAINS, "region"), (EQUALS, "icao")))
+SEARCH_AIRPORTS = ("airports",
+                   ("icao", "iata", "name", "municipality"),
+                   ((EQUALS, "iata"), (EQUALS, "icao"), (EQUALS, "name"), (LENGTH, "name")))
+AIRLINES = ("airlines",
+            ("name", "icao", "iata"),
+            ((EQUALS, "name"), (LENGTH, "name"), (EQUALS, "icao"), (EQUALS, "iata")))
+
+_lock = threading.Lock()
+_indexes: dict[tuple, tuple[dict, AutocompleteIndex]] = {}
+
+
+def get_index(spec: tuple) -> AutocompleteIndex:
+    """The index for one of the rankings above, over the current reference
+    data (rebuilt after it reloaded)."""
+    table, fields, ranking = spec
+    if table == "airports":
+        source, columns = reference_data.airport_rows(), AIRPORT_COLUMNS
+    else:
+        source, columns = reference_data.airline_rows(), AIRLINE_COLUMNS
+
+    with _lock:
+        built = _indexes.get(spec)
+        if built is None or built[0] is not source:
+            built = _indexes[spec] = (source, AutocompleteIndex(columns, list(source.values()), fields, ranking))
+        return built[1]
+
+
+def build_all() -> None:
+    for spec in (AIRPORTS, SEARCH_AIRPORTS, AIRLINES):
+        get_index(spec)
@@ -0,0 +1,176 @@
+"""Full-text search over flights for the search palette.
+
+Every flight has a document in the flights_fts FTS5 table, under its id as
+rowid: its codes (with the IATA codes and names of its airports and
+airline), aircraft, tail number, flight number, notes, companions and
+custom field values. Triggers on flights, flight_companions, companions
+and custom_field_values rewrite the documents a write touches, so the
+index is always in sync whatever the write path. The table and triggers
+are created on startup, and all documents written again when their
+definition or the reference data changes.
+
+A query is split into words, each matched as a prefix, and results are
+ranked by BM25, so a query reads the index entries of its words instead of
+scanning the user's flights.
+"""
+
+import re
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from server.db.session import engine
+
+# bump whenever the table, the documents or the triggers change, the
+# index is then built again
+SEARCH_VERSION = "1"
+SEARCH_VERSION_KEY = "flight_search_version"
+
+COLUMNS = ("username", "flight_number", "origin", "destination", "airline", "airplane",
+           "tail_number", "notes", "companions", "custom_fields")
+
+# the username only filters, it isn't searched
+CREATE_TABLE = f"""
+    CREATE VIRTUAL TABLE flights_fts USING fts5(
+        username UNINDEXED, {', '.join(COLUMNS[1:])},
+        prefix = '2 3',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )"""
+
+# the documents of the flights matching a condition on f
+DOCUMENTS = """
+    SELECT f.id, f.username, f.flight_number,
+           f.origin || ' ' || COALESCE(o.iata, '') || ' ' || COALESCE(o.name, '') || ' ' || COALESCE(o.municipality, ''),
+           f.destination || ' ' || COALESCE(d.iata, '') || ' ' || COALESCE(d.name, '') || ' ' || COALESCE(d.municipality, ''),
+           COALESCE(f.airline, '') || ' ' || COALESCE(a.iata, '') || ' ' || COALESCE(a.name, ''),
+           f.airplane, f.tail_number, f.notes,
+           (SELECT GROUP_CONCAT(c.name, ' ') FROM flight_companions fc
+            JOIN companions c ON c.id = fc.companion_id
+            WHERE fc.flight_id = f.id),
+           (SELECT GROUP_CONCAT(v.value, ' ') FROM custom_field_values v
+            WHERE v.flight_id = f.id)
+    FROM flights f
+    LEFT JOIN airports o ON o.icao = f.origin
+    LEFT JOIN airports d ON d.icao = f.destination
+    LEFT JOIN airlines a ON a.icao = f.airline
+    WHERE {condition}"""
+
+
+def _insert(flight_ids: str) -> str:
+    """Trigger statement writing the documents of the flights selected by a
+    subquery."""
+    return f"""
+            INSERT INTO flights_fts (rowid, {', '.join(COLUMNS)})
+            {DOCUMENTS.format(condition=f"f.id IN ({flight_ids})")};"""
+
+
+def _rewrite(flight_ids: str) -> str:
+    """Trigger statements writing the documents of the flights selected by
+    a subquery again (dropping those of flights that no longer exist)."""
+    return f"""
+            DELETE FROM flights_fts WHERE rowid IN ({flight_ids});{_insert(flight_ids)}"""
+
+
+SEARCH_TRIGGERS = {
+    "tr_flights_search_insert": f"""
+        AFTER INSERT ON flights
+        BEGIN{_insert("NEW.id")}
+        END""",
+    "tr_flights_search_update": f"""
+        AFTER UPDATE OF id, username, origin, destination, airline, airplane, tail_number, flight_number, notes
+        ON flights
+        BEGIN
+            DELETE FROM flights_fts WHERE rowid = OLD.id;{_rewrite("NEW.id")}
+        END""",
+    "tr_flights_search_delete": """
+        AFTER DELETE ON flights
+        BEGIN
+            DELETE FROM flights_fts WHERE rowid = OLD.id;
+        END""",
+    "tr_flight_companions_search_insert": f"""
+        AFTER INSERT ON flight_companions
+        BEGIN{_rewrite("NEW.flight_id")}
+        END""",
+    "tr_flight_companions_search_delete": f"""
+        AFTER DELETE ON flight_companions
+        BEGIN{_rewrite("OLD.flight_id")}
+        END""",
+    "tr_companions_search_update": f"""
+        AFTER UPDATE OF name ON companions
+        BEGIN{_rewrite("SELECT flight_id FROM flight_companions WHERE companion_id = NEW.id")}
+        END""",
+    "tr_custom_field_values_search_insert": f"""
+        AFTER INSERT ON custom_field_values
+        BEGIN{_rewrite("NEW.flight_id")}
+        END""",
+    "tr_custom_field_values_search_update": f"""
+        AFTER UPDATE OF flight_id, value ON custom_field_values
+        BEGIN{_rewrite("OLD.flight_id, NEW.flight_id")}
+        END""",
+    "tr_custom_field_values_search_delete": f"""
+        AFTER DELETE ON custom_field_values
+        BEGIN{_rewrite("OLD.flight_id")}
+        END""",
+}
+
+
+def update_index() -> None:
+    """(Re)create the search triggers, and the table with all documents if
+    it is missing or was built by another version."""
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT value FROM metadata WHERE key = :key;"),
+                           {"key": SEARCH_VERSION_KEY}).fetchone()
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE name = 'flights_fts';")).fetchone()
+
+        for name, definition in SEARCH_TRIGGERS.items():
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(f"CREATE TRIGGER {name} {definition}"))
+
+        if exists and row and row[0] == SEARCH_VERSION:
+            return
+
+        conn.execute(text("DROP TABLE IF EXISTS flights_fts;"))
+        conn.execute(text(CREATE_TABLE))
+        conn.execute(text("INSERT OR REPLACE INTO metadata (key, value) VALUES (:key, :value);"),
+                     {"key": SEARCH_VERSION_KEY, "value": SEARCH_VERSION})
+
+    rebuild()
+
+
+def rebuild() -> None:
+    """Write the documents of all flights again, after the airports and
+    airlines they mention changed."""
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM flights_fts;"))
+        res = conn.execute(text(f"INSERT INTO flights_fts (rowid, {', '.join(COLUMNS)}) "
+                                f"{DOCUMENTS.format(condition='1')};"))
+        conn.execute(text("INSERT INTO flights_fts (flights_fts) VALUES ('optimize');"))
+
+    print(f"Indexed {res.rowcount} flights for search")
+
+
+def match_expression(q: str) -> str | None:
+    """FTS5 query matching flights with every word of q as a prefix, or
+    None if q has no words."""
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search(db: Session, username: str, q: str, limit: int = 5) -> list[tuple]:
+    """The user's best matching flights for q as (id, date, origin,
+    destination, flight_number, airline), best first."""
+    expression = match_expression(q)
+    if expression is None:
+        return []
+
+    return db.execute(text("""
+        SELECT f.id, f.date, f.origin, f.destination, f.flight_number, f.airline
+        FROM flights_fts
+        JOIN flights f ON f.id = flights_fts.rowid
+        WHERE flights_fts MATCH :expression
+        AND flights_fts.username = :username
+        ORDER BY flights_fts.rank, f.date DESC, f.id DESC
+        LIMIT :limit;
+    """), {"expression": expression, "username": username, "limit": limit}).fetchall()
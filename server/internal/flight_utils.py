@@ -7,8 +7,8 @@ def flight_already_exists(flight: FlightModel, username: str) -> bool:
         result = session.query(Flight).filter(
             Flight.username == username,
             Flight.date == str(flight.date),
-            Flight.origin == str(flight.origin),
-            Flight.destination == str(flight.destination),
+            Flight.origin == str(flight.origin).upper(),
+            Flight.destination == str(flight.destination).upper(),
             Flight.flight_number == flight.flight_number,
         ).first()
         return result is not None
@@ -0,0 +1,175 @@
+"""Grid clustering of a user's map decorations by zoom level.
+
+Airports are projected to Web Mercator and, for every zoom level, bucketed
+into grid cells about CLUSTER_RADIUS pixels wide: the airports of a cell
+form one cluster at the frequency-weighted centre of its airports, and the
+routes between two clusters are bundled into one. Levels are built the
+first time they are needed and kept with the user's index until their
+flights change, and a bounding box is answered by visiting only the cells
+it covers, so what the map receives depends on the screen, not on the
+size of the history.
+"""
+
+import math
+import threading
+
+from server.internal.stats_cache import VersionedCache
+
+MAX_INDEXES = 16
+MAX_ZOOM = 16
+TILE_SIZE = 256
+CLUSTER_RADIUS = 40  # pixels
+MAX_BUNDLES = 2000
+
+MAX_LATITUDE = 85.05112878
+
+
+def _project(latitude: float, longitude: float) -> tuple[float, float]:
+    """Web Mercator position in [0, 1] x [0, 1], from the top left."""
+    latitude = max(-MAX_LATITUDE, min(MAX_LATITUDE, latitude))
+    sine = math.sin(math.radians(latitude))
+    x = (longitude + 180) / 360
+    y = 0.5 - math.log((1 + sine) / (1 - sine)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+class Cluster:
+    def __init__(self):
+        self.airports = []
+        self.frequency = 0
+        self._weight = 0
+        self._latitude = 0.0
+        self._longitude = 0.0
+
+    def add(self, airport) -> None:
+        # every airport weighs at least one, markers have a frequency of 1 or more
+        weight = max(airport.frequency, 1)
+        self.airports.append(airport)
+        self.frequency += airport.frequency
+        self._weight += weight
+        self._latitude += airport.latitude * weight
+        self._longitude += airport.longitude * weight
+
+    def marker(self) -> dict:
+        if len(self.airports) == 1:
+            airport = self.airports[0]
+            return {"latitude": airport.latitude, "longitude": airport.longitude, "frequency": self.frequency,
+                    "icao": airport.icao, "iata": airport.iata, "name": airport.name, "airports": 1}
+
+        return {"latitude": self._latitude / self._weight, "longitude": self._longitude / self._weight,
+                "frequency": self.frequency, "icao": None, "iata": None, "name": None,
+                "airports": len(self.airports)}
+
+
+class Level:
+    """Clusters and route bundles of one zoom level."""
+
+    def __init__(self, zoom: int, airports: list, positions: list[tuple[float, float]], routes: list):
+        self.zoom = zoom
+        self.size = CLUSTER_RADIUS / (TILE_SIZE * 2 ** zoom)
+        self.cells: dict[tuple[int, int], Cluster] = {}
+
+        cell_of = {}
+        for airport, (x, y) in zip(airports, positions):
+            cell = self._cell(x, y)
+            self.cells.setdefault(cell, Cluster()).add(airport)
+            cell_of[airport.icao] = cell
+
+        # bundles between two cells, in either direction; routes within a
+        # single cluster are too short to be drawn
+        self.bundles: dict[tuple, dict] = {}
+        for route in routes:
+            first, second = cell_of[route.first.icao], cell_of[route.second.icao]
+            if first == second:
+                continue
+            key = (first, second) if first <= second else (second, first)
+            bundle = self.bundles.get(key)
+            if bundle is None:
+                bundle = self.bundles[key] = {"first": first, "second": second, "frequency": 0, "routes": []}
+            bundle["frequency"] += route.frequency
+            bundle["routes"].append(route)
+
+        # most flown first, so the busiest ones are kept when there are too many
+        self.bundles = dict(sorted(self.bundles.items(), key=lambda item: -item[1]["frequency"]))
+        self.rank = {key: i for i, key in enumerate(self.bundles)}
+
+        self.bundles_by_cell: dict[tuple[int, int], list[tuple]] = {}
+        for key in self.bundles:
+            for cell in key:
+                self.bundles_by_cell.setdefault(cell, []).append(key)
+
+        self._markers = {cell: cluster.marker() for cell, cluster in self.cells.items()}
+
+    def _cell(self, x: float, y: float) -> tuple[int, int]:
+        return int(x / self.size), int(y / self.size)
+
+    def cells_in(self, west: float, south: float, east: float, north: float) -> list[tuple[int, int]]:
+        """Cells with airports inside the box (which may cross the antimeridian)."""
+        (x1, y1), (x2, y2) = _project(north, west), _project(south, east)
+        top, bottom = self._cell(x1, y1)[1], self._cell(x2, y2)[1]
+        columns = [(self._cell(x1, 0)[0], self._cell(x2, 0)[0])]
+        if west > east:
+            columns = [(self._cell(x1, 0)[0], self._cell(1.0, 0)[0]), (0, self._cell(x2, 0)[0])]
+
+        area = sum(last - first + 1 for first, last in columns) * (bottom - top + 1)
+        if area > len(self.cells):
+            # fewer clusters than cells covered, check the clusters instead
+            return [(cx, cy) for cx, cy in self.cells
+                    if top <= cy <= bottom and any(first <= cx <= last for first, last in columns)]
+
+        return [(cx, cy) for first, last in columns for cx in range(first, last + 1)
+                for cy in range(top, bottom + 1) if (cx, cy) in self.cells]
+
+    def decorations(self, cells: list[tuple[int, int]] | None = None,
+                    limit: int = MAX_BUNDLES) -> tuple[list[dict], list[dict], int]:
+        """The most flown route bundles (up to limit) with an end in one of
+        the cells (all if None) and the clusters of those cells, serialized
+        like the decorations' trajectories and markers, and the number of
+        bundles left out."""
+        if cells is None:
+            cells, keys = list(self.cells), list(self.bundles)
+        else:
+            keys = sorted({key for cell in cells for key in self.bundles_by_cell.get(cell, [])},
+                          key=self.rank.__getitem__)
+        omitted = max(len(keys) - limit, 0)
+        keys = keys[:limit]
+
+        lines = []
+        for key in keys:
+            bundle = self.bundles[key]
+            routes = bundle["routes"]
+            single = len(routes) == 1
+            lines.append({
+                "first": self._markers[bundle["first"]],
+                "second": self._markers[bundle["second"]],
+                "frequency": bundle["frequency"],
+                "originIcao": routes[0].origin_icao if single else None,
+                "destIcao": routes[0].dest_icao if single else None,
+                "routes": len(routes),
+            })
+
+        return lines, [self._markers[cell] for cell in cells], omitted
+
+
+class ClusterIndex:
+    def __init__(self, lines: list, markers: list):
+        self.airports = markers
+        self.routes = lines
+        self.positions = [_project(airport.latitude, airport.longitude) for airport in markers]
+        self.bounds = None
+        if markers:
+            self.bounds = [min(airport.longitude for airport in markers), min(airport.latitude for airport in markers),
+                           max(airport.longitude for airport in markers), max(airport.latitude for airport in markers)]
+
+        self._lock = threading.Lock()
+        self._levels: dict[int, Level] = {}
+
+    def level(self, zoom: int) -> Level:
+        zoom = max(0, min(MAX_ZOOM, zoom))
+        with self._lock:
+            if zoom not in self._levels:
+                self._levels[zoom] = Level(zoom, self.airports, self.positions, self.routes)
+            return self._levels[zoom]
+
+
+cluster_indexes = VersionedCache(MAX_INDEXES)
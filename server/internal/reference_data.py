@@ -0,0 +1,125 @@
+"""Process-wide, read-only registry of the airports and airlines reference tables.
+
+The tables are loaded once on first use and kept as plain tuples indexed by
+(uppercase) ICAO and IATA code, so validators and helpers can resolve codes
+with a dict lookup instead of opening a session and querying. init_db calls
+refresh() whenever it syncs changed reference data.
+"""
+
+import threading
+
+from sqlalchemy import text
+
+from server.db.session import SessionLocal
+
+AIRPORT_COLUMNS = ("icao", "iata", "type", "name", "municipality", "region",
+                   "country", "continent", "latitude", "longitude", "timezone")
+AIRLINE_COLUMNS = ("icao", "iata", "name")
+
+
+class _Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self.airports: dict[str, tuple] = {}
+        self.airports_by_iata: dict[str, tuple] = {}
+        self.airlines: dict[str, tuple] = {}
+        self.airlines_by_iata: dict[str, tuple] = {}
+
+    def ensure_loaded(self) -> "_Registry":
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._load()
+        return self
+
+    def refresh(self) -> None:
+        with self._lock:
+            self._loaded = False
+
+    def _load(self) -> None:
+        with SessionLocal() as session:
+            airport_rows = session.execute(text(
+                f"SELECT {', '.join(AIRPORT_COLUMNS)} FROM airports ORDER BY rowid;"
+            )).fetchall()
+            airline_rows = session.execute(text(
+                f"SELECT {', '.join(AIRLINE_COLUMNS)} FROM airlines ORDER BY rowid;"
+            )).fetchall()
+
+        self.airports, self.airports_by_iata = _index(airport_rows)
+        self.airlines, self.airlines_by_iata = _index(airline_rows)
+        self._loaded = True
+
+
+def _index(rows: list) -> tuple[dict[str, tuple], dict[str, tuple]]:
+    """Index rows (icao, iata, ...) by uppercase ICAO and IATA code. For
+    duplicate IATA codes the first row wins, like the previous .first() queries."""
+    by_icao: dict[str, tuple] = {}
+    by_iata: dict[str, tuple] = {}
+
+    for row in rows:
+        row = tuple(row)
+        if row[0]:
+            by_icao[row[0].upper()] = row
+        if row[1]:
+            by_iata.setdefault(row[1].upper(), row)
+
+    return by_icao, by_iata
+
+
+_registry = _Registry()
+
+
+def refresh() -> None:
+    """Drop the loaded data, it is reloaded on the next lookup."""
+    _registry.refresh()
+
+
+def _key(code: str | None) -> str:
+    return code.strip().upper() if code else ""
+
+
+def airport_exists(icao: str) -> bool:
+    return _key(icao) in _registry.ensure_loaded().airports
+
+
+def airline_exists(icao: str) -> bool:
+    return _key(icao) in _registry.ensure_loaded().airlines
+
+
+def get_airport(icao: str):
+    from server.models import AirportModel
+
+    row = _registry.ensure_loaded().airports.get(_key(icao))
+    return AirportModel.model_validate(dict(zip(AIRPORT_COLUMNS, row))) if row else None
+
+
+def get_airport_by_iata(iata: str):
+    from server.models import AirportModel
+
+    row = _registry.ensure_loaded().airports_by_iata.get(_key(iata))
+    return AirportModel.model_validate(dict(zip(AIRPORT_COLUMNS, row))) if row else None
+
+
+def get_airline(icao: str):
+    from server.models import AirlineModel
+
+    row = _registry.ensure_loaded().airlines.get(_key(icao))
+    return AirlineModel.model_validate(dict(zip(AIRLINE_COLUMNS, row))) if row else None
+
+
+def get_airline_by_iata(iata: str):
+    from server.models import AirlineModel
+
+    row = _registry.ensure_loaded().airlines_by_iata.get(_key(iata))
+    return AirlineModel.model_validate(dict(zip(AIRLINE_COLUMNS, row))) if row else None
+
+
+def airport_rows() -> dict[str, tuple]:
+    """All airports as tuples in AIRPORT_COLUMNS order, keyed by uppercase ICAO."""
+    return _registry.ensure_loaded().airports
+
+
+def airline_rows() -> dict[str, tuple]:
+    """All airlines as tuples in AIRLINE_COLUMNS order, keyed by uppercase ICAO."""
+    return _registry.ensure_loaded().airlines
@@ -0,0 +1,203 @@
+"""Per-user, per-month rollups of the statistics summaries.
+
+Every (user, month, block) has its summary part stored as JSON in the
+monthly_rollups table. Triggers on the flights table mark the months a write
+touches as stale, and stale months are rebuilt from their flights the next
+time the user's statistics are read, as one task of the database writer
+(the read itself stays on the readers). A date range is then answered by
+merging the rollups of the whole months it covers and summarizing raw
+flights only for the partial months at its edges, so year-over-year and
+all-time views don't grow with the size of the history.
+"""
+
+import datetime
+import json
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from server.db import workers
+from server.db.session import engine, fetch_all
+from server.internal.statistics_engine import (
+    BLOCKS, BLOCKS_BY_NAME, FlightSet, merge_summaries, read_flights, summarize, timed
+)
+
+# bump whenever a block's summary changes shape, all rollups are then rebuilt
+ROLLUP_VERSION = "1"
+ROLLUP_VERSION_KEY = "rollups_version"
+
+
+def mark_missing_stale() -> None:
+    """Mark every month with flights but no rollups as stale, after dropping
+    all rollups if they were built by another version."""
+    with engine.begin() as conn:
+        row = conn.execute(text("SELECT value FROM metadata WHERE key = :key;"),
+                           {"key": ROLLUP_VERSION_KEY}).fetchone()
+        if not row or row[0] != ROLLUP_VERSION:
+            conn.execute(text("DELETE FROM monthly_rollups;"))
+            conn.execute(text("INSERT OR REPLACE INTO metadata (key, value) VALUES (:key, :value);"),
+                         {"key": ROLLUP_VERSION_KEY, "value": ROLLUP_VERSION})
+
+        res = conn.execute(text("""
+            INSERT OR IGNORE INTO stale_rollups (username, month)
+            SELECT DISTINCT f.username, SUBSTR(f.date, 1, 7)
+            FROM flights f
+            WHERE NOT EXISTS (SELECT 1 FROM monthly_rollups r
+                              WHERE r.username = f.username AND r.month = SUBSTR(f.date, 1, 7));
+        """))
+
+        if res.rowcount:
+            print(f"Marked {res.rowcount} months of statistics rollups for rebuilding")
+
+
+def _month_of(day: int) -> str:
+    return datetime.date.fromordinal(day).isoformat()[:7]
+
+
+def _month_days(month: str) -> tuple[int, int]:
+    """Day numbers of the first and last day of a 'YYYY-MM' month."""
+    year, number = int(month[:4]), int(month[5:7])
+    first = datetime.date(year, number, 1)
+    following = datetime.date(year + number // 12, number % 12 + 1, 1)
+    return first.toordinal(), following.toordinal() - 1
+
+
+async def ensure_fresh(db: Session | AsyncSession, username: str) -> None:
+    """Rebuild the user's stale months, if there are any, on the database
+    writer; to be awaited before summarize_range."""
+    stale = await fetch_all(db, text("SELECT 1 FROM stale_rollups WHERE username = :username LIMIT 1;"),
+                            {"username": username})
+    if stale:
+        await workers.run_write(refresh, username)
+
+
+def refresh(db: Session, username: str) -> None:
+    """Rebuild the user's stale months from their flights."""
+    # deleting the marks first takes the write lock, so no write can slip
+    # in between reading the flights and storing their rollups
+    months = sorted(row[0] for row in db.execute(text("""
+        DELETE FROM stale_rollups WHERE username = :username RETURNING month;
+    """), {"username": username}).fetchall())
+
+    if months:
+        _rebuild(db, username, months)
+    db.commit()
+
+
+def _rebuild(db: Session, username: str, months: list[str]) -> None:
+    bounds = [_month_days(month) for month in months if len(month) == 7]
+    rows_by_month = {month: [] for month in months}
+
+    if bounds:
+        # one range read covering all of them, split by month in Python
+        flights = read_flights(db, "WHERE f.username = :username AND f.date_day BETWEEN :first AND :last",
+                               {"username": username, "first": bounds[0][0], "last": bounds[-1][1]})
+        for row in flights.rows:
+            month = row[0][:7]
+            if month in rows_by_month:
+                rows_by_month[month].append(row)
+
+    db.execute(text("DELETE FROM monthly_rollups WHERE username = :username AND month = :month;"),
+               [{"username": username, "month": month} for month in months])
+
+    values = []
+    for month, rows in rows_by_month.items():
+        if not rows:
+            continue
+        flights = FlightSet(rows)
+        for block in BLOCKS:
+            values.append({"username": username, "month": month, "block": block.name,
+                           "data": json.dumps(block.summarize(flights), default=sorted)})
+
+    if values:
+        db.execute(text("""
+            INSERT INTO monthly_rollups (username, month, block, data)
+            VALUES (:username, :month, :block, :data);
+        """), values)
+
+
+def summarize_range(db: Session,
+                    username: str,
+                    first_day: int | None = None,
+                    last_day: int | None = None,
+                    blocks: list[str] | None = None,
+                    timings: dict[str, float] | None = None) -> dict[str, dict]:
+    """The summary of the user's flights between two day numbers (both
+    inclusive, None for unbounded), limited to the given block names. Time
+    spent on each block is added to timings, reading the rollups and the
+    raw flights under 'rollups' and 'flights'. Months still stale (see
+    ensure_fresh) are read as they were last built."""
+    names = blocks if blocks is not None else [block.name for block in BLOCKS]
+
+    # whole months covered by the range
+    first_month = None
+    if first_day is not None:
+        first_month = _month_of(first_day)
+        if _month_days(first_month)[0] != first_day:
+            first_month = _month_of(_month_days(first_month)[1] + 1)
+    last_month = None
+    if last_day is not None:
+        last_month = _month_of(last_day)
+        if _month_days(last_month)[1] != last_day:
+            last_month = _month_of(_month_days(last_month)[0] - 1)
+
+    if first_month and last_month and first_month > last_month:
+        return _summarize_raw(db, username, [(first_day, last_day)], names, timings)
+
+    clauses = ["username = :username", "block IN :blocks"]
+    params = {"username": username, "blocks": tuple(names)}
+    edges = []
+    if first_month:
+        clauses.append("month >= :first_month")
+        params["first_month"] = first_month
+        if first_day < _month_days(first_month)[0]:
+            edges.append((first_day, _month_days(first_month)[0] - 1))
+    if last_month:
+        clauses.append("month <= :last_month")
+        params["last_month"] = last_month
+        if last_day > _month_days(last_month)[1]:
+            edges.append((_month_days(last_month)[1] + 1, last_day))
+
+    rows = timed(timings, "rollups", lambda: db.execute(text(f"""
+        SELECT block, data FROM monthly_rollups
+        WHERE {" AND ".join(clauses)}
+        ORDER BY month;
+    """).bindparams(bindparam("blocks", expanding=True)), params).fetchall())
+
+    summary = {}
+    for block, data in rows:
+        summary[block] = timed(timings, block, _merge_rollup, summary.get(block), block, data)
+
+    if edges:
+        summary = merge_summaries(summary, _summarize_raw(db, username, edges, names, timings), timings)
+
+    return summary
+
+
+def _merge_rollup(part: dict | None, block: str, data: str) -> dict:
+    rollup = json.loads(data)
+    return BLOCKS_BY_NAME[block].merge(part, rollup) if part is not None else rollup
+
+
+def _summarize_raw(db: Session, username: str, ranges: list[tuple[int | None, int | None]],
+                   names: list[str], timings: dict[str, float] | None = None) -> dict[str, dict]:
+    conditions = []
+    params: dict = {"username": username}
+    for i, (first, last) in enumerate(ranges):
+        bounds = []
+        if first is not None:
+            bounds.append(f"f.date_day >= :first{i}")
+            params[f"first{i}"] = first
+        if last is not None:
+            bounds.append(f"f.date_day <= :last{i}")
+            params[f"last{i}"] = last
+        conditions.append("(" + " AND ".join(bounds or ["1"]) + ")")
+
+    flights = timed(timings, "flights", read_flights,
+                    db, f"WHERE f.username = :username AND ({' OR '.join(conditions)})", params)
+    if not flights.count:
+        return {}
+
+    return summarize(flights, names, timings)
+
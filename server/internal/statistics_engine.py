@@ -0,0 +1,574 @@
+"""Single-pass statistics aggregation.
+
+The filtered flights are read with one query and reduced in Python to a
+summary: one small, JSON-compatible part per block of StatisticsModel.
+Parts of disjoint sets of flights can be merged, which is what lets the
+monthly rollups stand in for raw rows. The final values are computed from a
+(merged) summary, with airport and airline details coming from the
+reference data registry instead of joins.
+"""
+
+import datetime
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy.orm import Session
+
+from server.internal import reference_data
+from server.internal.reference_data import AIRPORT_COLUMNS
+
+MILES_PER_KM = 0.6213711922
+CO2_G_PER_KM = 90
+CO2_CLASS_FACTOR = {"economy": 1.0, "economy+": 1.2, "business": 2.0, "first": 3.0, "private": 4.0}
+CONTINENTS = {"AF": "Africa", "AN": "Antarctica", "AS": "Asia", "EU": "Europe", "NA": "North America", "OC": "Oceania", "SA": "South America"}
+
+# the flight itself, the flight it connects to, and whether another flight connects to it
+FLIGHT_COLUMNS = [
+    "f.date", "f.date_day", "f.origin", "f.destination", "f.departure_time", "f.arrival_time",
+    "f.seat", "f.aircraft_side", "f.ticket_class", "f.duration", "f.distance", "f.airplane",
+    "f.airline", "f.cost", "f.currency", "f.rating", "f.connection",
+    "c.date", "c.departure_time",
+    "EXISTS (SELECT 1 FROM flights AS prev WHERE prev.connection = f.id)",
+]
+
+COUNTRY = AIRPORT_COLUMNS.index("country")
+CONTINENT = AIRPORT_COLUMNS.index("continent")
+MUNICIPALITY = AIRPORT_COLUMNS.index("municipality")
+TIMEZONE = AIRPORT_COLUMNS.index("timezone")
+
+# how each field of a summary part is merged
+SUM = "sum"        # numbers, added
+COUNTS = "counts"  # {key: number, list of numbers or nested counts}, added per key
+SET = "set"        # unique values, unioned
+MIN = "min"        # [value, *details] or None, the smallest value wins
+MAX = "max"        # [value, *details] or None, the largest value wins
+
+
+class FlightSet:
+    """The filtered flights, column by column."""
+
+    def __init__(self, rows: list):
+        columns = list(zip(*rows)) if rows else [()] * len(FLIGHT_COLUMNS)
+
+        (self.dates, self.days, self.origins, self.destinations, self.departures, self.arrivals,
+         self.seats, self.sides, self.classes, self.durations, self.distances, self.airplanes,
+         self.airline_codes, self.costs, self.currencies, self.ratings, self.connections,
+         self.next_dates, self.next_departures, self.has_previous) = columns
+
+        self.rows = rows
+        self.count = len(rows)
+        self.months = [date[:7] for date in self.dates]
+
+
+def read_flights(db: Session, filters: str, params: dict) -> FlightSet:
+    # plain DBAPI tuples: wrapping 100k rows in SQLAlchemy Row objects
+    # costs about as much as the whole aggregation
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.execute(f"""
+            SELECT {", ".join(FLIGHT_COLUMNS)}
+            FROM flights f
+            LEFT JOIN flights c ON c.id = f.connection
+            {filters};
+        """, params)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    return FlightSet(rows)
+
+
+def _convert(distance: int, metric: bool) -> int:
+    return distance if metric else round(distance * MILES_PER_KM)
+
+
+def _count(values) -> dict:
+    return dict(Counter(value for value in values if value is not None))
+
+
+def _top(counts: dict, n: int | None = None) -> list[tuple]:
+    return Counter(counts).most_common(n)
+
+
+def _add(a, b):
+    # in place: merging many months would otherwise copy the growing totals each time
+    if isinstance(a, dict):
+        for key, value in b.items():
+            a[key] = _add(a[key], value) if key in a else value
+        return a
+    if isinstance(a, list):
+        for i, value in enumerate(b):
+            a[i] += value
+        return a
+    return a + b
+
+
+def _merge_field(kind: str, a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if kind == SUM or kind == COUNTS:
+        return _add(a, b)
+    if kind == SET:
+        merged = a if isinstance(a, set) else set(a)
+        merged.update(b)
+        return merged
+    if kind == MIN:
+        return b if b[0] < a[0] else a
+    if kind == MAX:
+        return b if b[0] > a[0] else a
+    raise ValueError(f"Unknown merge kind '{kind}'")
+
+
+class Block:
+    """One group of StatisticsModel fields.
+
+    summarize reduces a FlightSet to a part whose fields merge as declared in
+    `fields`, finalize turns a (merged) part into the model's values.
+    """
+
+    def __init__(self, name: str, fields: dict[str, str], summarize, finalize):
+        self.name = name
+        self.fields = fields
+        self.summarize = summarize
+        self.finalize = finalize
+
+    def merge(self, a: dict, b: dict) -> dict:
+        """Merge part b into part a. Both may be modified and reused."""
+        return {field: _merge_field(kind, a.get(field), b.get(field)) for field, kind in self.fields.items()}
+
+
+def _summarize_totals(flights: FlightSet) -> dict:
+    # a connection's airports are only visited once: skip the destination of
+    # a flight with an onward connection and the origin of the onward flight
+    visited = {dest for dest, conn in zip(flights.destinations, flights.connections) if conn is None}
+    visited |= {origin for origin, prev in zip(flights.origins, flights.has_previous) if not prev}
+    days = [day for day in flights.days if day is not None]
+
+    return {
+        "count": flights.count,
+        "duration": sum(d for d in flights.durations if d is not None),
+        "distance": sum(d for d in flights.distances if d is not None),
+        "airports": (set(flights.origins) | set(flights.destinations)) - {None},
+        "visited": visited,
+        "first_day": [min(days)] if days else None,
+        "last_day": [max(days)] if days else None,
+    }
+
+
+def _finalize_totals(part: dict, metric: bool) -> dict:
+    airports = reference_data.airport_rows()
+    countries = {airports[icao][COUNTRY] for icao in part["visited"] if icao in airports}
+
+    return {
+        "total_flights": part["count"],
+        "total_duration": part["duration"],
+        "total_distance": _convert(part["distance"], metric) if part["distance"] else part["distance"],
+        "total_unique_airports": len(part["airports"]),
+        "days_range": part["last_day"][0] - part["first_day"][0] if part["first_day"] else 0,
+        "visited_countries": len(countries - {None}),
+    }
+
+
+_continents_cache: tuple[dict, dict[str, set]] | None = None
+
+
+def _countries_by_continent(airports: dict[str, tuple]) -> dict[str, set]:
+    """Countries of every continent, computed once per load of the reference data."""
+    global _continents_cache
+    if _continents_cache is None or _continents_cache[0] is not airports:
+        by_continent: dict[str, set] = defaultdict(set)
+        for airport in airports.values():
+            if airport[CONTINENT] and airport[COUNTRY] is not None:
+                by_continent[airport[CONTINENT]].add(airport[COUNTRY])
+        _continents_cache = (airports, by_continent)
+
+    return _continents_cache[1]
+
+
+def _summarize_airports(flights: FlightSet) -> dict:
+    visits = Counter()
+    for origin, destination, conn in zip(flights.origins, flights.destinations, flights.connections):
+        visits[origin] += 1
+        if conn is None and destination != origin:
+            visits[destination] += 1
+
+    return {
+        "visits": dict(visits),
+        "endpoints": _count(flights.origins + flights.destinations),
+        "seen": (set(flights.origins) | set(flights.destinations)) - {None},
+    }
+
+
+def _finalize_airports(part: dict, metric: bool) -> dict:
+    airports = reference_data.airport_rows()
+
+    most_visited_airports = {}
+    known = {icao: n for icao, n in part["visits"].items() if icao in airports}
+    for icao, count in _top(known, 5):
+        airport = airports[icao]
+        most_visited_airports[f"{airport[1] if airport[1] else airport[0]} - {airport[MUNICIPALITY]}/{airport[COUNTRY]}"] = count
+
+    countries = Counter()
+    for icao, count in part["endpoints"].items():
+        if icao in airports:
+            countries[airports[icao][COUNTRY]] += count
+
+    timezones = {airports[icao][TIMEZONE] for icao in part["seen"] if icao in airports}
+
+    total_by_continent = _countries_by_continent(airports)
+
+    visited_by_continent: dict[str, set] = defaultdict(set)
+    for icao in part["seen"]:
+        airport = airports.get(icao)
+        if airport and airport[CONTINENT] and airport[COUNTRY] is not None:
+            visited_by_continent[airport[CONTINENT]].add(airport[COUNTRY])
+
+    continent_completion = []
+    for code, name in CONTINENTS.items():
+        total = len(total_by_continent.get(code, ()))
+        if total > 0:
+            visited = len(visited_by_continent.get(code, ()))
+            continent_completion.append({"continent": name, "visited": visited, "total": total})
+
+    return {
+        "most_visited_airports": most_visited_airports,
+        "most_common_countries": dict(countries.most_common(5)),
+        "unique_timezones": len(timezones - {None}),
+        "continent_completion": continent_completion,
+    }
+
+
+def _summarize_frequencies(flights: FlightSet) -> dict:
+    routes: dict[str, dict[str, int]] = defaultdict(dict)
+    for origin, destination in zip(flights.origins, flights.destinations):
+        routes[origin][destination] = routes[origin].get(destination, 0) + 1
+
+    return {
+        "seats": _count(flights.seats),
+        "classes": _count(flights.classes),
+        "airlines": _count(flights.airline_codes),
+        "routes": dict(routes),
+        "aircraft": _count(flights.airplanes),
+        "sides": _count(flights.sides),
+    }
+
+
+def _finalize_frequencies(part: dict, metric: bool) -> dict:
+    airlines = reference_data.airline_rows()
+
+    known = {code: n for code, n in part["airlines"].items() if code in airlines}
+    routes = {(origin, destination): n
+              for origin, destinations in part["routes"].items()
+              for destination, n in destinations.items()}
+
+    return {
+        "seat_frequency": dict(_top(part["seats"])),
+        "ticket_class_frequency": dict(_top(part["classes"])),
+        "most_common_airlines": {airlines[code][2]: count for code, count in _top(known, 5)},
+        "top_routes": [{"origin": o, "destination": d, "count": n} for (o, d), n in _top(routes, 5)],
+        "top_aircraft": [{"airplane": a, "count": n} for a, n in _top(part["aircraft"], 5)],
+        "side_frequency": dict(_top(part["sides"])),
+    }
+
+
+def _summarize_timeline(flights: FlightSet) -> dict:
+    distance_by_month = defaultdict(int)
+    for month, distance in zip(flights.months, flights.distances):
+        if distance is not None:
+            distance_by_month[month] += distance
+
+    return {
+        "months": _count(flights.months),
+        "distance": dict(distance_by_month),
+        "days": _count(flights.dates),
+    }
+
+
+def _finalize_timeline(part: dict, metric: bool) -> dict:
+    months = sorted(part["months"])
+
+    return {
+        "flights_by_month": [{"month": month, "count": part["months"][month]} for month in months],
+        "distance_by_month": [{"month": month, "distance": _convert(part["distance"].get(month, 0), metric)}
+                              for month in months],
+        "flights_by_day": [{"date": date, "count": part["days"][date]} for date in sorted(part["days"])],
+    }
+
+
+def _summarize_records(flights: FlightSet) -> dict:
+    legs = list(zip(flights.distances, flights.durations, flights.origins, flights.destinations, flights.dates))
+    with_distance = [leg for leg in legs if leg[0] is not None and leg[0] > 0]
+    with_duration = [leg for leg in legs if leg[1] is not None and leg[1] > 0]
+
+    longest = max(with_distance, key=lambda leg: leg[0], default=None)
+    shortest = min(with_distance, key=lambda leg: leg[0], default=None)
+    longest_duration = max(with_duration, key=lambda leg: leg[1], default=None)
+
+    return {
+        "longest_distance": [longest[0], *longest[2:]] if longest else None,
+        "shortest_distance": [shortest[0], *shortest[2:]] if shortest else None,
+        "longest_duration": [longest_duration[1], *longest_duration[2:]] if longest_duration else None,
+        "days": _count(flights.dates),
+        "months": _count(flights.months),
+    }
+
+
+def _finalize_records(part: dict, metric: bool) -> dict:
+    result = {}
+
+    for key, field in (("longestDistance", "longest_distance"), ("shortestDistance", "shortest_distance")):
+        if part[field]:
+            distance, origin, destination, date = part[field]
+            result[key] = {"origin": origin, "destination": destination,
+                           "distance": _convert(distance, metric), "date": date}
+
+    if part["longest_duration"]:
+        duration, origin, destination, date = part["longest_duration"]
+        result["longestDuration"] = {"origin": origin, "destination": destination,
+                                     "duration": duration, "date": date}
+
+    if part["days"]:
+        (date, count), = _top(part["days"], 1)
+        result["mostFlightsInDay"] = {"date": date, "count": count}
+        (month, count), = _top(part["months"], 1)
+        result["busiestMonth"] = {"month": month, "count": count}
+
+    return {"records": result}
+
+
+def _summarize_costs(flights: FlightSet) -> dict:
+    total_by_currency = defaultdict(float)
+    per_km = defaultdict(lambda: [0.0, 0])
+    by_class: dict[str, dict[str, list]] = defaultdict(dict)
+
+    for cost, currency, distance, ticket_class in zip(flights.costs, flights.currencies,
+                                                      flights.distances, flights.classes):
+        # costs without a currency are left out of every figure
+        if cost is None or cost <= 0 or not currency:
+            continue
+
+        total_by_currency[currency] += cost
+        if distance is not None and distance > 0:
+            per_km[currency][0] += cost
+            per_km[currency][1] += distance
+        if ticket_class:
+            entry = by_class[ticket_class].setdefault(currency, [0.0, 0])
+            entry[0] += cost
+            entry[1] += 1
+
+    return {"totals": dict(total_by_currency), "per_km": dict(per_km), "by_class": dict(by_class)}
+
+
+def _finalize_costs(part: dict, metric: bool) -> dict:
+    averages = sorted(((ticket_class, currency, total / count)
+                       for ticket_class, currencies in part["by_class"].items()
+                       for currency, (total, count) in currencies.items()),
+                      key=lambda entry: entry[2], reverse=True)
+
+    return {
+        "total_cost": {currency: round(total, 2) for currency, total in _top(part["totals"])},
+        "cost_per_km": {currency: round(cost / distance, 2)
+                        for currency, (cost, distance) in sorted(part["per_km"].items())
+                        if distance > 0},
+        "avg_cost_by_class": [{"class": ticket_class, "currency": currency, "avg": round(avg, 2)}
+                              for ticket_class, currency, avg in averages],
+    }
+
+
+def _summarize_emissions(flights: FlightSet) -> dict:
+    # in grams: 90 g/km times the class factor is a whole number, so sums
+    # over any split of the flights are exact
+    co2_g = 0
+    total_distance = 0
+    total_duration = 0
+
+    for distance, duration, ticket_class in zip(flights.distances, flights.durations, flights.classes):
+        if distance is None or distance <= 0:
+            continue
+
+        co2_g += round(distance * CO2_G_PER_KM * CO2_CLASS_FACTOR.get(ticket_class, 1.0))
+        if duration is not None and duration > 0:
+            total_distance += distance
+            total_duration += duration
+
+    return {"co2_g": co2_g, "distance": total_distance, "duration": total_duration}
+
+
+def _finalize_emissions(part: dict, metric: bool) -> dict:
+    return {
+        "total_co2_kg": round(part["co2_g"] / 1000, 1),
+        "co2_trees_offset": None,
+        "co2_car_km_equivalent": None,
+        "avg_speed_kmh": round((part["distance"] / (part["duration"] / 60)), 1) if part["duration"] > 0 else 0,
+    }
+
+
+def _summarize_ratings(flights: FlightSet) -> dict:
+    rated = [rating for rating in flights.ratings if rating is not None]
+
+    by_airline = defaultdict(lambda: [0, 0])
+    for code, rating in zip(flights.airline_codes, flights.ratings):
+        if rating is not None and code is not None:
+            by_airline[code][0] += rating
+            by_airline[code][1] += 1
+
+    return {
+        "total": sum(rated),
+        "count": len(rated),
+        "distribution": {str(rating): n for rating, n in Counter(rated).items()},
+        "by_airline": dict(by_airline),
+    }
+
+
+def _finalize_ratings(part: dict, metric: bool) -> dict:
+    airlines = reference_data.airline_rows()
+
+    averages = sorted(((code, total / count, count) for code, (total, count) in part["by_airline"].items()
+                       if code in airlines),
+                      key=lambda entry: entry[1], reverse=True)[:10]
+    avg_rating = part["total"] / part["count"] if part["count"] else None
+
+    return {
+        "avg_rating": round(avg_rating, 1) if avg_rating else 0,
+        "rated_flights": part["count"],
+        "rating_by_airline": [{"airline": airlines[code][2], "avg": round(avg, 1), "count": count}
+                              for code, avg, count in averages],
+        "rating_distribution": {rating: part["distribution"][rating]
+                                for rating in sorted(part["distribution"], key=float)},
+    }
+
+
+def _parse_datetime(date: str, time: str) -> datetime.datetime:
+    try:
+        return datetime.datetime.fromisoformat(f"{date}T{time}")
+    except ValueError:
+        return datetime.datetime.strptime(f"{date} {time}", "%Y-%m-%d %H:%M")
+
+
+def _summarize_layovers(flights: FlightSet) -> dict:
+    layover_times = []
+    hub_counts: dict[str, int] = {}
+
+    for hub, arr_time, arr_date, dep_time, dep_date in zip(flights.destinations, flights.arrivals, flights.dates,
+                                                           flights.next_departures, flights.next_dates):
+        if arr_time is None or dep_time is None:
+            continue
+
+        try:
+            arr_dt = _parse_datetime(arr_date, arr_time)
+            dep_dt = _parse_datetime(dep_date, dep_time)
+            layover_min = int((dep_dt - arr_dt).total_seconds() / 60)
+            if layover_min > 0:
+                layover_times.append([layover_min, hub])
+                hub_counts[hub] = hub_counts.get(hub, 0) + 1
+        except (ValueError, TypeError):
+            continue
+
+    redeye_count = sum(1 for departure in flights.departures
+                       if departure is not None and (departure >= "21:00" or departure < "06:00"))
+
+    return {
+        "count": len(layover_times),
+        "minutes": sum(layover[0] for layover in layover_times),
+        "shortest": min(layover_times, key=lambda layover: layover[0], default=None),
+        "longest": max(layover_times, key=lambda layover: layover[0], default=None),
+        "hubs": hub_counts,
+        "redeye": redeye_count,
+    }
+
+
+def _finalize_layovers(part: dict, metric: bool) -> dict:
+    layover_stats = {}
+    if part["count"]:
+        layover_stats["avgMinutes"] = round(part["minutes"] / part["count"])
+        layover_stats["shortest"] = {"hub": part["shortest"][1], "minutes": part["shortest"][0]}
+        layover_stats["longest"] = {"hub": part["longest"][1], "minutes": part["longest"][0]}
+        layover_stats["count"] = part["count"]
+        busiest_hub = max(part["hubs"], key=part["hubs"].get)
+        layover_stats["busiestHub"] = {"icao": busiest_hub, "count": part["hubs"][busiest_hub]}
+
+    return {"layover_stats": layover_stats, "redeye_count": part["redeye"]}
+
+
+BLOCKS = [
+    Block("totals", {"count": SUM, "duration": SUM, "distance": SUM, "airports": SET, "visited": SET,
+                     "first_day": MIN, "last_day": MAX},
+          _summarize_totals, _finalize_totals),
+    Block("airports", {"visits": COUNTS, "endpoints": COUNTS, "seen": SET},
+          _summarize_airports, _finalize_airports),
+    Block("frequencies", {"seats": COUNTS, "classes": COUNTS, "airlines": COUNTS, "routes": COUNTS,
+                          "aircraft": COUNTS, "sides": COUNTS},
+          _summarize_frequencies, _finalize_frequencies),
+    Block("timeline", {"months": COUNTS, "distance": COUNTS, "days": COUNTS},
+          _summarize_timeline, _finalize_timeline),
+    Block("records", {"longest_distance": MAX, "shortest_distance": MIN, "longest_duration": MAX,
+                      "days": COUNTS, "months": COUNTS},
+          _summarize_records, _finalize_records),
+    Block("costs", {"totals": COUNTS, "per_km": COUNTS, "by_class": COUNTS},
+          _summarize_costs, _finalize_costs),
+    Block("emissions", {"co2_g": SUM, "distance": SUM, "duration": SUM},
+          _summarize_emissions, _finalize_emissions),
+    Block("ratings", {"total": SUM, "count": SUM, "distribution": COUNTS, "by_airline": COUNTS},
+          _summarize_ratings, _finalize_ratings),
+    Block("layovers", {"count": SUM, "minutes": SUM, "shortest": MIN, "longest": MAX, "hubs": COUNTS,
+                       "redeye": SUM},
+          _summarize_layovers, _finalize_layovers),
+]
+BLOCKS_BY_NAME = {block.name: block for block in BLOCKS}
+
+
+def timed(timings: dict[str, float] | None, name: str, function, *args):
+    """function(*args), adding its duration in seconds to timings[name]."""
+    if timings is None:
+        return function(*args)
+
+    begin = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - begin
+
+
+def summarize(flights: FlightSet,
+              blocks: list[str] | None = None,
+              timings: dict[str, float] | None = None) -> dict[str, dict]:
+    """The summary of a flight set: one part per block, keyed by block name.
+    Only the named blocks are summarized, all of them by default."""
+    names = blocks if blocks is not None else list(BLOCKS_BY_NAME)
+    return {name: timed(timings, name, BLOCKS_BY_NAME[name].summarize, flights) for name in names}
+
+
+def merge_summaries(a: dict[str, dict],
+                    b: dict[str, dict],
+                    timings: dict[str, float] | None = None) -> dict[str, dict]:
+    """The summary of the union of two disjoint flight sets. Like
+    Block.merge, the given summaries may be modified and reused."""
+    merged = dict(a)
+    for name, part in b.items():
+        merged[name] = timed(timings, name, BLOCKS_BY_NAME[name].merge, merged[name], part) if name in merged else part
+
+    return merged
+
+
+def compute_statistics(summary: dict[str, dict],
+                       metric: bool = True,
+                       blocks: list[str] | None = None,
+                       timings: dict[str, float] | None = None) -> dict:
+    """Values for the StatisticsModel fields of the named blocks (all of them
+    by default) computed from a summary. Blocks missing from the summary are
+    computed as if there were no flights."""
+    names = blocks if blocks is not None else list(BLOCKS_BY_NAME)
+
+    empty = None
+    statistics = {}
+    for name in names:
+        block = BLOCKS_BY_NAME[name]
+        part = summary.get(name)
+        if part is None:
+            empty = empty or FlightSet([])
+            part = block.summarize(empty)
+        statistics.update(timed(timings, name, block.finalize, part, metric))
+
+    return statistics
@@ -0,0 +1,100 @@
+"""Per-user cache of computed statistics.
+
+Entries are keyed by the user's data version and the request parameters.
+Every write to a user's flights calls invalidate(username), which bumps the
+version and drops the user's entries, so a stale result is never served. A
+result computed while a write happened is stored under the old version and
+simply never matches.
+
+VersionedCache keeps one value per user on the same versions, for structures
+built from all of a user's flights (analytics cubes, map cluster indexes).
+"""
+
+import threading
+from collections import OrderedDict
+
+MAX_ENTRIES_PER_USER = 32
+
+
+class StatisticsCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+        self._entries: dict[str, OrderedDict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, username: str) -> int:
+        return self._versions.get(username, 0)
+
+    def get(self, username: str, key: tuple):
+        with self._lock:
+            entries = self._entries.get(username)
+            value = entries.get((self.version(username), key)) if entries else None
+
+            if value is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entries.move_to_end((self.version(username), key))
+            return value
+
+    def store(self, username: str, version: int, key: tuple, value) -> None:
+        with self._lock:
+            if version != self.version(username):
+                return  # the flights changed while computing
+
+            entries = self._entries.setdefault(username, OrderedDict())
+            entries[(version, key)] = value
+            while len(entries) > MAX_ENTRIES_PER_USER:
+                entries.popitem(last=False)
+
+    def invalidate(self, *usernames: str) -> None:
+        with self._lock:
+            for username in usernames:
+                self._versions[username] = self.version(username) + 1
+                self._entries.pop(username, None)
+
+    def invalidate_all(self) -> None:
+        with self._lock:
+            for username in set(self._versions) | set(self._entries):
+                self._versions[username] = self.version(username) + 1
+            self._entries.clear()
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(entries) for entries in self._entries.values())
+
+
+statistics_cache = StatisticsCache()
+
+
+class VersionedCache:
+    """The values of the max_users most recently used users, each valid
+    until the user's data version changes."""
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._lock = threading.Lock()
+        self._values: OrderedDict[str, tuple[int, object]] = OrderedDict()
+
+    def get(self, username: str):
+        """The user's value, or None if missing or built before a write."""
+        version = statistics_cache.version(username)
+
+        with self._lock:
+            entry = self._values.get(username)
+            if entry is None or entry[0] != version:
+                return None
+            self._values.move_to_end(username)
+            return entry[1]
+
+    def store(self, username: str, version: int, value) -> None:
+        """Keep a value built from the user's data at a version (taken
+        before reading it)."""
+        with self._lock:
+            self._values[username] = (version, value)
+            self._values.move_to_end(username)
+            while len(self._values) > self.max_users:
+                self._values.popitem(last=False)
@@ -0,0 +1,102 @@
+"""The world countries GeoJSON, serialized and compressed once.
+
+The geometry is the same for every user and only changes with a release,
+so it is read the first time it is requested and kept as compact JSON
+bytes along with their gzip (and brotli, when installed) encodings and a
+strong ETag derived from their content. Which countries a user visited is
+served separately and overlaid by the client.
+
+Besides the full geometry, scripts/simplify_world.py generates simplified
+versions for lower zoom levels, with borders shared by neighbouring
+countries simplified once so they still meet, coordinates rounded to a
+coarser grid and only the properties the client uses.
+"""
+
+import gzip
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DATA_PATH = Path(__file__).parent.parent.parent / 'data'
+WORLD_GEOJSON_PATH = DATA_PATH / 'world.geo.json'
+
+FULL_RESOLUTION = "full"
+# name: (zoom levels it is served below, simplification tolerance in
+# degrees, decimals kept), from the coarsest
+RESOLUTIONS = {
+    "low": (2.5, 0.2, 2),
+    "medium": (4.5, 0.05, 3),
+    "high": (7.0, 0.01, 3),
+}
+SIMPLIFIED_PROPERTIES = ("name", "subunit", "iso_a2", "iso_a3", "continent")
+
+
+def geojson_path(resolution: str) -> Path:
+    if resolution == FULL_RESOLUTION:
+        return WORLD_GEOJSON_PATH
+    return DATA_PATH / f'world.{resolution}.geo.json'
+
+
+def resolution_for_zoom(zoom: float) -> str:
+    for name, (max_zoom, _, _) in RESOLUTIONS.items():
+        if zoom < max_zoom:
+            return name
+    return FULL_RESOLUTION
+
+
+class EncodedDocument:
+    def __init__(self, body: bytes):
+        self.encodings = {"identity": body, "gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings["br"] = brotli.compress(body, quality=11)
+
+        # strong ETags identify the exact bytes, so each encoding has its own
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags = {name: f'"{digest}"' if name == "identity" else f'"{digest}-{name}"'
+                      for name in self.encodings}
+
+    def negotiate(self, accept_encoding: str | None) -> str:
+        """The smallest encoding the client accepts ('identity' if none)."""
+        accepted = set()
+        for part in (accept_encoding or "").split(","):
+            name, *params = [param.strip() for param in part.split(";")]
+            quality = next((param[2:] for param in params if param.startswith("q=")), "1")
+            try:
+                if float(quality) <= 0:
+                    continue
+            except ValueError:
+                continue
+            accepted.add(name.lower())
+
+        candidates = [name for name in self.encodings if name in accepted or "*" in accepted]
+        return min(candidates, key=lambda name: len(self.encodings[name]), default="identity")
+
+    def matches(self, if_none_match: str | None) -> bool:
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or any(etag in tags for etag in self.etags.values())
+
+
+_lock = threading.Lock()
+_worlds: dict[str, EncodedDocument] = {}
+
+
+def get_world(resolution: str = FULL_RESOLUTION) -> EncodedDocument:
+    """The world geometry at one of RESOLUTIONS (or full), the full one if
+    the simplified file has not been generated."""
+    with _lock:
+        if resolution not in _worlds:
+            path = geojson_path(resolution)
+            if not path.exists():
+                path = WORLD_GEOJSON_PATH
+            geojson = json.loads(path.read_text(encoding="utf-8"))
+            _worlds[resolution] = EncodedDocument(json.dumps(geojson, separators=(",", ":"), ensure_ascii=False).encode())
+
+        return _worlds[resolution]
@@ -60,6 +60,12 @@ app.include_router(metrics.router)
 def startup_event():
     init_db()
 
+    # build the airports spatial index and the autocomplete indexes now
+    # rather than on the first lookup
+    from server.internal import airport_index, autocomplete
+    airport_index.get_index()
+    autocomplete.build_all()
+
 
 @app.get("/config")
 async def get_config(request: Request):
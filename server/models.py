@@ -2,6 +2,7 @@ import datetime
 import time
 from pydantic import BaseModel, ConfigDict, field_validator
 from enum import Enum
+from typing import get_args
 
 
 #  camel case convertion
@@ -18,10 +19,31 @@ class CamelableModel(BaseModel):
     )
 
 
+def _coerce(annotation, value):
+    if value is None:
+        return None
+
+    types = get_args(annotation) or (annotation,)
+    if type(value) in types:
+        return value
+
+    for t in types:
+        if t == datetime.datetime and type(value) == str:
+            return datetime.datetime.fromisoformat(value)
+        if t == datetime.date and type(value) == str:
+            return datetime.date.fromisoformat(value)
+        if isinstance(t, type) and issubclass(t, Enum):
+            return t(value)
+        if t in (bool, float) and type(value) == int:
+            return t(value)
+
+    return value
+
+
 # abstract model
 class CustomModel(CamelableModel):
     @classmethod
-    def from_database(cls, db: tuple, explicit: dict | None = None):
+    def from_database(cls, db: tuple, explicit: dict | None = None, trusted: bool = False):
         columns = cls.get_attributes()
         values = {}
 
@@ -36,10 +58,24 @@ class CustomModel(CamelableModel):
             for attr in explicit:
                 values[attr] = explicit[attr]
 
+        if trusted:
+            return cls.construct_trusted(values)
+
         instance = cls(**values)
 
         return instance
 
+    @classmethod
+    def construct_trusted(cls, values: dict):
+        # for rows read straight from the database: skip the validators
+        # (which would query the database again for every row) and only
+        # apply the type conversions pydantic would otherwise have done
+        for attr, value in values.items():
+            if attr in cls.model_fields:
+                values[attr] = _coerce(cls.model_fields[attr].annotation, value)
+
+        return cls.model_construct(**values)
+
     @classmethod
     def get_attributes(cls, ignore: list = []) -> list[str]:
         attributes = list(cls.__fields__.keys())
@@ -151,16 +187,9 @@ class AirportModel(CustomModel):
         if v == None:
             return None
 
-        from server.db.session import SessionLocal
-        from server.db.models import Airport
-        from sqlalchemy import func
-
-        with SessionLocal() as session:
-            result = session.query(Airport.icao).filter(
-                func.lower(Airport.icao) == func.lower(v)
-            ).first()
+        from server.internal.reference_data import airport_exists
 
-        if not result:
+        if not airport_exists(v):
             raise ValueError(f"must have valid ICAO code, got '{v}'")
 
         return v
@@ -177,16 +206,9 @@ class AirlineModel(CustomModel):
         if v == None:
             return None
 
-        from server.db.session import SessionLocal
-        from server.db.models import Airline
-        from sqlalchemy import func
-
-        with SessionLocal() as session:
-            result = session.query(Airline.icao).filter(
-                func.lower(Airline.icao) == func.lower(v)
-            ).first()
+        from server.internal.reference_data import airline_exists
 
-        if not result:
+        if not airline_exists(v):
             raise ValueError(f"must have valid ICAO code, got '{v}'")
 
         return v
@@ -1,9 +1,7 @@
-from server.db.session import get_db
-from server.db.models import Airline
 from server.models import AirlineModel
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from server.internal import autocomplete, reference_data
+from server.internal.reference_data import AIRLINE_COLUMNS
+from fastapi import APIRouter, HTTPException
 
 router = APIRouter(
     prefix="/airlines",
@@ -13,29 +11,18 @@ router = APIRouter(
 
 
 @router.get("", status_code=200)
-async def get_airlines(q: str, db: Session = Depends(get_db)) -> list[AirlineModel]:
-    lower_q = q.lower()
-
-    results = db.query(Airline).filter(
-        (func.lower(Airline.name).like(f"%{lower_q}%")) |
-        (func.lower(Airline.icao).like(f"%{lower_q}%")) |
-        (func.lower(Airline.iata).like(f"%{lower_q}%"))
-    ).order_by(
-        (func.lower(Airline.name) == lower_q).desc(),
-        func.length(Airline.name).asc(),
-        (func.lower(Airline.icao) == lower_q).desc(),
-        (func.lower(Airline.iata) == lower_q).desc(),
-    ).limit(5).all()
-
-    airlines = [AirlineModel.model_validate(al) for al in results]
+async def get_airlines(q: str) -> list[AirlineModel]:
+    results = autocomplete.get_index(autocomplete.AIRLINES).search(q.lower(), k=5)
+
+    airlines = [AirlineModel.model_validate(dict(zip(AIRLINE_COLUMNS, row))) for row in results]
     return airlines
 
 
 @router.get("/{icao}", status_code=200)
-async def get_airline_from_icao(icao: str, db: Session = Depends(get_db)) -> AirlineModel:
-    result = db.query(Airline).filter(func.lower(Airline.icao) == func.lower(icao)).first()
+async def get_airline_from_icao(icao: str) -> AirlineModel:
+    result = reference_data.get_airline(icao)
 
     if not result:
         raise HTTPException(status_code=404, detail=f"No airline with ICAO '{icao}' found")
 
-    return AirlineModel.model_validate(result)
+    return result
@@ -1,9 +1,7 @@
-from server.db.session import get_db
-from server.db.models import Airport
-from server.models import AirportModel
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from server.models import AirportModel, AirportType
+from server.internal import airport_index, autocomplete, reference_data
+from server.internal.reference_data import AIRPORT_COLUMNS
+from fastapi import APIRouter, HTTPException
 
 router = APIRouter(
     prefix="/airports",
@@ -13,34 +11,78 @@ router = APIRouter(
 
 
 @router.get("", status_code=200)
-async def get_airports(q: str, db: Session = Depends(get_db)) -> list[AirportModel]:
-    like_q = f"%{q}%"
-    lower_q = q.lower()
-
-    results = db.query(Airport).filter(
-        (func.lower(Airport.iata).like(f"%{lower_q}%")) |
-        (func.lower(Airport.name).like(f"%{lower_q}%")) |
-        (func.lower(Airport.municipality).like(f"%{lower_q}%")) |
-        (func.lower(Airport.region).like(f"%{lower_q}%")) |
-        (func.lower(Airport.icao).like(f"%{lower_q}%"))
-    ).order_by(
-        (func.lower(Airport.iata) == lower_q).desc(),
-        (func.lower(Airport.name) == lower_q).desc(),
-        func.length(Airport.name).asc(),
-        (func.lower(Airport.municipality) == lower_q).desc(),
-        (func.lower(Airport.region).like(f"%{lower_q}%")).desc(),
-        (func.lower(Airport.icao) == lower_q).desc(),
-    ).limit(5).all()
-
-    airports = [AirportModel.model_validate(ap) for ap in results]
+async def get_airports(q: str) -> list[AirportModel]:
+    results = autocomplete.get_index(autocomplete.AIRPORTS).search(q.lower(), k=5)
+
+    airports = [AirportModel.model_validate(dict(zip(AIRPORT_COLUMNS, row))) for row in results]
     return airports
 
 
+class NearbyAirportModel(AirportModel):
+    distance: float  # km
+
+
+def _check_location(lat: float, lon: float) -> None:
+    if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+        raise HTTPException(status_code=400, detail="Latitude must be within [-90, 90] and longitude within [-180, 180]")
+
+
+def _parse_types(type: str | None) -> set[str] | None:
+    """Airport types in a comma separated list."""
+    if not type:
+        return None
+
+    types = {name.strip() for name in type.split(",") if name.strip()}
+    known = [airport_type.value for airport_type in AirportType]
+    for name in types:
+        if name not in known:
+            raise HTTPException(status_code=400,
+                                detail=f"Unknown airport type '{name}', expected one of: {', '.join(known)}")
+    return types
+
+
+def _with_distances(found: list[tuple[tuple, float]]) -> list[NearbyAirportModel]:
+    return [NearbyAirportModel.construct_trusted({**dict(zip(AIRPORT_COLUMNS, row)), "distance": round(distance, 1)})
+            for row, distance in found]
+
+
+@router.get("/nearby", status_code=200)
+async def get_nearby_airports(lat: float,
+                              lon: float,
+                              radius: float = 50,
+                              type: str | None = None,
+                              limit: int = 50) -> list[NearbyAirportModel]:
+    """Airports within radius km of a location, closest first, optionally
+    only of the given (comma separated) types."""
+    _check_location(lat, lon)
+    if radius <= 0 or radius > 2000:
+        raise HTTPException(status_code=400, detail="Radius must be within (0, 2000] km")
+
+    found = airport_index.get_index().within(lat, lon, radius, _parse_types(type))
+    return _with_distances(found[:max(limit, 0)])
+
+
+@router.get("/nearest", status_code=200)
+async def get_nearest_airports(lat: float,
+                               lon: float,
+                               k: int = 5,
+                               type: str | None = None,
+                               max_distance: float | None = None) -> list[NearbyAirportModel]:
+    """The k airports closest to a location, closest first, optionally only
+    of the given (comma separated) types and within max_distance km."""
+    _check_location(lat, lon)
+    if k < 1 or k > 100:
+        raise HTTPException(status_code=400, detail="k must be within [1, 100]")
+
+    found = airport_index.get_index().nearest(lat, lon, k, _parse_types(type), max_distance)
+    return _with_distances(found)
+
+
 @router.get("/{icao}", status_code=200)
-async def get_airport_from_icao(icao: str, db: Session = Depends(get_db)) -> AirportModel:
-    result = db.query(Airport).filter(func.lower(Airport.icao) == func.lower(icao)).first()
+async def get_airport_from_icao(icao: str) -> AirportModel:
+    result = reference_data.get_airport(icao)
 
     if not result:
         raise HTTPException(status_code=404, detail=f"No airport with ICAO '{icao}' found")
 
-    return AirportModel.model_validate(result)
+    return result
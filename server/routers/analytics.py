@@ -1,10 +1,12 @@
-from server.db.session import get_db
+from server.db.session import fetch_all, get_async_db, run_sync
 from server.db.models import Flight, Airport, Airline
-from server.models import User
+from server.models import CamelableModel, User, camel_case
 from server.auth.users import get_current_user
+from server.internal import analytics_cube, rollups
 
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 import datetime
 
@@ -23,21 +25,27 @@ def _build_filters(username: str,
     params: dict = {"username": username}
 
     if start:
-        clauses.append("JULIANDAY(f.date) >= JULIANDAY(:start)")
-        params["start"] = str(start)
+        clauses.append("f.date_day >= :start")
+        params["start"] = start.toordinal()
     if end:
-        clauses.append("JULIANDAY(f.date) <= JULIANDAY(:end)")
-        params["end"] = str(end)
+        clauses.append("f.date_day <= :end")
+        params["end"] = end.toordinal()
 
     return "WHERE " + " AND ".join(clauses), params
 
 
+def _split_airlines(airlines: str | None) -> list[str]:
+    """Airline codes collected with GROUP_CONCAT (which skips NULLs). Codes
+    are ICAO designators, so they never contain the ',' separator."""
+    return airlines.split(",") if airlines else []
+
+
 @router.get("/routes", status_code=200)
 async def get_route_analytics(username: str | None = None,
                               start: datetime.date | None = None,
                               end: datetime.date | None = None,
                               user: User = Depends(get_current_user),
-                              db: Session = Depends(get_db)):
+                              db: AsyncSession = Depends(get_async_db)):
     """
     Returns top routes with frequency, total distance, average duration,
     and the set of airlines that have operated each route.
@@ -45,46 +53,34 @@ async def get_route_analytics(username: str | None = None,
     filter_username = username if username else user.username
     filters, params = _build_filters(filter_username, start, end)
 
-    # Get route counts, total distance, average duration
-    res = db.execute(text(f"""
+    # Get route counts, total distance, average duration and the airlines
+    # of each route in one grouped query
+    res = await fetch_all(db, text(f"""
         SELECT f.origin,
                f.destination,
                COUNT(*) AS count,
                COALESCE(SUM(f.distance), 0) AS total_distance,
-               COALESCE(ROUND(AVG(f.duration)), 0) AS avg_duration
+               COALESCE(ROUND(AVG(f.duration)), 0) AS avg_duration,
+               GROUP_CONCAT(DISTINCT f.airline) AS airlines
         FROM flights f
         {filters}
         GROUP BY f.origin, f.destination
         ORDER BY count DESC;
-    """), params).fetchall()
+    """), params)
 
     routes = []
     for r in res:
-        origin = r[0]
-        destination = r[1]
-
-        # Get distinct airlines for this route
-        airline_res = db.execute(text(f"""
-            SELECT DISTINCT f.airline
-            FROM flights f
-            {filters}
-            AND f.origin = :route_origin
-            AND f.destination = :route_dest
-            AND f.airline IS NOT NULL;
-        """), {**params, "route_origin": origin, "route_dest": destination}).fetchall()
-
-        airlines = [row[0] for row in airline_res]
-
         routes.append({
-            "origin": origin,
-            "destination": destination,
+            "origin": r[0],
+            "destination": r[1],
             "count": r[2],
             "totalDistance": r[3],
             "avgDuration": r[4],
-            "airlines": airlines,
+            "airlines": _split_airlines(r[5]),
         })
 
-    return routes
+    # already serialized, so skip the response model
+    return JSONResponse(routes)
 
 
 @router.get("/airports", status_code=200)
@@ -92,7 +88,7 @@ async def get_airport_analytics(username: str | None = None,
                                 start: datetime.date | None = None,
                                 end: datetime.date | None = None,
                                 user: User = Depends(get_current_user),
-                                db: Session = Depends(get_db)):
+                                db: AsyncSession = Depends(get_async_db)):
     """
     Returns airport visit statistics: total visits, as origin, as destination,
     airlines seen, first and last visit dates.
@@ -100,8 +96,9 @@ async def get_airport_analytics(username: str | None = None,
     filter_username = username if username else user.username
     filters, params = _build_filters(filter_username, start, end)
 
-    # Combine origin and destination visits into a single result set
-    res = db.execute(text(f"""
+    # Combine origin and destination visits into a single result set, with
+    # the airport names joined in and the airlines collected per airport
+    res = await fetch_all(db, text(f"""
         WITH airport_visits AS (
             SELECT f.origin AS icao, 'origin' AS role, f.date, f.airline
             FROM flights f
@@ -118,44 +115,30 @@ async def get_airport_analytics(username: str | None = None,
                SUM(CASE WHEN av.role = 'origin' THEN 1 ELSE 0 END) AS as_origin,
                SUM(CASE WHEN av.role = 'destination' THEN 1 ELSE 0 END) AS as_destination,
                MIN(av.date) AS first_visit,
-               MAX(av.date) AS last_visit
+               MAX(av.date) AS last_visit,
+               COALESCE(a.name, av.icao) AS name,
+               GROUP_CONCAT(DISTINCT av.airline) AS airlines
         FROM airport_visits av
+        LEFT JOIN airports a ON a.icao = av.icao
         GROUP BY av.icao
         ORDER BY visits DESC;
-    """), params).fetchall()
+    """), params)
 
     airports = []
     for r in res:
-        icao = r[0]
-
-        # Look up airport name
-        airport_row = db.execute(text("""
-            SELECT name FROM airports WHERE icao = :icao;
-        """), {"icao": icao}).fetchone()
-        name = airport_row[0] if airport_row else icao
-
-        # Get distinct airlines at this airport
-        airline_res = db.execute(text(f"""
-            SELECT DISTINCT f.airline
-            FROM flights f
-            {filters}
-            AND (f.origin = :icao OR f.destination = :icao)
-            AND f.airline IS NOT NULL;
-        """), {**params, "icao": icao}).fetchall()
-        airlines = [row[0] for row in airline_res]
-
         airports.append({
-            "icao": icao,
-            "name": name,
+            "icao": r[0],
+            "name": r[6],
             "visits": r[1],
             "asOrigin": r[2],
             "asDestination": r[3],
-            "airlines": airlines,
+            "airlines": _split_airlines(r[7]),
             "firstVisit": r[4],
             "lastVisit": r[5],
         })
 
-    return airports
+    # already serialized, so skip the response model
+    return JSONResponse(airports)
 
 
 @router.get("/aircraft", status_code=200)
@@ -163,46 +146,36 @@ async def get_aircraft_analytics(username: str | None = None,
                                  start: datetime.date | None = None,
                                  end: datetime.date | None = None,
                                  user: User = Depends(get_current_user),
-                                 db: Session = Depends(get_db)):
+                                 db: AsyncSession = Depends(get_async_db)):
     """
     Returns aircraft type statistics: count, total distance, and airlines.
     """
     filter_username = username if username else user.username
     filters, params = _build_filters(filter_username, start, end)
 
-    res = db.execute(text(f"""
+    res = await fetch_all(db, text(f"""
         SELECT f.airplane,
                COUNT(*) AS count,
-               COALESCE(SUM(f.distance), 0) AS total_distance
+               COALESCE(SUM(f.distance), 0) AS total_distance,
+               GROUP_CONCAT(DISTINCT f.airline) AS airlines
         FROM flights f
         {filters}
         AND f.airplane IS NOT NULL
         GROUP BY f.airplane
         ORDER BY count DESC;
-    """), params).fetchall()
+    """), params)
 
     aircraft = []
     for r in res:
-        airplane_type = r[0]
-
-        # Get distinct airlines for this aircraft type
-        airline_res = db.execute(text(f"""
-            SELECT DISTINCT f.airline
-            FROM flights f
-            {filters}
-            AND f.airplane = :airplane
-            AND f.airline IS NOT NULL;
-        """), {**params, "airplane": airplane_type}).fetchall()
-        airlines = [row[0] for row in airline_res]
-
         aircraft.append({
-            "type": airplane_type,
+            "type": r[0],
             "count": r[1],
             "totalDistance": r[2],
-            "airlines": airlines,
+            "airlines": _split_airlines(r[3]),
         })
 
-    return aircraft
+    # already serialized, so skip the response model
+    return JSONResponse(aircraft)
 
 
 @router.get("/tail-numbers", status_code=200)
@@ -210,14 +183,14 @@ async def get_tail_number_analytics(username: str | None = None,
                                     start: datetime.date | None = None,
                                     end: datetime.date | None = None,
                                     user: User = Depends(get_current_user),
-                                    db: Session = Depends(get_db)):
+                                    db: AsyncSession = Depends(get_async_db)):
     """
     Returns tail number tracking: count, aircraft type, airline, first and last flight.
     """
     filter_username = username if username else user.username
     filters, params = _build_filters(filter_username, start, end)
 
-    res = db.execute(text(f"""
+    res = await fetch_all(db, text(f"""
         SELECT f.tail_number,
                COUNT(*) AS count,
                f.airplane,
@@ -229,7 +202,7 @@ async def get_tail_number_analytics(username: str | None = None,
         AND f.tail_number IS NOT NULL
         GROUP BY f.tail_number
         ORDER BY count DESC;
-    """), params).fetchall()
+    """), params)
 
     tail_numbers = []
     for r in res:
@@ -242,7 +215,8 @@ async def get_tail_number_analytics(username: str | None = None,
             "lastFlight": r[5],
         })
 
-    return tail_numbers
+    # already serialized, so skip the response model
+    return JSONResponse(tail_numbers)
 
 
 @router.get("/heatmap", status_code=200)
@@ -251,32 +225,119 @@ async def get_heatmap(year: int | None = None,
                       start: datetime.date | None = None,
                       end: datetime.date | None = None,
                       user: User = Depends(get_current_user),
-                      db: Session = Depends(get_db)):
+                      db: AsyncSession = Depends(get_async_db)):
     """
     Returns flight count per day for the heatmap calendar.
     Optionally filter by year (returns only that year's data).
     """
     filter_username = username if username else user.username
-    filters, params = _build_filters(filter_username, start, end)
 
-    # If year is specified and no explicit start/end, add year filter
+    # If year is specified and no explicit start/end, filter on that year
     if year and not start and not end:
-        filters += " AND strftime('%Y', f.date) = :year"
-        params["year"] = str(year)
+        start = datetime.date(year, 1, 1)
+        end = datetime.date(year, 12, 31)
 
-    res = db.execute(text(f"""
-        SELECT f.date, COUNT(*) AS count
-        FROM flights f
-        {filters}
-        GROUP BY f.date
-        ORDER BY f.date;
-    """), params).fetchall()
+    # per-day counts are part of the timeline rollups
+    await rollups.ensure_fresh(db, filter_username)
+    summary = await run_sync(db, rollups.summarize_range, filter_username,
+                             start.toordinal() if start else None,
+                             end.toordinal() if end else None,
+                             blocks=["timeline"])
+    days = summary["timeline"]["days"] if "timeline" in summary else {}
 
     heatmap = []
-    for r in res:
+    for date in sorted(days):
         heatmap.append({
-            "date": r[0],
-            "count": r[1],
+            "date": date,
+            "count": days[date],
         })
 
-    return heatmap
+    # already serialized, so skip the response model
+    return JSONResponse(heatmap)
+
+
+@router.get("/timeseries", status_code=200)
+async def get_timeseries(measure: str = "count",
+                         bucket: str = "month",
+                         window: int | None = None,
+                         cumulative: bool = False,
+                         username: str | None = None,
+                         start: datetime.date | None = None,
+                         end: datetime.date | None = None,
+                         user: User = Depends(get_current_user),
+                         db: AsyncSession = Depends(get_async_db)):
+    """
+    Returns a measure (count, distance, duration, cost or co2 in kg) per
+    day, week, month, quarter or year, with empty buckets included.
+    window=12 adds the trailing total over 12 buckets as "rolling" and
+    cumulative=true the running total as "cumulative".
+    """
+    filter_username = username if username else user.username
+
+    try:
+        cube = await run_sync(db, analytics_cube.get_cube, filter_username)
+        return analytics_cube.timeseries(cube, measure, bucket, window, cumulative,
+                                         start.toordinal() if start else None,
+                                         end.toordinal() if end else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+# groups returned unless the query asks for more, a pivot over two large
+# dimensions can have a group per flight
+DEFAULT_LIMIT = 1000
+
+
+class AnalyticsQuery(CamelableModel):
+    """A group-by over the user's flights. Dimensions and filter keys are
+    among analytics_cube.DIMENSIONS (snake or camel case), measures are
+    'count', '<sum|avg|min|max|count>:<distance|duration|cost|rating>' or
+    'distinct:<dimension>'. Filters map a dimension to its accepted values.
+    A null or negative limit returns every group."""
+    dimensions: list[str] = []
+    measures: list[str] = ["count"]
+    filters: dict[str, list] = {}
+    start: datetime.date | None = None
+    end: datetime.date | None = None
+    order_by: str | None = None
+    descending: bool = True
+    limit: int | None = DEFAULT_LIMIT
+
+
+def _snake_case(name: str) -> str:
+    return "".join(f"_{c.lower()}" if c.isupper() else c for c in name)
+
+
+@router.post("/query", status_code=200)
+async def query_analytics(query: AnalyticsQuery,
+                          username: str | None = None,
+                          user: User = Depends(get_current_user),
+                          db: AsyncSession = Depends(get_async_db)):
+    """
+    Runs an arbitrary group-by over an in-memory columnar snapshot of the
+    user's flights. Rows are ordered by order_by (a dimension or measure,
+    by default the first measure) and contain one key per dimension and
+    measure, e.g. {"airline": "BAW", "count": 12, "sumDistance": 40211}.
+    """
+    filter_username = username if username else user.username
+
+    try:
+        dimensions = [_snake_case(name) for name in query.dimensions]
+        filters = {_snake_case(name): values for name, values in query.filters.items()}
+        measures = [analytics_cube.Measure.parse(_snake_case(spec)) for spec in query.measures]
+
+        order_by = _snake_case(query.order_by) if query.order_by else measures[0].name if measures else None
+        limit = query.limit if query.limit is not None and query.limit >= 0 else None
+
+        cube = await run_sync(db, analytics_cube.get_cube, filter_username)
+        groups, rows = analytics_cube.query(cube, dimensions, measures, filters,
+                                            query.start.toordinal() if query.start else None,
+                                            query.end.toordinal() if query.end else None,
+                                            order_by, query.descending, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "groups": groups,
+        "rows": [{camel_case(key): value for key, value in row.items()} for row in rows],
+    }
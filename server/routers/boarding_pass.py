@@ -134,15 +134,10 @@ def _parse_leg(raw: str, offset: int, is_first: bool) -> tuple[dict, int]:
     # Resolve airline IATA to ICAO
     airline_icao = None
     if carrier_iata:
-        from server.db.session import SessionLocal
-        from server.db.models import Airline as AirlineDB
-        from sqlalchemy import func as sqla_func
-        with SessionLocal() as session:
-            airline_row = session.query(AirlineDB).filter(
-                sqla_func.lower(AirlineDB.iata) == carrier_iata.lower()
-            ).first()
-            if airline_row:
-                airline_icao = airline_row.icao
+        from server.internal.reference_data import get_airline_by_iata
+        airline = get_airline_by_iata(carrier_iata)
+        if airline:
+            airline_icao = airline.icao
 
     return {
         "pnr": pnr,
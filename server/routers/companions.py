@@ -265,8 +265,8 @@ async def get_companion_profile(
                f.distance, f.duration, o.country, d.country
         FROM flights f
         JOIN flight_companions fc ON fc.flight_id = f.id
-        JOIN airports o ON UPPER(f.origin) = o.icao
-        JOIN airports d ON UPPER(f.destination) = d.icao
+        JOIN airports o ON f.origin = o.icao
+        JOIN airports d ON f.destination = d.icao
         WHERE fc.companion_id = :cid AND f.username = :username
         ORDER BY f.date DESC, f.departure_time DESC
     """), {"cid": companion_id, "username": user.username}).fetchall()
@@ -1,19 +1,23 @@
+import base64
 import json
 import datetime
 import math
 import os
-import sqlite3
 
 import pytz
 
-from server.db.session import get_db, SessionLocal
-from server.db.models import Flight, Airport, Airline as AirlineDB, AuditLog
+from server.db import workers
+from server.db.session import fetch_all, get_async_db, get_db
+from server.db.models import Flight, Airline as AirlineDB, AuditLog
 from server.environment import ENABLE_EXTERNAL_APIS, DATA_PATH, FLIGHTERA_API_KEY
-from server.models import AirlineModel, AirportModel, ClassType, CustomModel, FlightModel, AircraftSide, FlightPurpose, SeatType, User
+from server.models import AirlineModel, AirportModel, CamelableModel, ClassType, CustomModel, camel_case, FlightModel, AircraftSide, FlightPurpose, SeatType, User
 from server.auth.users import get_current_user
+from server.internal import reference_data
+from server.internal.stats_cache import statistics_cache
 
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import func, text
 from enum import Enum
@@ -44,7 +48,140 @@ class Sort(str, Enum):
     DISTANCE = "distance"
 
 
-async def check_flight_authorization(id: int, user: User, db: Session) -> None:
+# sort keys in ORDER BY order, the id makes every key unique
+SORT_KEYS = {
+    Sort.DATE: ["f.date_day", "f.departure_time", "f.id"],
+    Sort.SEAT: ["f.seat", "f.id"],
+    Sort.AIRCRAFT_SIDE: ["f.aircraft_side", "f.id"],
+    Sort.TICKET_CLASS: ["f.ticket_class", "f.id"],
+    Sort.DURATION: ["f.duration", "f.id"],
+    Sort.DISTANCE: ["f.distance", "f.id"],
+}
+# date_day is nullable (until a write or the startup backfill fills it in),
+# so only the id can skip the IS NULL alternatives
+NOT_NULL_KEYS = {"f.id"}
+
+
+class FlightPage(CamelableModel):
+    flights: list[FlightModel]
+    next_cursor: str | None = None
+
+
+def encode_cursor(sort: Sort, order: Order, keys: list) -> str:
+    data = json.dumps({"sort": sort.value, "order": order.value, "keys": keys})
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: Sort, order: Order) -> list:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        keys = data["keys"]
+
+        assert data["sort"] == sort.value and data["order"] == order.value
+        assert type(keys) == list and len(keys) == len(SORT_KEYS[sort])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor for this sort and order")
+
+    return keys
+
+
+def keyset_clause(columns: list[str], values: list, order: Order, params: dict) -> str:
+    """SQL condition for the rows that come after `values` when ordering by
+    `columns` in `order`. SQLite sorts NULLs as the smallest values, so they
+    come first when ascending and last when descending."""
+    for i, value in enumerate(values):
+        params[f"cursor{i}"] = value
+
+    def equal(i: int) -> str:
+        return f"{columns[i]} IS NULL" if values[i] is None else f"{columns[i]} = :cursor{i}"
+
+    def after(i: int) -> str | None:
+        column, value = columns[i], values[i]
+
+        if order == Order.ASCENDING:
+            return f"{column} IS NOT NULL" if value is None else f"{column} > :cursor{i}"
+        if value is None:
+            return None  # nothing sorts below NULL
+        if column in NOT_NULL_KEYS:
+            return f"{column} < :cursor{i}"
+        return f"({column} < :cursor{i} OR {column} IS NULL)"
+
+    alternatives = []
+    for i in range(len(columns)):
+        condition = after(i)
+        if condition:
+            alternatives.append(" AND ".join([equal(j) for j in range(i)] + [condition]))
+
+    # redundant bound on the leading key, so that SQLite can seek the index to it
+    column, value = columns[0], values[0]
+    if value is None:
+        bound = "1" if order == Order.ASCENDING else f"{column} IS NULL"
+    elif order == Order.ASCENDING:
+        bound = f"{column} >= :cursor0"
+    elif column in NOT_NULL_KEYS:
+        bound = f"{column} <= :cursor0"
+    else:
+        bound = f"({column} <= :cursor0 OR {column} IS NULL)"
+
+    return f"{bound} AND ({' OR '.join(alternatives)})"
+
+
+def parse_fields(fields: str) -> set[str]:
+    """Flight attributes named in a comma separated list (snake or camel case)."""
+    attributes = {camel_case(attr): attr for attr in FlightModel.get_attributes()}
+    attributes.update({attr: attr for attr in FlightModel.get_attributes()})
+
+    selected = {"id"}
+    for name in fields.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in attributes:
+            raise HTTPException(status_code=400, detail=f"Unknown flight field '{name}'")
+        selected.add(attributes[name])
+
+    return selected
+
+
+def project_flights(flights: list[FlightModel], fields: set[str] | None, compact: bool) -> dict:
+    """Serialize flights with only the selected fields. In compact mode the
+    flights reference airports and airlines by ICAO code, and each referenced
+    airport and airline is included once in the `airports`/`airlines` tables."""
+    references = {"origin", "destination", "airline"}
+    include = fields if fields else set(FlightModel.get_attributes())
+
+    airports: dict[str, dict] = {}
+    airlines: dict[str, dict] = {}
+    projected = []
+
+    for flight in flights:
+        if not compact:
+            projected.append(flight.model_dump(mode="json", by_alias=True, include=include))
+            continue
+
+        data = flight.model_dump(mode="json", by_alias=True, include=include - references)
+
+        for attr in ("origin", "destination"):
+            airport = getattr(flight, attr)
+            if attr in include:
+                data[attr] = airport.icao
+                if airport.icao not in airports:
+                    airports[airport.icao] = airport.model_dump(mode="json", by_alias=True)
+
+        if "airline" in include:
+            airline = flight.airline
+            data["airline"] = airline.icao if airline else None
+            if airline and airline.icao not in airlines:
+                airlines[airline.icao] = airline.model_dump(mode="json", by_alias=True)
+
+        projected.append(data)
+
+    if compact:
+        return {"flights": projected, "airports": airports, "airlines": airlines}
+    return {"flights": projected}
+
+
+async def check_flight_authorization(id: int, user: User, db: Session) -> Flight:
     flight = db.query(Flight).filter(Flight.id == id).first()
     if not flight:
         raise HTTPException(status_code=404, detail="Flight not found")
@@ -52,18 +189,25 @@ async def check_flight_authorization(id: int, user: User, db: Session) -> None:
     if flight.username != user.username and not user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can modify other users' flights")
 
+    return flight
+
+
+def _airport(icao: str) -> AirportModel:
+    result = reference_data.get_airport(icao)
+
+    if not result:
+        raise HTTPException(status_code=404, detail=f"No airport with ICAO '{icao}' found")
+
+    return result
 
-# https://en.wikipedia.org/wiki/Haversine_formula
-async def spherical_distance(origin: AirportModel | str, destination: AirportModel | str) -> int:
-    from server.routers.airports import get_airport_from_icao
 
+# https://en.wikipedia.org/wiki/Haversine_formula
+def spherical_distance(origin: AirportModel | str, destination: AirportModel | str) -> int:
     # make sure we have object types
     if type(origin) == str:
-        with SessionLocal() as db:
-            origin = await get_airport_from_icao(origin, db)
+        origin = _airport(origin)
     if type(destination) == str:
-        with SessionLocal() as db:
-            destination = await get_airport_from_icao(destination, db)
+        destination = _airport(destination)
 
     assert type(origin) == AirportModel and type(destination) == AirportModel
 
@@ -94,9 +238,8 @@ async def spherical_distance(origin: AirportModel | str, destination: AirportMod
 
 def to_utc(dt: datetime.datetime, airport: str | AirportModel) -> datetime.datetime:
     if type(airport) != AirportModel:
-        with SessionLocal() as db:
-            ap = db.query(Airport).filter(Airport.icao == airport).first()
-            tz_name = ap.timezone if ap else "UTC"
+        ap = reference_data.get_airport(airport)
+        tz_name = ap.timezone if ap else "UTC"
     else:
         tz_name = airport.timezone
 
@@ -117,52 +260,64 @@ def duration(departure: datetime.datetime, arrival: datetime.datetime) -> int:
 
 
 @router.post("/many", status_code=201)
-async def add_many_flights(flights: list[FlightModel], timezones: bool = True, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> int:
-    creator_flight_id = -1
+async def add_many_flights(flights: list[FlightModel], timezones: bool = True, user: User = Depends(get_current_user)) -> int:
     for flight in flights:
         if flight.username != user.username and not user.is_admin:
             raise HTTPException(status_code=403, detail="Only admins can add flights for other users")
 
-        flight_id = await add_flight(flight, timezones, user, db)
-        if flight.username == user.username:
-            creator_flight_id = flight_id
+    def insert_all(db: Session) -> int:
+        creator_flight_id = -1
+        for flight in flights:
+            flight_id = insert_flight(db, flight, timezones, user)
+            if flight.username == user.username:
+                creator_flight_id = flight_id
+        return creator_flight_id
 
-    return creator_flight_id
+    return await workers.run_write(insert_all)
 
 
 @router.post("/trip", status_code=201)
-async def add_trip(flights: list[FlightModel], timezones: bool = True, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> int:
+async def add_trip(flights: list[FlightModel], timezones: bool = True, user: User = Depends(get_current_user)) -> int:
     if len(flights) < 1:
         raise HTTPException(status_code=400, detail="Trip must have at least one flight")
 
-    flight_ids = []
-    for flight in flights:
-        flight_id = await add_flight(flight, timezones, user, db)
-        flight_ids.append(flight_id)
+    def insert_trip(db: Session) -> int:
+        flight_ids = []
+        for flight in flights:
+            flight_id = insert_flight(db, flight, timezones, user)
+            flight_ids.append(flight_id)
 
-    # Link flights via connection: flight N connects to flight N+1
-    for i in range(len(flight_ids) - 1):
-        db.query(Flight).filter(Flight.id == flight_ids[i]).update(
-            {Flight.connection: flight_ids[i + 1]}
-        )
-    db.commit()
+        # Link flights via connection: flight N connects to flight N+1
+        for i in range(len(flight_ids) - 1):
+            db.query(Flight).filter(Flight.id == flight_ids[i]).update(
+                {Flight.connection: flight_ids[i + 1]}
+            )
+        db.commit()
+        statistics_cache.invalidate(*{flight.username or user.username for flight in flights})
 
-    return flight_ids[0]
+        return flight_ids[0]
+
+    return await workers.run_write(insert_trip)
 
 
 @router.get("/check-duplicate", status_code=200)
 async def check_duplicate(date: str, origin: str, destination: str, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> dict:
     count = db.query(Flight).filter(
         Flight.date == date,
-        func.upper(Flight.origin) == func.upper(origin),
-        func.upper(Flight.destination) == func.upper(destination),
+        Flight.origin == origin.upper(),
+        Flight.destination == destination.upper(),
         Flight.username == user.username
     ).count()
     return {"duplicate": count > 0, "count": count}
 
 
 @router.post("", status_code=201)
-async def add_flight(flight: FlightModel, timezones: bool = True, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> int:
+async def add_flight(flight: FlightModel, timezones: bool = True, user: User = Depends(get_current_user)) -> int:
+    return await workers.run_write(insert_flight, flight, timezones, user)
+
+
+def insert_flight(db: Session, flight: FlightModel, timezones: bool, user: User) -> int:
+    """Insert a flight, and its audit log entry, in one commit."""
     # only admins may add flights for other users
     if flight.username != user.username and not user.is_admin:
         raise HTTPException(status_code=403, detail="Only admins can add flights for other users")
@@ -173,7 +328,7 @@ async def add_flight(flight: FlightModel, timezones: bool = True, user: User = D
 
     # if distance not given, calculate it
     if not flight.distance:
-        flight.distance = await spherical_distance(flight.origin, flight.destination)
+        flight.distance = spherical_distance(flight.origin, flight.destination)
 
     # if duration not given, calculate it
     if not flight.duration and flight.departure_time and flight.arrival_time:
@@ -189,16 +344,20 @@ async def add_flight(flight: FlightModel, timezones: bool = True, user: User = D
     # Build the ORM object
     username_val = flight.username if flight.username else user.username
 
-    # Extract ICAO strings from AirportModel/AirlineModel objects
-    origin_val = flight.origin.icao if type(flight.origin) == AirportModel else flight.origin
-    dest_val = flight.destination.icao if type(flight.destination) == AirportModel else flight.destination
+    # Extract ICAO strings from AirportModel/AirlineModel objects,
+    # codes are always stored uppercase
+    origin_val = (flight.origin.icao if type(flight.origin) == AirportModel else flight.origin).upper()
+    dest_val = (flight.destination.icao if type(flight.destination) == AirportModel else flight.destination).upper()
     airline_val = None
     if flight.airline:
-        airline_val = flight.airline.icao if type(flight.airline) == AirlineModel else flight.airline
+        airline_val = (flight.airline.icao if type(flight.airline) == AirlineModel else flight.airline).upper()
+
+    flight_date = flight.date if isinstance(flight.date, datetime.date) else datetime.date.fromisoformat(flight.date)
 
     new_flight = Flight(
         username=username_val,
-        date=flight.date.isoformat() if isinstance(flight.date, datetime.date) else flight.date,
+        date=flight_date.isoformat(),
+        date_day=flight_date.toordinal(),
         origin=origin_val,
         destination=dest_val,
         departure_time=flight.departure_time,
@@ -237,6 +396,7 @@ async def add_flight(flight: FlightModel, timezones: bool = True, user: User = D
     )
     db.add(audit)
     db.commit()
+    statistics_cache.invalidate(username_val)
 
     return new_id
 
@@ -271,7 +431,7 @@ async def update_flight(id: int,
                         timezones: bool = True,
                         user: User = Depends(get_current_user),
                         db: Session = Depends(get_db)) -> int:
-    await check_flight_authorization(id, user, db)
+    owner = (await check_flight_authorization(id, user, db)).username
 
     if new_flight.empty():
         return id
@@ -284,7 +444,7 @@ async def update_flight(id: int,
         new_origin = new_flight.origin if new_flight.origin else original_flight.origin
         new_destination = new_flight.destination if new_flight.destination else original_flight.destination
 
-        new_flight.distance = await spherical_distance(new_origin, new_destination)
+        new_flight.distance = spherical_distance(new_origin, new_destination)
 
     # if arrival / departure date or arrival date changed, update duration (unless specified)
     if not new_flight.duration:
@@ -321,58 +481,79 @@ async def update_flight(id: int,
                 value = value.isoformat()
             elif hasattr(value, 'value'):  # Enum
                 value = value.value
+
+            if attr in ("origin", "destination", "airline"):
+                value = value.upper()
+
             update_data[attr] = value
 
-    if update_data:
-        db.query(Flight).filter(Flight.id == id).update(update_data)
+    # keep the indexed day number in sync with the date
+    if new_flight.date:
+        update_data["date_day"] = new_flight.date.toordinal()
 
     # Audit log
     changed = [attr for attr in FlightPatchModel.get_attributes() if getattr(new_flight, attr) is not None]
-    audit = AuditLog(
-        username=user.username,
-        action="edit",
-        flight_id=id,
-        details=f"Updated: {', '.join(changed)}"
-    )
-    db.add(audit)
-    db.commit()
+
+    def store(db: Session) -> None:
+        if update_data:
+            db.query(Flight).filter(Flight.id == id).update(update_data)
+
+        audit = AuditLog(
+            username=user.username,
+            action="edit",
+            flight_id=id,
+            details=f"Updated: {', '.join(changed)}"
+        )
+        db.add(audit)
+        db.commit()
+
+    await workers.run_write(store)
+    statistics_cache.invalidate(owner)
 
     return id
 
 
 @router.delete("", status_code=200)
 async def delete_flight(id: int, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> int:
-    await check_flight_authorization(id, user, db)
+    owner = (await check_flight_authorization(id, user, db)).username
 
-    db.query(Flight).filter(Flight.id == id).delete()
+    def remove(db: Session) -> None:
+        db.query(Flight).filter(Flight.id == id).delete()
 
-    audit = AuditLog(
-        username=user.username,
-        action="delete",
-        flight_id=id,
-        details=None
-    )
-    db.add(audit)
-    db.commit()
+        audit = AuditLog(
+            username=user.username,
+            action="delete",
+            flight_id=id,
+            details=None
+        )
+        db.add(audit)
+        db.commit()
+
+    await workers.run_write(remove)
+    statistics_cache.invalidate(owner)
 
     return id
 
 
 @router.post("/bulk-delete", status_code=200)
 async def bulk_delete_flights(ids: list[int], user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> int:
-    for flight_id in ids:
-        await check_flight_authorization(flight_id, user, db)
-    for flight_id in ids:
-        db.query(Flight).filter(Flight.id == flight_id).delete()
+    owners = {(await check_flight_authorization(flight_id, user, db)).username for flight_id in ids}
 
-    audit = AuditLog(
-        username=user.username,
-        action="bulk-delete",
-        flight_id=None,
-        details=f"Deleted {len(ids)} flights: {ids}"
-    )
-    db.add(audit)
-    db.commit()
+    def remove_all(db: Session) -> None:
+        for flight_id in ids:
+            db.query(Flight).filter(Flight.id == flight_id).delete()
+
+        audit = AuditLog(
+            username=user.username,
+            action="bulk-delete",
+            flight_id=None,
+            details=f"Deleted {len(ids)} flights: {ids}"
+        )
+        db.add(audit)
+        db.commit()
+
+    await workers.run_write(remove_all)
+    statistics_cache.invalidate(*owners)
 
     return len(ids)
 
@@ -388,8 +569,7 @@ class BulkEditPayload(CustomModel):
 
 @router.post("/bulk-edit", status_code=200)
 async def bulk_edit_flights(payload: BulkEditPayload, user: User = Depends(get_current_user), db: Session = Depends(get_db)) -> int:
-    for flight_id in payload.ids:
-        await check_flight_authorization(flight_id, user, db)
+    owners = {(await check_flight_authorization(flight_id, user, db)).username for flight_id in payload.ids}
 
     update_data = {}
     set_parts_desc = []
@@ -397,21 +577,27 @@ async def bulk_edit_flights(payload: BulkEditPayload, user: User = Depends(get_c
         val = getattr(payload, field)
         if val is not None:
             update_data[field] = val.value if hasattr(val, 'value') else val
+            if field == "airline":
+                update_data[field] = update_data[field].upper()
             set_parts_desc.append(f"{field} = ?")
 
     if not update_data:
         return 0
 
-    db.query(Flight).filter(Flight.id.in_(payload.ids)).update(update_data, synchronize_session='fetch')
+    def store(db: Session) -> None:
+        db.query(Flight).filter(Flight.id.in_(payload.ids)).update(update_data, synchronize_session='fetch')
 
-    audit = AuditLog(
-        username=user.username,
-        action="bulk-edit",
-        flight_id=None,
-        details=f"Edited {len(payload.ids)} flights: {', '.join(set_parts_desc)}"
-    )
-    db.add(audit)
-    db.commit()
+        audit = AuditLog(
+            username=user.username,
+            action="bulk-edit",
+            flight_id=None,
+            details=f"Edited {len(payload.ids)} flights: {', '.join(set_parts_desc)}"
+        )
+        db.add(audit)
+        db.commit()
+
+    await workers.run_write(store)
+    statistics_cache.invalidate(*owners)
 
     return len(payload.ids)
 
@@ -532,73 +718,109 @@ async def get_flights(id: int | None = None,
                       origin: str | None = None,
                       destination: str | None = None,
                       username: str | None = None,
+                      cursor: str | None = None,
+                      fields: str | None = None,
+                      compact: bool = False,
                       user: User = Depends(get_current_user),
-                      db: Session = Depends(get_db)) -> list[FlightModel] | FlightModel:
+                      db: AsyncSession = Depends(get_async_db)) -> list[FlightModel] | FlightModel | FlightPage:
+    """Flights matching the filters. Passing `cursor` (empty for the first
+    page) switches to keyset pagination: instead of a list, a page with the
+    flights and the `nextCursor` to pass for the following one is returned,
+    and `offset` is ignored.
 
-    username_filter = None if id else username if username else user.username
+    For lists, `fields` (comma separated) limits each flight to those fields
+    plus its id, and `compact` returns {flights, airports, airlines} where the
+    flights reference airports and airlines by code (see project_flights)."""
 
-    # Use raw SQL for this complex join query to preserve exact behavior
-    if sort == Sort.DATE:
-        sort_clause = f"ORDER BY f.date {order.value}, f.departure_time {order.value}"
-    else:
-        sort_clause = f"ORDER BY f.{sort.value} {order.value}"
+    username_filter = None if id else username if username else user.username
+    paginate = cursor is not None and id is None
+    project = (fields is not None or compact) and id is None
+    selected_fields = parse_fields(fields) if project and fields is not None else None
+
+    # only add the filters that are actually used so that
+    # SQLite can pick the matching (username, ...) index
+    clauses = []
+    params: dict = {"limit": limit, "offset": offset}
+
+    if id is not None:
+        clauses.append("f.id = :id")
+        params["id"] = id
+    if username_filter:
+        clauses.append("f.username = :username")
+        params["username"] = username_filter
+    if start:
+        clauses.append("f.date_day >= :start")
+        params["start"] = start.toordinal()
+    if end:
+        clauses.append("f.date_day <= :end")
+        params["end"] = end.toordinal()
+    if origin:
+        clauses.append("f.origin = UPPER(:origin)")
+        params["origin"] = origin
+    if destination:
+        clauses.append("f.destination = UPPER(:destination)")
+        params["destination"] = destination
+
+    sort_keys = SORT_KEYS[sort]
+
+    if paginate:
+        params["offset"] = 0
+        if limit >= 0:
+            params["limit"] = limit + 1  # one extra row tells whether there is a next page
+        if cursor:
+            clauses.append(keyset_clause(sort_keys, decode_cursor(cursor, sort, order), order, params))
+
+    filters = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    sort_clause = "ORDER BY " + ", ".join(f"{key} {order.value}" for key in sort_keys)
+
+    # select columns explicitly (in model order) rather than f.*, so that the
+    # physical column order of older, migrated databases doesn't matter
+    flight_attributes = FlightModel.get_attributes(ignore=["origin", "destination", "airline"])
+    airport_attributes = AirportModel.get_attributes()
+    airline_attributes = AirlineModel.get_attributes()
+
+    columns = [f"f.{attr}" for attr in flight_attributes]
+    columns += [f"o.{attr}" for attr in airport_attributes]
+    columns += [f"d.{attr}" for attr in airport_attributes]
+    columns += [f"a.{attr}" for attr in airline_attributes]
+    columns += sort_keys
 
     query = f"""
-        SELECT
-            f.*,
-            o.*,
-            d.*,
-            a.*
+        SELECT {", ".join(columns)}
         FROM flights f
-        JOIN airports o ON UPPER(f.origin) = o.icao
-        JOIN airports d ON UPPER(f.destination) = d.icao
-        LEFT JOIN airlines a ON UPPER(f.airline) = a.icao
-        WHERE (:id IS NULL OR f.id = :id)
-        AND   (:username IS NULL OR f.username = :username)
-        AND   (:start IS NULL OR JULIANDAY(date) >= JULIANDAY(:start))
-        AND   (:end IS NULL OR JULIANDAY(date) <= JULIANDAY(:end))
-        AND   (:origin IS NULL OR f.origin = UPPER(:origin))
-        AND   (:destination IS NULL OR f.destination = UPPER(:destination))
+        JOIN airports o ON f.origin = o.icao
+        JOIN airports d ON f.destination = d.icao
+        LEFT JOIN airlines a ON f.airline = a.icao
+        {filters}
         {sort_clause}
         LIMIT :limit
         OFFSET :offset;"""
 
-    params = {
-        "id": id,
-        "username": username_filter,
-        "start": str(start) if start else None,
-        "end": str(end) if end else None,
-        "origin": origin,
-        "destination": destination,
-        "limit": limit,
-        "offset": offset,
-    }
+    res = await fetch_all(db, text(query), params)
 
-    res = db.execute(text(query), params).fetchall()
-
-    # get rid of origin, destination, and airline ICAOs for proper conversion
-    # after this, each flight_db is in the format:
-    # [id, username, date, departure_time, ..., AirportModel, AirportModel, AirlineModel]
-    res = [db_flight[:3] + db_flight[5:16] + db_flight[17:] for db_flight in res]
+    next_cursor = None
+    if paginate and limit >= 0 and len(res) > limit:
+        res = res[:limit]
+        next_cursor = encode_cursor(sort, order, list(res[-1][-len(sort_keys):]))
 
     flights = []
 
-    for db_flight in res:
-        begin = len(FlightModel.get_attributes()) - 3
-        airport_length = len(AirportModel.get_attributes())
-        airline_length = len(AirlineModel.get_attributes())
+    begin = len(flight_attributes)
+    airport_length = len(airport_attributes)
+    airline_length = len(airline_attributes)
 
+    for db_flight in res:
         db_origin = db_flight[begin:begin + airport_length]
         db_destination = db_flight[begin + airport_length:begin + 2 * airport_length]
         db_airline = db_flight[begin + 2 * airport_length:begin + 2 * airport_length + airline_length]
 
-        origin_obj = AirportModel.from_database(db_origin)
-        destination_obj = AirportModel.from_database(db_destination)
-        airline_obj = AirlineModel.from_database(db_airline) if db_airline[0] != None else None
+        origin_obj = AirportModel.from_database(db_origin, trusted=True)
+        destination_obj = AirportModel.from_database(db_destination, trusted=True)
+        airline_obj = AirlineModel.from_database(db_airline, trusted=True) if db_airline[0] != None else None
 
         flight = FlightModel.from_database(db_flight, {"origin": origin_obj,
                                                         "destination": destination_obj,
-                                                        "airline": airline_obj})
+                                                        "airline": airline_obj}, trusted=True)
 
         if not metric and flight.distance:
             flight.distance = round(flight.distance * 0.6213711922)
@@ -609,8 +831,18 @@ async def get_flights(id: int | None = None,
         raise HTTPException(status_code=404, detail=f"Flight not found.")
 
     if id:
-        return FlightModel.model_validate(flights[0])
-    return [FlightModel.model_validate(flight) for flight in flights]
+        return flights[0]
+    if project:
+        # already serialized, so skip the response model
+        payload = project_flights(flights, selected_fields, compact)
+        if paginate:
+            payload["nextCursor"] = next_cursor
+        elif not compact:
+            return JSONResponse(payload["flights"])
+        return JSONResponse(payload)
+    if paginate:
+        return FlightPage(flights=flights, next_cursor=next_cursor)
+    return flights
 
 
 @router.post("/connections", status_code=200)
@@ -620,20 +852,17 @@ async def compute_connections(user: User = Depends(get_current_user)):
     def generate():
         yield _sse_event({"type": "start", "total": 1})
 
-        db_path = os.path.join(DATA_PATH, "jetlog.db")
-        conn = sqlite3.connect(db_path)
-
         try:
-            cur = conn.execute("""
+            rows = workers.writer.execute("""
                 WITH plausible AS (
                     SELECT f.id  AS flight_id, c.id AS conn_id
                     FROM flights AS f
                     JOIN flights AS c ON
                         c.origin = f.destination
                         AND c.destination != f.origin
-                        AND JULIANDAY(c.date) BETWEEN JULIANDAY(f.date) - 1 AND JULIANDAY(f.date) + 2
-                        AND c.username = ?
-                    WHERE f.username = ? AND f.connection IS NULL
+                        AND c.date_day BETWEEN f.date_day - 1 AND f.date_day + 2
+                        AND c.username = :username
+                    WHERE f.username = :username AND f.connection IS NULL
                 ),
                 one_conn AS (
                     SELECT flight_id, MAX(conn_id) AS conn_id
@@ -656,12 +885,10 @@ async def compute_connections(user: User = Depends(get_current_user)):
                 RETURNING
                     ( SELECT COUNT(*) FROM multi_conn ) AS amount_skipped,
                     ( SELECT COUNT(*) FROM one_conn ) AS amount_updated;""",
-                [username, username])
-            res = cur.fetchone()
-            conn.commit()
+                {"username": username})
+            statistics_cache.invalidate(username)
 
-            if not res:
-                res = (0, 0)
+            res = rows[0] if rows else (0, 0)
 
             updated, skipped = res[1], res[0]
             yield _sse_event({"type": "progress", "current": 1, "total": 1,
@@ -672,8 +899,6 @@ async def compute_connections(user: User = Depends(get_current_user)):
             yield _sse_event({"type": "progress", "current": 1, "total": 1,
                               "item": str(e), "status": "failed"})
             yield _sse_event({"type": "done", "updated": 0, "skipped": 0, "total": 1})
-        finally:
-            conn.close()
 
     return StreamingResponse(generate(), media_type="text/event-stream")
 
@@ -695,13 +920,9 @@ async def fetch_airlines_from_callsigns(user: User = Depends(get_current_user),
     username = user.username
 
     def generate():
-        db_path = os.path.join(DATA_PATH, "jetlog.db")
-        conn = sqlite3.connect(db_path)
-
         total = len(callsigns)
         if total == 0:
             yield _sse_event({"type": "done", "updated": 0, "skipped": 0, "total": 0})
-            conn.close()
             return
 
         yield _sse_event({"type": "start", "total": total})
@@ -721,13 +942,13 @@ async def fetch_airlines_from_callsigns(user: User = Depends(get_current_user),
                     continue
 
                 data = adsbdb_res.json()
-                airline_icao = data["response"]["flightroute"]["airline"]["icao"]
+                airline_icao = data["response"]["flightroute"]["airline"]["icao"].upper()
 
-                conn.execute("""UPDATE flights
-                               SET airline = ?
-                               WHERE flight_number = ? AND airline IS NULL AND username = ?;""",
-                             [airline_icao, callsign, username])
-                conn.commit()
+                workers.writer.execute("""UPDATE flights
+                                          SET airline = :airline
+                                          WHERE flight_number = :callsign AND airline IS NULL AND username = :username;""",
+                                       {"airline": airline_icao, "callsign": callsign, "username": username})
+                statistics_cache.invalidate(username)
                 updates += amount
                 yield _sse_event({"type": "progress", "current": i + 1, "total": total,
                                   "item": f"{callsign} -> {airline_icao} ({amount} flights)", "status": "ok"})
@@ -737,54 +958,53 @@ async def fetch_airlines_from_callsigns(user: User = Depends(get_current_user),
                                   "item": f"{callsign} ({amount} flights)", "status": "failed",
                                   "error": str(e)})
 
-        conn.close()
         yield _sse_event({"type": "done", "updated": updates, "skipped": skips, "total": total})
 
     return StreamingResponse(generate(), media_type="text/event-stream")
 
 
 def _apply_enrichment(flight: dict, aircraft_text, registration, real_dep, real_arr,
-                      origin_tz_offset, dest_tz_offset, group_detail: list) -> tuple[list, list]:
+                      origin_tz_offset, dest_tz_offset, group_detail: list) -> tuple[list, dict]:
     """Build SET clause and values for NULL fields that have data to backfill."""
     set_parts = []
-    values = []
+    values = {}
 
     if flight["airplane"] is None and aircraft_text:
-        set_parts.append("airplane = ?")
-        values.append(aircraft_text)
+        set_parts.append("airplane = :airplane")
+        values["airplane"] = aircraft_text
         if aircraft_text not in group_detail:
             group_detail.append(aircraft_text)
 
     if flight["tail_number"] is None and registration:
-        set_parts.append("tail_number = ?")
-        values.append(registration)
+        set_parts.append("tail_number = :tail_number")
+        values["tail_number"] = registration
         if registration not in group_detail:
             group_detail.append(registration)
 
     if flight["departure_time"] is None and real_dep:
         if isinstance(real_dep, (int, float)):
             local_dep = datetime.datetime.utcfromtimestamp(real_dep + origin_tz_offset)
-            set_parts.append("departure_time = ?")
-            values.append(local_dep.strftime("%H:%M"))
+            set_parts.append("departure_time = :departure_time")
+            values["departure_time"] = local_dep.strftime("%H:%M")
         elif isinstance(real_dep, str) and ":" in real_dep:
-            set_parts.append("departure_time = ?")
-            values.append(real_dep[:5])  # HH:MM
+            set_parts.append("departure_time = :departure_time")
+            values["departure_time"] = real_dep[:5]  # HH:MM
 
     if flight["arrival_time"] is None and real_arr:
         if isinstance(real_arr, (int, float)):
             local_arr = datetime.datetime.utcfromtimestamp(real_arr + dest_tz_offset)
-            set_parts.append("arrival_time = ?")
-            values.append(local_arr.strftime("%H:%M"))
+            set_parts.append("arrival_time = :arrival_time")
+            values["arrival_time"] = local_arr.strftime("%H:%M")
         elif isinstance(real_arr, str) and ":" in real_arr:
-            set_parts.append("arrival_time = ?")
-            values.append(real_arr[:5])
+            set_parts.append("arrival_time = :arrival_time")
+            values["arrival_time"] = real_arr[:5]
 
     if flight["duration"] is None and real_dep and real_arr:
         if isinstance(real_dep, (int, float)) and isinstance(real_arr, (int, float)):
             dur_minutes = (real_arr - real_dep) // 60
             if dur_minutes > 0:
-                set_parts.append("duration = ?")
-                values.append(dur_minutes)
+                set_parts.append("duration = :duration")
+                values["duration"] = dur_minutes
 
     return set_parts, values
 
@@ -825,13 +1045,9 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
     has_flightera = bool(FLIGHTERA_API_KEY)
 
     def generate():
-        db_path = os.path.join(DATA_PATH, "jetlog.db")
-        conn = sqlite3.connect(db_path)
-
         total = len(group_list)
         if total == 0:
             yield _sse_event({"type": "done", "updated": 0, "skipped": 0, "total": 0})
-            conn.close()
             return
 
         yield _sse_event({"type": "start", "total": total})
@@ -839,6 +1055,16 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
         updates = 0
         skips = 0
 
+        def submit_update(writes: list, flight_id: int, set_parts: list, values: dict) -> None:
+            nonlocal skips
+            values["id"] = flight_id
+            try:
+                writes.append(workers.writer.submit(
+                    f"UPDATE flights SET {', '.join(set_parts)} WHERE id = :id;", values))
+            except HTTPException:
+                # the writer's queue is full, the flight is left for another run
+                skips += 1
+
         for i, (flight_number, flight_list) in enumerate(group_list):
             # Step 1: Try FR24 (free, recent ~2 weeks)
             fr24_date_map: dict[str, dict] = {}
@@ -856,6 +1082,8 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
             group_updated = 0
             group_detail = []
             flightera_pending = []  # flights not found in FR24
+            # the group's updates, committed by the writer together
+            writes = []
 
             for flight in flight_list:
                 match = fr24_date_map.get(flight["date"])
@@ -873,11 +1101,7 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
                         origin_tz, dest_tz, group_detail)
 
                     if set_parts:
-                        values.append(flight["id"])
-                        conn.execute(f"UPDATE flights SET {', '.join(set_parts)} WHERE id = ?;", values)
-                        conn.commit()
-                        updates += 1
-                        group_updated += 1
+                        submit_update(writes, flight["id"], set_parts, values)
                     else:
                         skips += 1
                 else:
@@ -902,11 +1126,7 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
                         group_detail)
 
                     if set_parts:
-                        values.append(flight["id"])
-                        conn.execute(f"UPDATE flights SET {', '.join(set_parts)} WHERE id = ?;", values)
-                        conn.commit()
-                        updates += 1
-                        group_updated += 1
+                        submit_update(writes, flight["id"], set_parts, values)
                     else:
                         skips += 1
 
@@ -914,6 +1134,16 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
             elif flightera_pending:
                 skips += len(flightera_pending)
 
+            for write in writes:
+                try:
+                    write.result()
+                    updates += 1
+                    group_updated += 1
+                except Exception:
+                    skips += 1
+            if group_updated:
+                statistics_cache.invalidate(username)
+
             detail = ", ".join(group_detail[:2]) if group_detail else "no match"
             source = "FR24" if not flightera_pending else ("Flightera" if has_flightera else "FR24 only")
             status = "ok" if group_updated > 0 else "failed"
@@ -923,7 +1153,6 @@ async def enrich_flight_details(user: User = Depends(get_current_user), db: Sess
 
             time.sleep(2)  # respect FR24 rate limits
 
-        conn.close()
         yield _sse_event({"type": "done", "updated": updates, "skipped": skips, "total": total})
 
     return StreamingResponse(generate(), media_type="text/event-stream")
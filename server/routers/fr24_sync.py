@@ -1,6 +1,7 @@
 import json
 
-from server.db.session import get_db, SessionLocal
+from server.db import workers
+from server.db.session import get_db
 from server.db.models import Flight, FR24SyncedFlight
 from server.environment import ENABLE_EXTERNAL_APIS, FR24_EMAIL, FR24_PASSWORD
 from server.models import User
@@ -61,12 +62,10 @@ async def sync_to_fr24(user: User = Depends(get_current_user),
         return f"data: {json.dumps(data)}\n\n"
 
     def generate():
-        # StreamingResponse runs in a worker thread, so we need our own session.
-        session = SessionLocal()
-
+        # StreamingResponse runs in a worker thread, so writes go through the
+        # database writer, which commits them in batches with everyone else's
         if not unsynced:
             yield event({"type": "done", "synced": 0, "failed": 0, "total": 0})
-            session.close()
             return
 
         total = len(unsynced)
@@ -77,7 +76,6 @@ async def sync_to_fr24(user: User = Depends(get_current_user),
             client.login()
         except Exception as e:
             yield event({"type": "error", "message": f"FR24 login failed: {e}"})
-            session.close()
             return
 
         yield event({"type": "login", "message": "Logged in to FlightRadar24"})
@@ -92,19 +90,16 @@ async def sync_to_fr24(user: User = Depends(get_current_user),
                 airline_override = raw_airlines[flight.id]
             try:
                 client.add_flight(flight, airline_override=airline_override)
-                sync_record = FR24SyncedFlight(flight_id=flight.id)
-                session.add(sync_record)
-                session.commit()
+                workers.writer.execute("INSERT INTO fr24_synced_flights (flight_id) VALUES (:flight_id);",
+                                       {"flight_id": flight.id})
                 synced += 1
                 yield event({"type": "progress", "current": i + 1, "total": total,
                              "flight": label, "status": "ok"})
             except Exception as e:
-                session.rollback()
                 failed += 1
                 yield event({"type": "progress", "current": i + 1, "total": total,
                              "flight": label, "status": "failed", "error": str(e)})
 
-        session.close()
         yield event({"type": "done", "synced": synced, "failed": failed, "total": total})
 
     return StreamingResponse(generate(), media_type="text/event-stream")
@@ -1,14 +1,17 @@
-from server.db.session import get_db
+from server.db.session import fetch_all, get_async_db, run_sync
 from server.db.models import Flight, Airport
 from server.models import User
 from server.auth.users import get_current_user
 
 from server.models import CustomModel
-from fastapi import APIRouter, Depends
+from server.internal import map_clusters, world_geometry
+from server.internal.stats_cache import statistics_cache
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from sqlalchemy import text
-from pathlib import Path
-import json
+import math
 
 router = APIRouter(
     prefix="/geography",
@@ -24,9 +27,6 @@ class Coord(CustomModel):
     iata: str|None = None
     name: str|None = None
 
-    def __eq__(self, other) -> bool:
-        return self.latitude == other.latitude and self.longitude == other.longitude
-
 class Trajectory(CustomModel):
     first: Coord
     second: Coord
@@ -34,145 +34,176 @@ class Trajectory(CustomModel):
     origin_icao: str|None = None
     dest_icao: str|None = None
 
-    def __eq__(self, other) -> bool:
-        if self.first == other.first and self.second == other.second:
-            return True
-
-        return self.first == other.second and self.second == other.first
+# the geometry only changes with a release, and is revalidated by its ETag
+WORLD_CACHE_CONTROL = "private, max-age=604800"
 
 @router.get("/world", status_code=200)
-async def get_world_geojson(visited: bool = False, user: User = Depends(get_current_user),
-                            db: Session = Depends(get_db)) -> object:
-    geojson_path = Path(__file__).parent.parent.parent / 'data' / 'world.geo.json'
-    geojson_content = geojson_path.read_text()
-    geojson = json.loads(geojson_content)
-
-    if visited:
-        res = db.execute(text("""
-            WITH visited_airports AS (
-                SELECT destination AS icao
-                FROM flights
-                WHERE connection IS NULL
-                AND username = :username
-
-                UNION
-
-                SELECT origin AS icao
-                FROM flights AS f
-                WHERE NOT EXISTS (
-                    SELECT 1
-                    FROM flights AS prev
-                    WHERE prev.connection = f.id
-                )
-                AND username = :username
+async def get_world_geojson(request: Request,
+                            resolution: str|None = None,
+                            zoom: float|None = None,
+                            user: User = Depends(get_current_user)) -> Response:
+    # simplified geometries for lower zoom levels, full by default
+    if resolution is None:
+        resolution = world_geometry.resolution_for_zoom(zoom) if zoom is not None else world_geometry.FULL_RESOLUTION
+    elif resolution != world_geometry.FULL_RESOLUTION and resolution not in world_geometry.RESOLUTIONS:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown resolution '{resolution}', expected one of: "
+                                   f"{', '.join([*world_geometry.RESOLUTIONS, world_geometry.FULL_RESOLUTION])}")
+
+    world = world_geometry.get_world(resolution)
+    encoding = world.negotiate(request.headers.get("accept-encoding"))
+    headers = {"ETag": world.etags[encoding], "Cache-Control": WORLD_CACHE_CONTROL, "Vary": "Accept-Encoding"}
+
+    if world.matches(request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    return Response(content=world.encodings[encoding], media_type="application/json", headers=headers)
+
+@router.get("/world/visited", status_code=200)
+async def get_visited_countries(user: User = Depends(get_current_user),
+                                db: AsyncSession = Depends(get_async_db)) -> dict[str, list[str]]:
+    """Countries of the airports the user visited, named as the 'subunit'
+    property of the world GeoJSON features they match."""
+    res = await fetch_all(db, text("""
+        WITH visited_airports AS (
+            SELECT destination AS icao
+            FROM flights
+            WHERE connection IS NULL
+            AND username = :username
+
+            UNION
+
+            SELECT origin AS icao
+            FROM flights AS f
+            WHERE NOT EXISTS (
+                SELECT 1
+                FROM flights AS prev
+                WHERE prev.connection = f.id
             )
+            AND username = :username
+        )
 
-            SELECT DISTINCT a.country
-            FROM visited_airports AS va
-            JOIN airports AS a ON a.icao = va.icao;
-        """), {"username": user.username}).fetchall()
-
-        visited_countries = [r[0] for r in res]
+        SELECT DISTINCT a.country
+        FROM visited_airports AS va
+        JOIN airports AS a ON a.icao = va.icao
+        ORDER BY a.country;
+    """), {"username": user.username})
 
-        for feature in geojson.get("features", []):
-            country_name = feature.get("properties", {}).get("subunit")
-            feature["properties"]["visited"] = country_name in visited_countries
-
-    return geojson
+    return {"countries": [r[0] for r in res]}
 
 @router.get("/decorations", status_code=200)
 async def get_flights_decorations(flight_id: int|None = None, username: str|None = None,
                                   user: User = Depends(get_current_user),
-                                  db: Session = Depends(get_db)) -> tuple[list[Trajectory], list[Coord]]:
+                                  db: AsyncSession = Depends(get_async_db)) -> tuple[list[Trajectory], list[Coord]]:
     return await get_decorations(flight_id=flight_id, username=username, user=user, db=db)
 
+@router.get("/decorations/clustered", status_code=200)
+async def get_clustered_decorations(zoom: float = 0,
+                                    west: float|None = None,
+                                    south: float|None = None,
+                                    east: float|None = None,
+                                    north: float|None = None,
+                                    username: str|None = None,
+                                    user: User = Depends(get_current_user),
+                                    db: AsyncSession = Depends(get_async_db)) -> JSONResponse:
+    """
+    Airports clustered on a grid for a map zoom level, with the routes
+    between clusters bundled, limited to the clusters inside the bounding
+    box (in degrees, west may exceed east across the antimeridian) and the
+    most flown bundles with an end in one of them. Returns {"lines",
+    "markers", "omittedLines", "bounds"}: lines and markers are shaped like
+    the decorations, with the number of routes of a bundle and of airports
+    of a cluster added, omittedLines counts the bundles beyond
+    map_clusters.MAX_BUNDLES and bounds are the west, south, east and north
+    of all the user's airports.
+    """
+    box = [west, south, east, north]
+    if any(side is None for side in box) and any(side is not None for side in box):
+        raise HTTPException(status_code=400, detail="A bounding box needs west, south, east and north")
+
+    filter_username = username if username else user.username
+
+    index = map_clusters.cluster_indexes.get(filter_username)
+    if index is None:
+        version = statistics_cache.version(filter_username)
+        lines, markers = await get_decorations(username=filter_username, user=user, db=db)
+        index = map_clusters.ClusterIndex(lines, markers)
+        map_clusters.cluster_indexes.store(filter_username, version, index)
+
+    level = index.level(math.floor(zoom))
+    cells = level.cells_in(west, south, east, north) if west is not None else None
+    lines, markers, omitted = level.decorations(cells)
+
+    # already serialized, so skip the response model
+    return JSONResponse({"lines": lines, "markers": markers, "omittedLines": omitted, "bounds": index.bounds})
+
 async def get_decorations(flight_id: int|None = None, username: str|None = None,
-                          user: User = None, db: Session = None) -> tuple[list[Trajectory], list[Coord]]:
+                          user: User = None, db: Session | AsyncSession = None) -> tuple[list[Trajectory], list[Coord]]:
     from server.db.session import SessionLocal
 
     filter_username = username if username else user.username
 
+    # Use provided db session or create a new one
+    if db is not None:
+        return await run_sync(db, _decorations, filter_username, flight_id)
+
+    with SessionLocal() as session:
+        return _decorations(session, filter_username, flight_id)
+
+def _decorations(db: Session, username: str, flight_id: int|None) -> tuple[list[Trajectory], list[Coord]]:
     # Build the query with optional flight_id filter
     flight_filter = ""
-    params: dict = {"username": filter_username}
+    params: dict = {"username": username}
     if flight_id is not None:
         flight_filter = " AND f.id = :flight_id"
         params["flight_id"] = flight_id
 
-    query = f"""
-        SELECT o.latitude, o.longitude,
-               d.latitude, d.longitude,
-               f.connection,
-               o.icao, o.iata, o.name,
-               d.icao, d.iata, d.name
-        FROM flights f
-        JOIN airports o ON UPPER(f.origin) = o.icao
-        JOIN airports d ON UPPER(f.destination) = d.icao
-        WHERE username = :username
-        {flight_filter};"""
-
-    # Use provided db session or create a new one
-    if db is not None:
-        res = db.execute(text(query), params).fetchall()
-    else:
-        with SessionLocal() as session:
-            res = session.execute(text(query), params).fetchall()
-
+    # flights whose airports are both known, as the map can only draw those
+    located = f"""
+        WITH located AS (
+            SELECT f.id, f.origin, f.destination, f.connection
+            FROM flights f
+            JOIN airports o ON f.origin = o.icao
+            JOIN airports d ON f.destination = d.icao
+            WHERE username = :username
+            {flight_filter}
+        )"""
+
+    # a flight with a connection ends where the next one starts, so its
+    # destination is not counted, to not count connection airports twice
+    markers_query = f"""{located}
+        SELECT a.latitude, a.longitude, MAX(SUM(v.visits), 1), a.icao, a.iata, a.name
+        FROM (
+            SELECT origin AS icao, 1 AS visits FROM located
+            UNION ALL
+            SELECT destination, connection IS NULL FROM located
+        ) AS v
+        JOIN airports a ON a.icao = v.icao
+        GROUP BY a.icao;"""
+
+    # routes are unordered airport pairs, drawn in the direction of their
+    # first flight (SQLite takes the bare columns from the MIN(id) row)
+    routes_query = f"""{located}
+        SELECT MIN(id), origin, destination, COUNT(*)
+        FROM located
+        GROUP BY MIN(origin, destination), MAX(origin, destination);"""
+
+    markers = db.execute(text(markers_query), params).fetchall()
+    routes = db.execute(text(routes_query), params).fetchall()
+
+    coordinates: dict[str, Coord] = {}
+    for row in markers:
+        coordinates[row[3]] = Coord.from_database(row, trusted=True)
+
+    # both ends of every route are among the markers
     lines: list[Trajectory] = []
-    coordinates: list[Coord] = []
-
-    for row in res:
-        # this is so that we don't count
-        # connection airports twice in
-        # marker frequencies
-        has_connection = row[4] != None
-
-        origin_data = row[:2]
-        origin_coords = Coord.from_database(origin_data, explicit={
-            'frequency': 1, 'icao': row[5], 'iata': row[6], 'name': row[7]
-        })
-        origin_coords = Coord.model_validate(origin_coords)
-
-        destination_data = row[2:4]
-        destination_coords = Coord.from_database(destination_data, explicit={
-            'frequency': 1, 'icao': row[8], 'iata': row[9], 'name': row[10]
-        })
-        destination_coords = Coord.model_validate(destination_coords)
-
-        line = Trajectory(first=origin_coords, second=destination_coords, frequency=1,
-                         origin_icao=row[5], dest_icao=row[8])
-
-        # compute marker frequencies
-        found_origin = False
-        found_destination = False
-        for coord in coordinates:
-            if coord == origin_coords:
-                found_origin = True
-                if coord.frequency != None:
-                    coord.frequency += 1
-            if coord == destination_coords:
-                found_destination = True
-                if coord.frequency != None and not has_connection:
-                    coord.frequency += 1
-
-            if found_origin and found_destination:
-                break
-
-        if not found_origin:
-            coordinates.append(origin_coords)
-        if not found_destination:
-            coordinates.append(destination_coords)
-
-        # compute trajectory frequencies
-        found = False
-        for l in lines:
-            if l == line:
-                found = True
-                if l.frequency != None:
-                    l.frequency += 1
-                break
-
-        if not found:
-            lines.append(line)
-
-    return lines, coordinates
+    for _, origin, destination, frequency in routes:
+        lines.append(Trajectory.construct_trusted({
+            "first": coordinates[origin], "second": coordinates[destination], "frequency": frequency,
+            "origin_icao": origin, "dest_icao": destination
+        }))
+
+    return lines, list(coordinates.values())
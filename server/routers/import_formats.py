@@ -1,6 +1,7 @@
+from server.db import workers
 from server.db.session import get_db
 from server.models import FlightModel, FlightPurpose, SeatType, ClassType, User
-from server.routers.flights import add_flight
+from server.routers.flights import insert_flight
 from server.internal.airport_utils import get_icao_from_iata
 from server.internal.flight_utils import flight_already_exists
 from server.auth.users import get_current_user
@@ -175,22 +176,25 @@ def _map_class_type(class_str: str) -> ClassType | None:
 
 
 async def _import_flights(imported_flights: list[FlightModel],
-                          user: User,
-                          db: Session) -> dict:
+                          user: User) -> dict:
     """Common import logic: insert parsed flights and return result summary."""
-    success_count = 0
-    fail_count = 0
-
     print(f"Importing {len(imported_flights)} flights...")
-    for i, flight in enumerate(imported_flights):
-        progress = f"[{i + 1}/{len(imported_flights)}]"
-        try:
-            res = await add_flight(flight, user=user, db=db)
-            print(f"{progress} Successfully added flight (id: {res})")
-            success_count += 1
-        except HTTPException as e:
-            print(f"{progress} Failed import: {e.detail}")
-            fail_count += 1
+
+    # one task for the writer, so the import can't be turned away halfway
+    def insert_all(db: Session) -> tuple[int, int]:
+        succeeded, failed = 0, 0
+        for i, flight in enumerate(imported_flights):
+            progress = f"[{i + 1}/{len(imported_flights)}]"
+            try:
+                res = insert_flight(db, flight, True, user)
+                print(f"{progress} Successfully added flight (id: {res})")
+                succeeded += 1
+            except HTTPException as e:
+                print(f"{progress} Failed import: {e.detail}")
+                failed += 1
+        return succeeded, failed
+
+    success_count, fail_count = await workers.run_write(insert_all)
 
     print(f"Importing process complete: {success_count} succeeded, {fail_count} failed")
     return {"imported": success_count, "failed": fail_count}
@@ -328,7 +332,7 @@ async def import_appintheair(file: UploadFile,
 
         count += 1
 
-    result = await _import_flights(imported_flights, user, db)
+    result = await _import_flights(imported_flights, user)
     result["failed"] += fail_count
     return result
 
@@ -487,7 +491,7 @@ async def import_openflights(file: UploadFile,
 
         count += 1
 
-    result = await _import_flights(imported_flights, user, db)
+    result = await _import_flights(imported_flights, user)
     result["failed"] += fail_count
     return result
 
@@ -620,6 +624,6 @@ async def import_flightdiary(file: UploadFile,
 
         count += 1
 
-    result = await _import_flights(imported_flights, user, db)
+    result = await _import_flights(imported_flights, user)
     result["failed"] += fail_count
     return result
@@ -1,6 +1,6 @@
-from server.db.session import get_db
+from server.db import workers
 from server.models import FlightModel, FlightPurpose, SeatType, ClassType, User
-from server.routers.flights import add_flight
+from server.routers.flights import insert_flight
 from server.internal.airport_utils import get_icao_from_iata
 from server.internal.flight_utils import flight_already_exists
 from server.auth.users import get_current_user
@@ -26,8 +26,7 @@ class CSVType(str, Enum):
 @router.post("", status_code=202)
 async def import_CSV(csv_type: CSVType,
                      file: UploadFile,
-                     user: User = Depends(get_current_user),
-                     db: Session = Depends(get_db)):
+                     user: User = Depends(get_current_user)):
     imported_flights: list[FlightModel] = []
     fail_count = 0
 
@@ -272,13 +271,20 @@ async def import_CSV(csv_type: CSVType,
 
 
     print(f"Importing {len(imported_flights)} flights...")
-    for i in range(len(imported_flights)):
-        progress = f"[{i+1}/{len(imported_flights)}]"
-        try:
-            res = await add_flight(imported_flights[i], user=user, db=db)
-            print(f"{progress} Successfully added flight (id: {res})")
-        except HTTPException as e:
-            print(f"{progress} Failed import: {e.detail}")
-            fail_count += 1
+
+    # one task for the writer, so the import can't be turned away halfway
+    def insert_all(db: Session) -> int:
+        failed = 0
+        for i in range(len(imported_flights)):
+            progress = f"[{i+1}/{len(imported_flights)}]"
+            try:
+                res = insert_flight(db, imported_flights[i], True, user)
+                print(f"{progress} Successfully added flight (id: {res})")
+            except HTTPException as e:
+                print(f"{progress} Failed import: {e.detail}")
+                failed += 1
+        return failed
+
+    fail_count += await workers.run_write(insert_all)
 
     print(f"Importing process complete with {fail_count} total failures")
@@ -10,7 +10,9 @@ from prometheus_client import Gauge, generate_latest, CollectorRegistry, CONTENT
 from sqlalchemy import text
 import logging
 
+from server.db import workers
 from server.db.session import SessionLocal
+from server.internal.stats_cache import statistics_cache
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +52,79 @@ jetlog_users_total = Gauge(
     'Number of registered users',
     registry=registry
 )
+jetlog_statistics_cache_hits = Gauge(
+    'jetlog_statistics_cache_hits',
+    'Statistics requests served from the cache since startup',
+    registry=registry
+)
+jetlog_statistics_cache_misses = Gauge(
+    'jetlog_statistics_cache_misses',
+    'Statistics requests that had to be computed since startup',
+    registry=registry
+)
+jetlog_statistics_cache_entries = Gauge(
+    'jetlog_statistics_cache_entries',
+    'Number of cached statistics results',
+    registry=registry
+)
+
+jetlog_db_pool_queued = Gauge(
+    'jetlog_db_pool_queued',
+    'Database tasks waiting for a thread of the pool',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_pool_running = Gauge(
+    'jetlog_db_pool_running',
+    'Database tasks running on the pool',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_pool_completed = Gauge(
+    'jetlog_db_pool_completed',
+    'Database tasks completed by the pool since startup',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_pool_rejected = Gauge(
+    'jetlog_db_pool_rejected',
+    'Database tasks rejected with 503 because the pool queue was full, since startup',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_pool_wait_seconds = Gauge(
+    'jetlog_db_pool_wait_seconds',
+    'Total time database tasks waited for a thread of the pool since startup',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_pool_execution_seconds = Gauge(
+    'jetlog_db_pool_execution_seconds',
+    'Total time database tasks ran on the pool since startup',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_pool_lock_errors = Gauge(
+    'jetlog_db_pool_lock_errors',
+    'Database tasks that failed on a write lock still held after the busy timeout, since startup',
+    ['pool'],
+    registry=registry
+)
+jetlog_db_write_batches = Gauge(
+    'jetlog_db_write_batches',
+    'Group commits of queued write statements since startup',
+    registry=registry
+)
+jetlog_db_write_batched_statements = Gauge(
+    'jetlog_db_write_batched_statements',
+    'Write statements committed in group commits since startup',
+    registry=registry
+)
+jetlog_db_write_lock_wait_seconds = Gauge(
+    'jetlog_db_write_lock_wait_seconds',
+    'Total time group commits waited for the database write lock since startup',
+    registry=registry
+)
 
 
 def _collect_metrics():
@@ -97,6 +172,23 @@ def _collect_metrics():
     except Exception as e:
         logger.error("Error collecting metrics: %s", e)
 
+    jetlog_statistics_cache_hits.set(statistics_cache.hits)
+    jetlog_statistics_cache_misses.set(statistics_cache.misses)
+    jetlog_statistics_cache_entries.set(statistics_cache.size())
+
+    for pool in workers.pools:
+        jetlog_db_pool_queued.labels(pool=pool.name).set(pool.queued)
+        jetlog_db_pool_running.labels(pool=pool.name).set(pool.running)
+        jetlog_db_pool_completed.labels(pool=pool.name).set(pool.completed)
+        jetlog_db_pool_rejected.labels(pool=pool.name).set(pool.rejected)
+        jetlog_db_pool_wait_seconds.labels(pool=pool.name).set(round(pool.wait_seconds, 3))
+        jetlog_db_pool_execution_seconds.labels(pool=pool.name).set(round(pool.execution_seconds, 3))
+        jetlog_db_pool_lock_errors.labels(pool=pool.name).set(pool.lock_errors)
+
+    jetlog_db_write_batches.set(workers.writer.batches)
+    jetlog_db_write_batched_statements.set(workers.writer.batched_statements)
+    jetlog_db_write_lock_wait_seconds.set(round(workers.writer.lock_wait_seconds, 3))
+
 
 @router.get("/metrics")
 async def prometheus_metrics():
@@ -1,11 +1,11 @@
-from server.db.session import get_db
-from server.db.models import Flight, Airport, Airline
+from server.db.session import get_async_db, run_sync
 from server.models import User
 from server.auth.users import get_current_user
+from server.internal import autocomplete, flight_search
+from server.internal.reference_data import AIRLINE_COLUMNS, AIRPORT_COLUMNS
 
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
 
 router = APIRouter(
     prefix="/search",
@@ -16,7 +16,7 @@ router = APIRouter(
 
 @router.get("", status_code=200)
 async def global_search(q: str,
-                        db: Session = Depends(get_db),
+                        db: AsyncSession = Depends(get_async_db),
                         user: User = Depends(get_current_user)):
     """
     Global search endpoint for the Cmd+K palette.
@@ -26,74 +26,44 @@ async def global_search(q: str,
         return {"flights": [], "airports": [], "airlines": []}
 
     lower_q = q.strip().lower()
-    like_q = f"%{lower_q}%"
 
-    # --- Flights: search flight_number, origin, destination ---
-    flight_results = db.query(Flight).filter(
-        Flight.username == user.username,
-        (
-            func.lower(Flight.flight_number).like(like_q) |
-            func.lower(Flight.origin).like(like_q) |
-            func.lower(Flight.destination).like(like_q)
-        )
-    ).order_by(Flight.date.desc()).limit(5).all()
+    # --- Flights: full-text search over codes, aircraft, notes, companions, custom fields ---
+    flight_results = await run_sync(db, flight_search.search, user.username, q, limit=5)
 
     flights = []
     for f in flight_results:
-        # Look up airline name from ICAO code if available
-        airline_icao = None
-        if f.airline:
-            airline_icao = f.airline
-
         flights.append({
             "id": f.id,
             "date": f.date,
             "origin": f.origin,
             "destination": f.destination,
             "flightNumber": f.flight_number,
-            "airline": airline_icao,
+            "airline": f.airline,
         })
 
     # --- Airports: search ICAO, IATA, name, city ---
-    airport_results = db.query(Airport).filter(
-        (func.lower(Airport.icao).like(like_q)) |
-        (func.lower(Airport.iata).like(like_q)) |
-        (func.lower(Airport.name).like(like_q)) |
-        (func.lower(Airport.municipality).like(like_q))
-    ).order_by(
-        (func.lower(Airport.iata) == lower_q).desc(),
-        (func.lower(Airport.icao) == lower_q).desc(),
-        (func.lower(Airport.name) == lower_q).desc(),
-        func.length(Airport.name).asc(),
-    ).limit(5).all()
+    airport_results = [dict(zip(AIRPORT_COLUMNS, row))
+                       for row in autocomplete.get_index(autocomplete.SEARCH_AIRPORTS).search(lower_q, k=5)]
 
     airports = []
     for ap in airport_results:
         airports.append({
-            "icao": ap.icao,
-            "iata": ap.iata,
-            "name": ap.name,
-            "city": ap.municipality,
+            "icao": ap["icao"],
+            "iata": ap["iata"],
+            "name": ap["name"],
+            "city": ap["municipality"],
         })
 
     # --- Airlines: search ICAO, IATA, name ---
-    airline_results = db.query(Airline).filter(
-        (func.lower(Airline.icao).like(like_q)) |
-        (func.lower(Airline.iata).like(like_q)) |
-        (func.lower(Airline.name).like(like_q))
-    ).order_by(
-        (func.lower(Airline.name) == lower_q).desc(),
-        func.length(Airline.name).asc(),
-        (func.lower(Airline.icao) == lower_q).desc(),
-        (func.lower(Airline.iata) == lower_q).desc(),
-    ).limit(5).all()
+    airline_results = [dict(zip(AIRLINE_COLUMNS, row))
+                       for row in autocomplete.get_index(autocomplete.AIRLINES).search(lower_q, k=5)]
 
     airlines = []
     for al in airline_results:
         airlines.append({
-            "icao": al.icao,
-            "iata": al.iata,
-            "name": al.name,
+            "icao": al["icao"],
+            "iata": al["iata"],
+            "name": al["name"],
         })
 
     return {
@@ -3,9 +3,9 @@
 #   from server.routers import tripit
 #   app.include_router(tripit.router, prefix="/api", dependencies=auth_dependency)
 
-from server.db.session import get_db
+from server.db import workers
 from server.models import FlightModel, User
-from server.routers.flights import add_flight
+from server.routers.flights import insert_flight
 from server.internal.airport_utils import get_icao_from_iata
 from server.internal.flight_utils import flight_already_exists
 from server.auth.users import get_current_user
@@ -121,8 +121,7 @@ def _parse_airports_from_description(description: str) -> tuple[str | None, str
 @router.post("/tripit", status_code=202)
 async def import_tripit_ics(
     file: UploadFile,
-    user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    user: User = Depends(get_current_user)
 ):
     """Import flights from a TripIt ICS calendar export.
 
@@ -277,15 +276,20 @@ async def import_tripit_ics(
             fail_count += 1
 
     # Import the parsed flights
-    import_fail_count = 0
-    for i, flight in enumerate(imported_flights):
-        progress = f"[{i + 1}/{len(imported_flights)}]"
-        try:
-            res = await add_flight(flight, user=user, db=db)
-            logger.info("%s Successfully imported TripIt flight (id: %s)", progress, res)
-        except HTTPException as e:
-            logger.warning("%s Failed to import TripIt flight: %s", progress, e.detail)
-            import_fail_count += 1
+    # (as one task for the writer, so the import can't be turned away halfway)
+    def insert_all(db: Session) -> int:
+        failed = 0
+        for i, flight in enumerate(imported_flights):
+            progress = f"[{i + 1}/{len(imported_flights)}]"
+            try:
+                res = insert_flight(db, flight, True, user)
+                logger.info("%s Successfully imported TripIt flight (id: %s)", progress, res)
+            except HTTPException as e:
+                logger.warning("%s Failed to import TripIt flight: %s", progress, e.detail)
+                failed += 1
+        return failed
+
+    import_fail_count = await workers.run_write(insert_all)
 
     total_imported = len(imported_flights) - import_fail_count
 